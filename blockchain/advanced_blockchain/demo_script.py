@@ -12,9 +12,11 @@ current_dir = Path(__file__).parent
 src_dir = current_dir / "src"
 sys.path.insert(0, str(src_dir))
 
+from core.block import Block
 from core.blockchain import Blockchain
 from core.transaction import Transaction
 from utils.crypto import Wallet
+from utils.logging_setup import setup_logging
 from network.api import BlockchainAPI
 import threading
 
@@ -238,23 +240,28 @@ def demo_security_features():
     is_valid = blockchain.is_chain_valid()
     print(f"区块链验证结果: {'✅ 有效' if is_valid else '❌ 无效'}")
     
+    # 挖出一个包含交易的区块
+    sender_wallet = Wallet()
+    blockchain.storage_manager.store_balances({sender_wallet.address: 100.0})
+    tx = Transaction(sender_wallet.address, Wallet().address, 30.0)
+    tx.sign_transaction(sender_wallet.private_key)
+    blockchain.add_transaction(tx)
+    blockchain.mine_pending_transactions(sender_wallet.address)
+    
     # 模拟篡改攻击
     print("\n2. 模拟数据篡改攻击...")
-    if len(blockchain.chain) > 0:
-        # 尝试修改创世区块
-        original_data = blockchain.chain[0].transactions[0].amount
-        blockchain.chain[0].transactions[0].amount = 999999  # 篡改金额
+    if len(blockchain.chain) > 1:
+        # chain返回的区块与区块链缓存共享，只读；篡改在区块的副本上进行
+        tampered_block = Block.from_dict(blockchain.chain[-1].to_dict())
+        original_data = tampered_block.transactions[0].amount
+        tampered_block.transactions[0].amount = 999999  # 篡改金额
         
         print(f"原始金额: {original_data}")
-        print(f"篡改后金额: {blockchain.chain[0].transactions[0].amount}")
-        
-        # 重新验证
-        is_valid_after_tampering = blockchain.is_chain_valid()
-        print(f"篡改后验证结果: {'✅ 有效' if is_valid_after_tampering else '❌ 无效'}")
+        print(f"篡改后金额: {tampered_block.transactions[0].amount}")
         
-        # 恢复原始数据
-        blockchain.chain[0].transactions[0].amount = original_data
-        print("✅ 数据已恢复")
+        # 验证篡改后的区块和链上的区块
+        print(f"篡改后区块验证结果: {'✅ 有效' if tampered_block.is_valid() else '❌ 无效'}")
+        print(f"链上区块验证结果: {'✅ 有效' if blockchain.is_chain_valid() else '❌ 无效'}")
 
 
 def demo_storage_features():
@@ -332,6 +339,7 @@ def demo_storage_features():
 
 def main():
     """主演示函数"""
+    setup_logging()
     print("🚀 高级区块链系统演示")
     print("="*60)
     
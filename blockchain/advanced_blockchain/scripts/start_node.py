@@ -2,6 +2,13 @@
 """
 区块链节点启动脚本
 """
+# gevent必须在导入其他模块之前打补丁；不替换线程，挖矿线程仍是真实线程，工作量证明不会阻塞事件循环
+try:
+    from gevent import monkey
+    monkey.patch_all(thread=False)
+except ImportError:
+    pass
+
 import sys
 import os
 import click
@@ -20,6 +27,7 @@ from core.blockchain import Blockchain
 from network.api import BlockchainAPI
 from network.node import P2PNode
 from utils.crypto import Wallet
+from utils.logging_setup import setup_logging
 from config import settings
 
 
@@ -47,6 +55,7 @@ def start_node(port, host, peers, difficulty, mining_reward, auto_mine,
                replication_factor, consistency_level):
     """启动区块链节点"""
     
+    setup_logging(settings.LOG_LEVEL, settings.LOG_FORMAT)
     print(f"🚀 启动区块链节点")
     print(f"   端口: {port}")
     print(f"   存储类型: {storage_type}")
@@ -1,12 +1,28 @@
 """
 区块相关类
 """
+import logging
 import time
-import json
-from typing import List, Dict, Any, Optional
+import hashlib
+from array import array
+from functools import cached_property
+from typing import List, Dict, Any, Optional, Tuple, Union
 from .transaction import Transaction
-from ..utils.crypto import CryptoUtils
+from ..utils.serialization import json_dumps, json_loads, pack, unpack
 from ..utils.merkle import MerkleTree
+from ..utils.crypto import CryptoUtils
+from ..utils import miner
+
+logger = logging.getLogger(__name__)
+
+
+def check_amounts(amounts: array, fees: array) -> bool:
+    """批量检查交易金额为正、手续费非负（min在C层遍历整个数组）"""
+    if amounts and min(amounts) <= 0:
+        return False
+    if fees and min(fees) < 0:
+        return False
+    return True
 
 
 class Block:
@@ -15,15 +31,21 @@ class Block:
     def __init__(self, index: int, transactions: List[Transaction], 
                  previous_hash: str, miner_address: str = ""):
         self.index = index
-        self.timestamp = time.time()
+        # 毫秒级整数时间戳（旧区块的浮点秒时间戳在from_dict中原样保留）
+        self.timestamp: Union[int, float] = time.time_ns() // 1_000_000
         self.transactions = transactions
         self.previous_hash = previous_hash
         self.miner_address = miner_address
         
-        # 构建Merkle树
-        transaction_data = [tx.to_json() for tx in transactions]
-        self.merkle_tree = MerkleTree(transaction_data)
-        self.merkle_root = self.merkle_tree.root or ""
+        # 区块头缓存: (头部字段, 前缀midstate, 后缀字节)
+        self._header_cache: Optional[Tuple[tuple, Any, bytes]] = None
+        
+        # 交易数值字段的列式视图，首次使用时构建
+        self._tx_view: Optional[Dict[str, array]] = None
+        
+        # 计算Merkle根，完整的树只在需要Merkle路径时构建
+        self._merkle_tree: Optional[MerkleTree] = None
+        self.merkle_root = self._compute_merkle_root()
         
         # 挖矿相关
         self.nonce = 0
@@ -33,63 +55,176 @@ class Block:
         # 计算初始哈希
         self.hash = self._calculate_hash()
     
+    def _compute_merkle_root(self) -> str:
+        """根据交易计算Merkle根（无交易时为空字符串）"""
+        return MerkleTree.compute_root_from_hashes(tx.leaf_hash() for tx in self.transactions) or ""
+    
+    @property
+    def timestamp_seconds(self) -> float:
+        """以秒为单位的区块时间"""
+        if isinstance(self.timestamp, int):
+            return self.timestamp / 1000
+        return self.timestamp
+    
+    @property
+    def charges_fees(self) -> bool:
+        """
+        区块是否按手续费记账：发送方扣除金额和手续费，手续费归miner_address
+        
+        手续费记账之前挖出的区块没有miner_address，只扣除金额，回滚时也只退还金额。
+        """
+        return bool(self.miner_address)
+    
+    @property
+    def tx_view(self) -> Dict[str, array]:
+        """
+        交易的列式视图（SoA）：amount、fee为double数组
+        
+        聚合运算直接遍历连续的数组，不再逐个访问交易对象的属性。
+        """
+        if self._tx_view is None:
+            self._tx_view = self._numeric_columns()
+        return self._tx_view
+    
+    def _numeric_columns(self) -> Dict[str, array]:
+        """按交易当前的值构建amount、fee列"""
+        return {
+            'amount': array('d', (tx.amount for tx in self.transactions)),
+            'fee': array('d', (tx.fee for tx in self.transactions)),
+        }
+    
+    @property
+    def merkle_tree(self) -> MerkleTree:
+        """完整的Merkle树（首次访问时构建）"""
+        if self._merkle_tree is None:
+            self._merkle_tree = MerkleTree([tx.leaf_hash() for tx in self.transactions],
+                                           prehashed=True)
+        return self._merkle_tree
+    
+    def _prefix_bytes(self) -> bytes:
+        """区块头中nonce之前的固定部分"""
+        return f"{self.index}{self.timestamp}{self.merkle_root}{self.previous_hash}".encode('utf-8')
+    
+    def _suffix_bytes(self) -> bytes:
+        """区块头中nonce之后的固定部分"""
+        return self.miner_address.encode('utf-8')
+    
+    def _header_state(self) -> Tuple[Any, bytes]:
+        """获取区块头前缀的SHA-256 midstate和后缀字节，头部字段变化后自动重建"""
+        fields = (self.index, self.timestamp, self.merkle_root,
+                  self.previous_hash, self.miner_address)
+        if self._header_cache is None or self._header_cache[0] != fields:
+            self._header_cache = (fields, hashlib.sha256(self._prefix_bytes()),
+                                  self._suffix_bytes())
+        return self._header_cache[1], self._header_cache[2]
+    
+    def _calculate_digest(self) -> bytes:
+        """计算区块哈希的原始32字节摘要"""
+        midstate, suffix = self._header_state()
+        state = midstate.copy()
+        state.update(str(self.nonce).encode() + suffix)
+        return state.digest()
+    
     def _calculate_hash(self) -> str:
         """计算区块哈希"""
-        block_string = (f"{self.index}{self.timestamp}{self.merkle_root}"
-                       f"{self.previous_hash}{self.nonce}{self.miner_address}")
-        return CryptoUtils.hash_data(block_string)
+        return self._calculate_digest().hex()
+    
+    def meets_difficulty(self, difficulty: Optional[int] = None) -> bool:
+        """区块哈希是否满足难度（原始摘要与目标上界做一次bytes比较，代替十六进制前缀判断）"""
+        if difficulty is None:
+            difficulty = self.difficulty
+        if difficulty <= 0:
+            return True
+        try:
+            return bytes.fromhex(self.hash) < miner.difficulty_target(difficulty)
+        except ValueError:
+            return False
+    
+    def _search_nonce(self, difficulty: int,
+                      progress: Optional[miner.MiningProgress] = None,
+                      workers: int = 1) -> None:
+        """
+        从当前nonce之后搜索满足难度的nonce
+        
+        单进程时复用缓存的区块头midstate；workers大于1时交给多进程挖矿（不报告进度）。
+        """
+        midstate, suffix = self._header_state()
+        if workers > 1:
+            self.nonce, self.hash = miner.mine_parallel(
+                self._prefix_bytes(), suffix, difficulty,
+                start_nonce=self.nonce + 1, workers=workers
+            )
+        else:
+            self.nonce, self.hash = miner.mine(
+                self._prefix_bytes(), suffix, difficulty,
+                start_nonce=self.nonce + 1, progress=progress, midstate=midstate
+            )
     
     def mine_block(self, difficulty: int) -> None:
         """挖矿"""
         self.difficulty = difficulty
-        target = "0" * difficulty
         
-        print(f"开始挖矿区块 #{self.index}，难度: {difficulty}")
+        logger.info("开始挖矿区块 #%s，难度: %s", self.index, difficulty)
         start_time = time.time()
         
-        while self.hash[:difficulty] != target:
-            self.nonce += 1
-            self.hash = self._calculate_hash()
+        if not self.meets_difficulty(difficulty):
+            # 区块头除nonce外保持不变，交由midstate挖矿循环搜索
+            progress = miner.MiningProgress(self.nonce + 1)
             
-            # 每100000次尝试输出一次进度
-            if self.nonce % 100000 == 0:
-                print(f"尝试次数: {self.nonce}，当前哈希: {self.hash[:20]}...")
+            if logger.isEnabledFor(logging.DEBUG):
+                # 进度由后台线程每秒输出一次
+                def report(p: miner.MiningProgress) -> None:
+                    logger.debug("尝试次数: %s，速率: %.0f H/s", p.nonce,
+                                 p.attempts / (time.time() - start_time))
+                
+                with miner.ProgressReporter(progress, report):
+                    self._search_nonce(difficulty, progress)
+            else:
+                self._search_nonce(difficulty, progress)
         
-        end_time = time.time()
-        mining_time = end_time - start_time
-        
-        print(f"区块 #{self.index} 挖矿成功！")
-        print(f"哈希值: {self.hash}")
-        print(f"Nonce: {self.nonce}")
-        print(f"挖矿用时: {mining_time:.2f} 秒")
-        print("-" * 60)
+        mining_time = time.time() - start_time
+        logger.info("区块 #%s 挖矿成功，哈希值: %s，Nonce: %s，挖矿用时: %.2f 秒",
+                    self.index, self.hash, self.nonce, mining_time)
     
     def is_valid(self) -> bool:
         """验证区块有效性"""
         # 验证哈希
-        if self.hash != self._calculate_hash():
+        digest = self._calculate_digest()
+        if self.hash != digest.hex():
+            return False
+        
+        # 验证工作量证明（直接比较原始摘要）
+        if self.difficulty > 0 and digest >= miner.difficulty_target(self.difficulty):
+            return False
+        
+        # 验证所有交易：先做廉价的字段检查，全部通过后再批量验证签名
+        # 数值字段按当前值重新取列（不使用缓存的视图，交易可能已被修改）后整列检查
+        columns = self._numeric_columns()
+        if not check_amounts(columns['amount'], columns['fee']):
             return False
         
-        # 验证工作量证明
-        if not self.hash.startswith("0" * self.difficulty):
+        if not all(tx.check_parties() for tx in self.transactions):
             return False
         
-        # 验证所有交易
-        for transaction in self.transactions:
-            if not transaction.is_valid():
-                return False
+        signatures = [(tx.signing_bytes(), tx.signature, tx.public_key)
+                      for tx in self.transactions if tx.is_signed()]
+        if not CryptoUtils.verify_batch(signatures):
+            return False
         
         # 验证Merkle根
-        transaction_data = [tx.to_json() for tx in self.transactions]
-        merkle_tree = MerkleTree(transaction_data)
-        if merkle_tree.root != self.merkle_root:
+        if self._compute_merkle_root() != self.merkle_root:
             return False
         
         return True
     
+    @cached_property
+    def total_fees(self) -> float:
+        """区块中所有交易的手续费总和（首次访问后缓存）"""
+        return sum(self.tx_view['fee'])
+    
     def get_transaction_fees(self) -> float:
         """获取区块中所有交易的手续费总和"""
-        return sum(tx.fee for tx in self.transactions)
+        return self.total_fees
     
     def get_transaction_by_id(self, transaction_id: str) -> Optional[Transaction]:
         """根据ID获取交易"""
@@ -103,7 +238,7 @@ class Block:
         for i, tx in enumerate(self.transactions):
             if tx.transaction_id == transaction_id:
                 merkle_path = self.merkle_tree.get_merkle_path(i)
-                return self.merkle_tree.verify_transaction(tx.to_json(), i, merkle_path)
+                return self.merkle_tree.verify_leaf(tx.leaf_hash(), i, merkle_path)
         return False
     
     def to_dict(self) -> Dict[str, Any]:
@@ -119,12 +254,16 @@ class Block:
             'nonce': self.nonce,
             'difficulty': self.difficulty,
             'hash': self.hash,
-            'total_fees': self.get_transaction_fees()
+            'total_fees': self.total_fees
         }
     
     def to_json(self) -> str:
         """转换为JSON"""
-        return json.dumps(self.to_dict(), indent=2)
+        return json_dumps(self.to_dict(), indent=True).decode('utf-8')
+    
+    def to_bytes(self) -> bytes:
+        """转换为存储用的二进制格式"""
+        return pack(self.to_dict())
     
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'Block':
@@ -145,13 +284,21 @@ class Block:
         block.difficulty = data['difficulty']
         block.hash = data['hash']
         
+        # 清除按构造时状态缓存的属性
+        block.__dict__.pop('total_fees', None)
+        
         return block
     
     @classmethod
     def from_json(cls, json_str: str) -> 'Block':
         """从JSON创建区块"""
-        data = json.loads(json_str)
+        data = json_loads(json_str)
         return cls.from_dict(data)
+    
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'Block':
+        """从存储的二进制数据创建区块"""
+        return cls.from_dict(unpack(data))
 
 
 class GenesisBlock(Block):
@@ -174,5 +321,21 @@ class GenesisBlock(Block):
             miner_address=miner_address
         )
         
-        # 创世区块不需要挖矿，直接设置哈希
-        self.hash = self._calculate_hash() 
\ No newline at end of file
+        # 创世区块不需要挖矿，哈希已在初始化时计算
+        self.difficulty = 0
+    
+    def _compute_merkle_root(self) -> str:
+        """只有一笔交易时Merkle根就是该交易的叶子哈希"""
+        if len(self.transactions) == 1:
+            return self.transactions[0].leaf_hash()
+        return super()._compute_merkle_root()
+    
+    def is_valid(self) -> bool:
+        """验证创世区块（不检查工作量证明）"""
+        if self.hash != self._calculate_hash():
+            return False
+        
+        if not all(tx.is_valid() for tx in self.transactions):
+            return False
+        
+        return self._compute_merkle_root() == self.merkle_root 
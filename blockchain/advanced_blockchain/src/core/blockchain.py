@@ -1,21 +1,83 @@
 """
 区块链核心类
 """
-import json
+import logging
+import os
 import time
 import threading
-from typing import List, Dict, Any, Optional, Tuple
+from collections import OrderedDict, defaultdict
+from typing import List, Dict, Any, Optional, Tuple, Iterable, Set
 from .block import Block, GenesisBlock
-from .transaction import Transaction, TransactionPool
+from .transaction import Transaction, TransactionPool, verify_transactions
 from ..utils.crypto import CryptoUtils
+from ..utils.serialization import dump_json_stream, json_loads
 from ..storage.storage_manager import StorageManager
 
+logger = logging.getLogger(__name__)
+
+# 按地址缓存的余额和交易列表的最大条目数
+ADDRESS_CACHE_SIZE = 4096
+
+
+class _CommitAborted(Exception):
+    """区块批次写入失败，用于在存储批次内触发回滚"""
+
+
+class DirtyDict(dict):
+    """记录被修改过的键的字典，用于只把变动的余额写回存储"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._dirty: Set[str] = set()
+    
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._dirty.add(key)
+    
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._dirty.add(key)
+    
+    def pop(self, key, *default):
+        self._dirty.add(key)
+        return super().pop(key, *default)
+    
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+    
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+    
+    def clear(self):
+        self._dirty.update(self.keys())
+        super().clear()
+    
+    def mark_dirty(self, keys: Iterable[str]) -> None:
+        """标记键为已修改"""
+        self._dirty.update(keys)
+    
+    def restore(self, journal: Dict[str, Optional[float]]) -> None:
+        """按日志恢复键的旧值（None表示删除该键），恢复的键仍标记为已修改"""
+        for key, value in journal.items():
+            if value is None:
+                self.pop(key, None)
+            else:
+                self[key] = value
+    
+    def take_dirty(self) -> Set[str]:
+        """取出并清空已修改的键"""
+        dirty, self._dirty = self._dirty, set()
+        return dirty
+
 
 class Blockchain:
     """区块链类"""
     
     def __init__(self, difficulty: int = 4, mining_reward: float = 50.0,
-                 storage_config: Dict[str, Any] = None):
+                 storage_config: Dict[str, Any] = None, mining_workers: Optional[int] = None):
         """
         初始化区块链
         
@@ -23,12 +85,35 @@ class Blockchain:
             difficulty: 挖矿难度
             mining_reward: 挖矿奖励
             storage_config: 存储配置
+            mining_workers: 挖矿进程数，None表示使用全部CPU
         """
         self.difficulty = difficulty
         self.mining_reward = mining_reward
+        self.mining_workers = mining_workers or os.cpu_count() or 1
         self.pending_transactions = []
-        self.balances = {}
+        # 待处理交易的ID（包括正在挖矿的交易），用于在验签前丢弃重复提交的交易
+        self._pending_ids: Set[str] = set()
+        self._balances = DirtyDict()
         self.lock = threading.RLock()
+        # 只保护pending_transactions的增删，持有时间很短，挖矿期间也可以提交交易
+        self._pool_lock = threading.Lock()
+        
+        # 已从存储读取的区块缓存，新区块按高度增量读取
+        self._chain_cache: List[Block] = []
+        self._chain_cache_height = -1
+        
+        # 交易二级索引：地址 -> [(交易, 区块索引)]，交易ID -> (交易, 区块索引)；覆盖缓存中前_indexed_count个区块
+        # 直接引用缓存区块中的交易对象，查询时不需要再读取区块和在区块内查找
+        self._address_index: Dict[str, List[Tuple[Transaction, int]]] = defaultdict(list)
+        self._tx_id_index: Dict[str, Tuple[Transaction, int]] = {}
+        self._indexed_count = 0
+        
+        # 已验证过的链前缀：高度及该高度的区块哈希
+        self._last_validated_height = -1
+        self._last_validated_tip_hash = ""
+        
+        # 地址查询结果的LRU缓存：(类型, 地址) -> (链尖, 结果)，链尖变化后条目自动失效
+        self._address_cache: "OrderedDict[Tuple[str, str], Tuple[Any, Any]]" = OrderedDict()
         
         # 初始化存储管理器
         if storage_config is None:
@@ -43,7 +128,7 @@ class Blockchain:
         # 从存储加载区块链状态
         self._load_from_storage()
         
-        print(f"✅ 区块链已初始化 (难度: {difficulty}, 奖励: {mining_reward})")
+        logger.debug("区块链已初始化 (难度: %s, 奖励: %s)", difficulty, mining_reward)
         
     def _load_from_storage(self):
         """从存储加载区块链状态"""
@@ -53,21 +138,35 @@ class Blockchain:
             self.difficulty = metadata.get('difficulty', self.difficulty)
             self.mining_reward = metadata.get('mining_reward', self.mining_reward)
             
-            # 加载余额状态
-            self.balances = self.storage_manager.get_all_balances()
+            # 加载余额状态（与存储一致，不需要写回）
+            self._balances = DirtyDict(self.storage_manager.get_all_balances())
             
             # 检查创世区块
             if self.storage_manager.get_latest_block_height() == -1:
                 self._create_genesis_block()
             
-            print(f"✅ 从存储加载区块链状态完成")
+            logger.debug("从存储加载区块链状态完成")
             
         except Exception as e:
-            print(f"加载区块链状态失败: {e}")
+            logger.error("加载区块链状态失败: %s", e)
             self._create_genesis_block()
     
+    @property
+    def balances(self) -> DirtyDict:
+        """账户余额（记录变动，保存时只写回修改过的账户）"""
+        return self._balances
+    
+    @balances.setter
+    def balances(self, value: Dict[str, float]) -> None:
+        """整体替换余额，新旧账户都需要写回（已不存在的账户写为0）"""
+        balances = DirtyDict(value)
+        balances.mark_dirty(self._balances.keys())
+        balances.mark_dirty(balances.keys())
+        self._balances = balances
+        self._address_cache.clear()
+    
     def _save_to_storage(self):
-        """保存区块链状态到存储"""
+        """保存区块链状态到存储（余额只写回修改过的账户）"""
         try:
             # 保存元数据
             metadata = {
@@ -77,11 +176,14 @@ class Blockchain:
             }
             self.storage_manager.store_blockchain_metadata(metadata)
             
-            # 保存余额状态
-            self.storage_manager.store_balances(self.balances)
+            # 保存余额状态，写入失败时保留修改标记以便下次重试
+            dirty = self.balances.take_dirty()
+            changed = {address: self.balances.get(address, 0.0) for address in dirty}
+            if not self.storage_manager.store_balances(changed):
+                self.balances.mark_dirty(dirty)
             
         except Exception as e:
-            print(f"保存区块链状态失败: {e}")
+            logger.error("保存区块链状态失败: %s", e)
     
     def _create_genesis_block(self) -> None:
         """创建创世区块"""
@@ -97,27 +199,63 @@ class Blockchain:
         
         # 存储创世区块
         self.storage_manager.store_block(genesis_block)
-        print("✅ 创世区块已创建")
+        logger.debug("创世区块已创建")
     
     @property
     def chain(self) -> List[Block]:
-        """获取区块链（用于兼容性）"""
-        blocks = []
-        latest_height = self.storage_manager.get_latest_block_height()
-        
-        for height in range(latest_height + 1):
-            block = self.storage_manager.get_block_by_height(height)
-            if block:
-                blocks.append(block)
+        """
+        获取区块链（用于兼容性）
         
-        return blocks
+        列表是新的，其中的区块与区块缓存共享，只读；需要修改时先复制（如Block.from_dict(block.to_dict())）。
+        """
+        return list(self._cached_chain())
+    
+    def _cached_chain(self) -> List[Block]:
+        """获取缓存的区块列表，只从存储读取缓存之后的新区块"""
+        with self.lock:
+            latest_height = self.storage_manager.get_latest_block_height()
+            if latest_height < self._chain_cache_height:
+                self._invalidate_chain_cache()
+            
+            for height in range(self._chain_cache_height + 1, latest_height + 1):
+                block = self.storage_manager.get_block_by_height(height)
+                if block is None:
+                    # 读不到的高度不跳过，下次从该高度重新读取，保证chain[i]的高度为i
+                    break
+                self._chain_cache.append(block)
+                self._chain_cache_height = height
+            
+            return self._chain_cache
+    
+    def _invalidate_chain_cache(self) -> None:
+        """清空区块缓存（存储中的历史区块被替换时调用）"""
+        with self.lock:
+            self._chain_cache = []
+            self._chain_cache_height = -1
+            self._address_index = defaultdict(list)
+            self._tx_id_index = {}
+            self._indexed_count = 0
+            self._last_validated_height = -1
+            self._last_validated_tip_hash = ""
+            self._address_cache.clear()
+    
+    def _update_indexes(self) -> None:
+        """把缓存中尚未建立索引的区块加入交易索引"""
+        with self.lock:
+            chain = self._cached_chain()
+            for block in chain[self._indexed_count:]:
+                for transaction in block.transactions:
+                    entry = (transaction, block.index)
+                    self._tx_id_index[transaction.transaction_id] = entry
+                    if transaction.sender:
+                        self._address_index[transaction.sender].append(entry)
+                    if transaction.receiver != transaction.sender:
+                        self._address_index[transaction.receiver].append(entry)
+            self._indexed_count = len(chain)
     
     def get_latest_block(self) -> Optional[Block]:
         """获取最新区块"""
-        latest_height = self.storage_manager.get_latest_block_height()
-        if latest_height >= 0:
-            return self.storage_manager.get_block_by_height(latest_height)
-        return None
+        return self.storage_manager.get_chain_snapshot()['tip_block']
     
     def get_block_by_hash(self, block_hash: str) -> Optional[Block]:
         """根据哈希获取区块"""
@@ -128,18 +266,27 @@ class Blockchain:
         return self.storage_manager.get_block_by_height(height)
     
     def add_transaction(self, transaction: Transaction) -> bool:
-        """添加交易到待处理队列"""
-        with self.lock:
-            if self.validate_transaction(transaction):
-                self.pending_transactions.append(transaction)
-                return True
+        """添加交易到待处理队列（验证在锁外进行，重复的交易在验签前丢弃）"""
+        transaction_id = transaction.transaction_id
+        if transaction_id in self._pending_ids or self.get_transaction_by_id(transaction_id) is not None:
+            logger.debug("重复交易: %s", transaction_id)
             return False
+        
+        if not self.validate_transaction(transaction):
+            return False
+        
+        with self._pool_lock:
+            if transaction_id in self._pending_ids:
+                return False
+            self._pending_ids.add(transaction_id)
+            self.pending_transactions.append(transaction)
+        return True
     
     def validate_transaction(self, transaction: Transaction) -> bool:
         """验证交易"""
         # 验证交易
         if not transaction.is_valid():
-            print(f"交易验证失败: {transaction.transaction_id}")
+            logger.warning("交易验证失败: %s", transaction.transaction_id)
             return False
         
         # 检查发送者余额
@@ -147,111 +294,284 @@ class Blockchain:
         total_cost = transaction.amount + transaction.fee
         
         if sender_balance < total_cost:
-            print(f"余额不足: {transaction.sender} 余额 {sender_balance}, 需要 {total_cost}")
+            logger.warning("余额不足: %s 余额 %s, 需要 %s", transaction.sender, sender_balance, total_cost)
             return False
         
         return True
     
     def mine_pending_transactions(self, mining_reward_address: str) -> Optional[Block]:
-        """挖矿处理待处理交易"""
+        """
+        挖矿处理待处理交易
+        
+        在交易池锁内取走全部待处理交易后即释放，复验和工作量证明都在锁外进行；
+        只有写入区块时持有self.lock，若期间链尖已变化或写入失败，交易放回队列。
+        """
+        with self._pool_lock:
+            pending, self.pending_transactions = self.pending_transactions, []
+        if not pending:
+            return None
+        
+        # 打包前批量复验待处理交易，丢弃无效交易
+        valid = verify_transactions(pending)
+        invalid_ids = [tx.transaction_id for tx, ok in zip(pending, valid) if not ok]
+        if invalid_ids:
+            with self._pool_lock:
+                self._pending_ids.difference_update(invalid_ids)
+        pending = [tx for tx, ok in zip(pending, valid) if ok]
+        if not pending:
+            return None
+        
+        # 添加挖矿奖励交易
+        reward_transaction = Transaction(
+            sender="",
+            receiver=mining_reward_address,
+            amount=self.mining_reward
+        )
+        
+        # 创建新区块
+        latest_block = self.get_latest_block()
+        previous_hash = latest_block.hash if latest_block else "0"
+        new_index = latest_block.index + 1 if latest_block else 0
+        
+        new_block = Block(
+            index=new_index,
+            transactions=pending + [reward_transaction],
+            previous_hash=previous_hash,
+            miner_address=mining_reward_address
+        )
+        
+        # 执行工作量证明
+        self._mine_block(new_block)
+        
+        stored = False
+        with self.lock:
+            latest_block = self.get_latest_block()
+            if (latest_block.hash if latest_block else "0") == previous_hash:
+                # 区块、变动的余额和元数据在同一个批次中原子写入
+                with self.storage_manager.batch():
+                    stored = self.storage_manager.store_block(new_block)
+                    if stored:
+                        # 更新余额并保存状态
+                        self._update_balances_from_block(new_block)
+                        self._save_to_storage()
+        
+        if stored:
+            with self._pool_lock:
+                self._pending_ids.difference_update(tx.transaction_id for tx in pending)
+            logger.debug("区块 %s 挖矿成功: %s", new_index, new_block.hash)
+            return new_block
+        
+        # 未能写入（链尖已被其他区块推进或存储失败），交易放回队列头部
+        with self._pool_lock:
+            self.pending_transactions[:0] = pending
+        return None
+    
+    def append_blocks(self, blocks: List[Block]) -> bool:
+        """
+        把从其他节点收到的后续区块追加到链尾
+        
+        只验证新区块：第一个区块须连接当前链尖，每个区块的哈希、工作量证明和哈希连接都要正确。
+        全部通过后在一个存储批次中写入区块并按区块增量更新余额，任何一个不通过时不做修改。
+        """
+        if not blocks:
+            return False
+        
         with self.lock:
-            if not self.pending_transactions:
-                return None
+            latest_block = self.get_latest_block()
+            if not self._check_blocks(latest_block, blocks):
+                return False
             
-            # 添加挖矿奖励交易
-            reward_transaction = Transaction(
-                sender="",
-                receiver=mining_reward_address,
-                amount=self.mining_reward
-            )
+            # 所有新区块的余额变动先合并，再一次性写入余额
+            deltas: Dict[str, float] = {}
+            for block in blocks:
+                self._accumulate_balance_deltas(deltas, block)
             
-            # 创建新区块
-            latest_block = self.get_latest_block()
-            previous_hash = latest_block.hash if latest_block else "0"
-            new_index = latest_block.index + 1 if latest_block else 0
+            return self._commit_blocks(blocks, deltas)
+    
+    def reorganize(self, new_chain: List[Block]) -> bool:
+        """
+        切换到更长的链
+        
+        找到与本地链的最后一个共同区块，只回滚其后的本地区块、应用新链其后的区块，
+        余额按两段区块的变动增量调整，不从创世区块重新计算。
+        """
+        with self.lock:
+            local_chain = self._cached_chain()
+            if len(new_chain) <= len(local_chain):
+                return False
             
-            transactions = self.pending_transactions.copy()
-            transactions.append(reward_transaction)
+            fork = 0
+            while fork < len(local_chain) and local_chain[fork].hash == new_chain[fork].hash:
+                fork += 1
+            if fork == 0:
+                # 创世区块不同，不是同一条链
+                return False
             
-            new_block = Block(
-                index=new_index,
-                transactions=transactions,
-                previous_hash=previous_hash
-            )
+            suffix = new_chain[fork:]
+            if not self._check_blocks(new_chain[fork - 1], suffix):
+                return False
             
-            # 执行工作量证明
-            self._mine_block(new_block)
+            deltas: Dict[str, float] = {}
+            for block in local_chain[fork:]:
+                self._accumulate_balance_deltas(deltas, block, sign=-1)
+            for block in suffix:
+                self._accumulate_balance_deltas(deltas, block)
             
-            # 存储区块
-            if self.storage_manager.store_block(new_block):
-                # 更新余额
-                self._update_balances_from_block(new_block)
-                
-                # 清空待处理交易
-                self.pending_transactions.clear()
-                
-                # 保存状态
+            committed = self._commit_blocks(suffix, deltas)
+            # 分叉点之后的高度索引已被替换
+            self._invalidate_chain_cache()
+            return committed
+    
+    @staticmethod
+    def _check_blocks(previous_block: Optional[Block], blocks: List[Block]) -> bool:
+        """检查blocks依次连接在previous_block之后，且每个区块的哈希、工作量证明、Merkle根和交易签名正确"""
+        previous_hash = previous_block.hash if previous_block else "0"
+        next_index = previous_block.index + 1 if previous_block else 0
+        
+        for block in blocks:
+            if block.index != next_index or block.previous_hash != previous_hash:
+                return False
+            if block.hash != block._calculate_hash() or not block.meets_difficulty():
+                return False
+            if block._compute_merkle_root() != block.merkle_root:
+                return False
+            previous_hash = block.hash
+            next_index += 1
+        
+        # 所有新区块的交易签名汇总后一次批量验证
+        return CryptoUtils.verify_batch([
+            (tx.signing_bytes(), tx.signature, tx.public_key)
+            for block in blocks for tx in block.transactions if tx.is_signed()
+        ])
+    
+    def _commit_blocks(self, blocks: List[Block], deltas: Dict[str, float]) -> bool:
+        """
+        在一个存储批次中写入区块、应用余额变动并保存状态
+        
+        任何一个区块写入失败时在批次内抛出异常使整个批次回滚，已写入的区块不会单独落盘；
+        其他异常同样回滚批次，并按写入前记录的余额恢复内存中的余额。
+        """
+        # 余额日志：变动地址写入前的余额（None表示原先没有该账户）
+        journal = {address: self.balances.get(address) for address in deltas}
+        try:
+            with self.storage_manager.batch():
+                for block in blocks:
+                    if not self.storage_manager.store_block(block):
+                        raise _CommitAborted(f"存储区块失败: {block.hash}")
+                self._apply_balance_deltas(deltas)
                 self._save_to_storage()
-                
-                print(f"✅ 区块 {new_index} 挖矿成功: {new_block.hash}")
-                return new_block
-            
-            return None
+        except _CommitAborted as e:
+            logger.error("写入区块批次失败，已回滚: %s", e)
+            return False
+        except Exception as e:
+            self.balances.restore(journal)
+            logger.error("应用区块批次失败，已回滚: %s", e)
+            return False
+        return True
     
     def _mine_block(self, block: Block):
-        """挖矿算法"""
-        target = "0" * self.difficulty
+        """挖矿算法（按mining_workers个进程并行搜索互不重叠的nonce范围）"""
+        block.difficulty = self.difficulty
         
-        while not block.hash.startswith(target):
-            block.nonce += 1
-            block.hash = block._calculate_hash()
+        if not block.meets_difficulty():
+            block._search_nonce(self.difficulty, workers=self.mining_workers)
     
-    def _update_balances_from_block(self, block: Block):
-        """从区块更新余额状态"""
+    def _update_balances_from_block(self, block: Block) -> Set[str]:
+        """
+        从区块更新余额状态，返回余额发生变动的地址
+        
+        发送方扣除金额和手续费，接收方增加金额，手续费归区块的矿工地址。
+        先在局部字典中累计每个地址的变动，再一次性写入余额。
+        """
+        deltas: Dict[str, float] = {}
+        self._accumulate_balance_deltas(deltas, block)
+        self._apply_balance_deltas(deltas)
+        return set(deltas)
+    
+    @staticmethod
+    def _accumulate_balance_deltas(deltas: Dict[str, float], block: Block, sign: int = 1) -> None:
+        """把区块带来的余额变动累加到deltas（sign为-1时为回滚该区块，按区块自身的记账方式）"""
+        charges_fees = block.charges_fees
+        fees = 0.0
         for transaction in block.transactions:
-            # 扣除发送方余额
             if transaction.sender:
-                if transaction.sender not in self.balances:
-                    self.balances[transaction.sender] = 0
-                self.balances[transaction.sender] -= transaction.amount
+                cost = transaction.amount + transaction.fee if charges_fees else transaction.amount
+                deltas[transaction.sender] = deltas.get(transaction.sender, 0.0) - sign * cost
+                fees += transaction.fee
+            deltas[transaction.receiver] = deltas.get(transaction.receiver, 0.0) + sign * transaction.amount
+        
+        if fees and charges_fees:
+            deltas[block.miner_address] = deltas.get(block.miner_address, 0.0) + sign * fees
+    
+    def _apply_balance_deltas(self, deltas: Dict[str, float]) -> None:
+        """把累计的余额变动一次性写入余额"""
+        balances = self.balances
+        for address, delta in deltas.items():
+            balances[address] = balances.get(address, 0.0) + delta
+    
+    def _address_cached(self, kind: str, address: str, compute):
+        """返回按链尖缓存的地址查询结果，链尖未变时不重新计算"""
+        tip = self.storage_manager.get_chain_tip()
+        key = (kind, address)
+        with self.lock:
+            entry = self._address_cache.get(key)
+            if entry is not None and entry[0] == tip:
+                self._address_cache.move_to_end(key)
+                return entry[1]
             
-            # 增加接收方余额
-            if transaction.receiver not in self.balances:
-                self.balances[transaction.receiver] = 0
-            self.balances[transaction.receiver] += transaction.amount
+            result = compute(address)
+            self._address_cache[key] = (tip, result)
+            self._address_cache.move_to_end(key)
+            if len(self._address_cache) > ADDRESS_CACHE_SIZE:
+                self._address_cache.popitem(last=False)
+            return result
     
     def get_balance(self, address: str) -> float:
         """获取账户余额"""
-        return self.storage_manager.get_balance(address)
+        return self._address_cached('balance', address, self.storage_manager.get_balance)
     
     def get_all_balances(self) -> Dict[str, float]:
         """获取所有账户余额"""
         return self.storage_manager.get_all_balances()
     
-    def is_chain_valid(self) -> bool:
-        """验证区块链完整性"""
+    def is_chain_valid(self, latest_height: Optional[int] = None) -> bool:
+        """验证区块链完整性（latest_height为调用方已查询到的存储最新高度）"""
         try:
-            latest_height = self.storage_manager.get_latest_block_height()
+            if latest_height is None:
+                latest_height = self.storage_manager.get_latest_block_height()
+            chain = self._cached_chain()
             
-            for height in range(1, latest_height + 1):
-                current_block = self.storage_manager.get_block_by_height(height)
-                previous_block = self.storage_manager.get_block_by_height(height - 1)
-                
-                if not current_block or not previous_block:
-                    return False
-                
-                # 验证哈希连接
-                if current_block.previous_hash != previous_block.hash:
-                    return False
+            # 缓存会跳过存储中缺失的区块，数量不符说明链不完整
+            if len(chain) != latest_height + 1:
+                return False
+            
+            # 链只会追加：已验证的前缀未变化时只验证之后的新区块
+            start = 0
+            validated = self._last_validated_height
+            if 0 <= validated <= latest_height and chain[validated].hash == self._last_validated_tip_hash:
+                start = validated + 1
+            
+            # 每个区块只读取和计算一次，与前一个区块比较哈希连接
+            previous_block = chain[start - 1] if start > 0 else None
+            for current_block in chain[start:]:
+                if previous_block is not None:
+                    # 验证哈希连接
+                    if current_block.previous_hash != previous_block.hash:
+                        return False
+                    
+                    # 验证区块哈希
+                    if current_block.hash != current_block._calculate_hash():
+                        return False
                 
-                # 验证区块哈希
-                if current_block.hash != current_block.calculate_hash():
-                    return False
+                previous_block = current_block
             
+            if chain:
+                self._last_validated_height = latest_height
+                self._last_validated_tip_hash = chain[-1].hash
             return True
             
         except Exception as e:
-            print(f"验证区块链失败: {e}")
+            logger.error("验证区块链失败: %s", e)
             return False
     
     def get_transaction_by_hash(self, tx_hash: str) -> Optional[tuple]:
@@ -260,17 +580,24 @@ class Blockchain:
     
     def get_chain_info(self) -> Dict[str, Any]:
         """获取区块链信息"""
-        latest_height = self.storage_manager.get_latest_block_height()
-        latest_block = self.get_latest_block()
+        snapshot = self.storage_manager.get_chain_snapshot()
+        latest_height = snapshot['height']
+        
+        # 链尖与上次验证通过时相同则无需再读取缓存或存储
+        if latest_height >= 0 and (latest_height, snapshot['tip_hash']) == \
+                (self._last_validated_height, self._last_validated_tip_hash):
+            is_valid = True
+        else:
+            is_valid = self.is_chain_valid(latest_height)
         
         return {
             'height': latest_height,
-            'latest_block_hash': latest_block.hash if latest_block else None,
+            'latest_block_hash': snapshot['tip_block'].hash if snapshot['tip_block'] else None,
             'difficulty': self.difficulty,
             'mining_reward': self.mining_reward,
             'pending_transactions': len(self.pending_transactions),
             'total_accounts': len(self.balances),
-            'is_valid': self.is_chain_valid(),
+            'is_valid': is_valid,
             'storage_stats': self.storage_manager.get_storage_stats()
         }
     
@@ -283,43 +610,43 @@ class Blockchain:
         success = self.storage_manager.import_blockchain_data(import_path)
         if success:
             # 重新加载状态
+            self._invalidate_chain_cache()
             self._load_from_storage()
         return success
     
     def cleanup_old_data(self, keep_blocks: int = 1000) -> bool:
         """清理旧数据"""
+        self._invalidate_chain_cache()
         return self.storage_manager.cleanup_old_data(keep_blocks)
     
     def close(self):
         """关闭区块链"""
         self._save_to_storage()
         self.storage_manager.close()
-        print("✅ 区块链已关闭")
+        logger.debug("区块链已关闭")
     
     def get_transaction_by_id(self, transaction_id: str) -> Optional[Tuple[Transaction, int]]:
         """根据ID获取交易及其所在区块索引"""
-        for block in self.chain:
-            transaction = block.get_transaction_by_id(transaction_id)
-            if transaction:
-                return transaction, block.index
-        return None
+        self._update_indexes()
+        return self._tx_id_index.get(transaction_id)
     
     def get_transactions_by_address(self, address: str) -> List[Tuple[Transaction, int]]:
         """获取地址相关的所有交易"""
-        transactions = []
-        for block in self.chain:
-            for transaction in block.transactions:
-                if transaction.sender == address or transaction.receiver == address:
-                    transactions.append((transaction, block.index))
-        return transactions
+        return list(self._address_cached('transactions', address, self._find_transactions_by_address))
+    
+    def _find_transactions_by_address(self, address: str) -> List[Tuple[Transaction, int]]:
+        """从交易索引查找地址相关的所有交易"""
+        self._update_indexes()
+        return list(self._address_index.get(address, ()))
     
     def get_blockchain_stats(self) -> Dict[str, Any]:
         """获取区块链统计信息"""
-        total_transactions = sum(len(block.transactions) for block in self.chain)
-        total_fees = sum(block.get_transaction_fees() for block in self.chain)
+        chain = self._cached_chain()
+        total_transactions = sum(len(block.transactions) for block in chain)
+        total_fees = sum(block.get_transaction_fees() for block in chain)
         
         return {
-            'total_blocks': len(self.chain),
+            'total_blocks': len(chain),
             'total_transactions': total_transactions,
             'total_fees': total_fees,
             'difficulty': self.difficulty,
@@ -331,56 +658,63 @@ class Blockchain:
     
     def adjust_difficulty(self) -> None:
         """调整挖矿难度"""
-        if len(self.chain) < 2:
+        chain = self._cached_chain()
+        if len(chain) < 2:
             return
         
         # 计算最近区块的挖矿时间
-        latest_block = self.get_latest_block()
-        previous_block = self.chain[-2]
+        latest_block = chain[-1]
+        previous_block = chain[-2]
         
-        time_taken = latest_block.timestamp - previous_block.timestamp
+        time_taken = latest_block.timestamp_seconds - previous_block.timestamp_seconds
         target_time = 10  # 目标10秒一个区块
         
         if time_taken < target_time / 2:
             self.difficulty += 1
-            print(f"难度增加到: {self.difficulty}")
+            logger.info("难度增加到: %s", self.difficulty)
         elif time_taken > target_time * 2:
             self.difficulty = max(1, self.difficulty - 1)
-            print(f"难度降低到: {self.difficulty}")
+            logger.info("难度降低到: %s", self.difficulty)
     
     def to_dict(self) -> Dict[str, Any]:
         """转换为字典"""
         return {
             'difficulty': self.difficulty,
             'mining_reward': self.mining_reward,
-            'chain': [block.to_dict() for block in self.chain],
+            'chain': [block.to_dict() for block in self._cached_chain()],
             'balances': self.balances,
             'stats': self.get_chain_info()
         }
     
     def save_to_file(self, filename: str) -> None:
-        """保存区块链到文件"""
-        data = self.to_dict()
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        print(f"区块链已保存到: {filename}")
+        """保存区块链到文件（区块从存储逐个读取并流式写入）"""
+        with open(filename, 'wb') as f:
+            dump_json_stream(f, [
+                ('difficulty', self.difficulty),
+                ('mining_reward', self.mining_reward),
+                ('chain', self.storage_manager.iter_block_dicts()),
+                ('balances', dict(self.balances)),
+                ('stats', self.get_chain_info())
+            ])
+        logger.info("区块链已保存到: %s", filename)
     
     @classmethod
     def load_from_file(cls, filename: str) -> 'Blockchain':
         """从文件加载区块链"""
-        with open(filename, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        with open(filename, 'rb') as f:
+            data = json_loads(f.read())
         
         blockchain = cls(difficulty=data['difficulty'], mining_reward=data['mining_reward'])
         
-        # 重建链
-        blockchain.chain = []
-        for block_data in data['chain']:
-            block = Block.from_dict(block_data)
-            blockchain.chain.append(block)
+        # 重建链：区块写入存储，区块缓存随后重新读取
+        with blockchain.storage_manager.batch():
+            for block_data in data['chain']:
+                blockchain.storage_manager.store_block(Block.from_dict(block_data))
+        blockchain._invalidate_chain_cache()
         
         # 恢复余额
         blockchain.balances = data['balances']
+        blockchain._save_to_storage()
         
-        print(f"区块链已从文件加载: {filename}")
+        logger.info("区块链已从文件加载: %s", filename)
         return blockchain 
\ No newline at end of file
@@ -3,13 +3,20 @@
 """
 import time
 import json
-from typing import List, Dict, Any, Optional
+import heapq
+import itertools
+from typing import List, Dict, Any, Optional, Tuple, Sequence
 from ..utils.crypto import CryptoUtils
+from ..utils.serialization import json_dumps, json_loads
 
 
 class Transaction:
     """交易类"""
     
+    # 固定属性布局，大量交易驻留在交易池和区块中时省去每个实例的__dict__
+    __slots__ = ('sender', 'receiver', 'amount', 'fee', 'data', 'timestamp', 'nonce',
+                 'transaction_id', 'signature', 'public_key', '_leaf_hash', '_signing_bytes')
+    
     def __init__(self, sender: str, receiver: str, amount: float, 
                  fee: float = 0.0, data: str = ""):
         self.sender = sender
@@ -26,6 +33,12 @@ class Transaction:
         # 签名相关
         self.signature = ""
         self.public_key = ""
+        
+        # Merkle叶子哈希缓存: (交易字段, 叶子哈希)
+        self._leaf_hash: Optional[Tuple[tuple, str]] = None
+        
+        # 签名数据缓存: (签名字段, UTF-8编码的签名数据)
+        self._signing_bytes: Optional[Tuple[tuple, bytes]] = None
     
     def _calculate_transaction_id(self) -> str:
         """计算交易ID"""
@@ -36,37 +49,60 @@ class Transaction:
         """获取用于签名的数据"""
         return f"{self.sender}{self.receiver}{self.amount}{self.fee}{self.data}{self.nonce}"
     
+    def signing_bytes(self) -> bytes:
+        """UTF-8编码的签名数据（缓存，签名字段被修改后重新生成）"""
+        fields = (self.sender, self.receiver, self.amount, self.fee, self.data, self.nonce)
+        if self._signing_bytes is None or self._signing_bytes[0] != fields:
+            self._signing_bytes = (fields, self.get_signing_data().encode('utf-8'))
+        return self._signing_bytes[1]
+    
     def sign_transaction(self, private_key: str) -> None:
         """签名交易"""
-        signing_data = self.get_signing_data()
+        signing_data = self.signing_bytes()
         self.signature = CryptoUtils.sign_data(signing_data, private_key)
         self.public_key = CryptoUtils.private_key_to_public_key(private_key)
+        self._leaf_hash = None
     
-    def is_valid(self) -> bool:
-        """验证交易有效性"""
-        # 基本验证
+    def is_signed(self) -> bool:
+        """交易是否带有签名"""
+        return bool(self.signature and self.public_key)
+    
+    def check_fields(self) -> bool:
+        """不涉及签名运算的基本验证（含发送者地址与公钥匹配）"""
         if self.amount <= 0:
             return False
         
         if self.fee < 0:
             return False
         
+        return self.check_parties()
+    
+    def check_parties(self) -> bool:
+        """验证发送者、接收者以及发送者地址与公钥匹配"""
         if not self.sender or not self.receiver:
             return False
         
-        # 验证签名
-        if self.signature and self.public_key:
-            signing_data = self.get_signing_data()
-            if not CryptoUtils.verify_signature(signing_data, self.signature, self.public_key):
-                return False
-            
-            # 验证发送者地址与公钥匹配
+        # 验证发送者地址与公钥匹配
+        if self.is_signed():
             expected_address = CryptoUtils.public_key_to_address(self.public_key)
             if expected_address != self.sender:
                 return False
         
         return True
     
+    def is_valid(self) -> bool:
+        """验证交易有效性"""
+        # 基本验证
+        if not self.check_fields():
+            return False
+        
+        # 验证签名
+        if self.is_signed():
+            if not CryptoUtils.verify_signature(self.signing_bytes(), self.signature, self.public_key):
+                return False
+        
+        return True
+    
     def to_dict(self) -> Dict[str, Any]:
         """转换为字典"""
         return {
@@ -84,8 +120,20 @@ class Transaction:
     
     def to_json(self) -> str:
         """转换为JSON"""
+        return json_dumps(self.to_dict(), indent=True).decode('utf-8')
+    
+    def leaf_data(self) -> str:
+        """Merkle树叶子数据（固定使用标准库json格式，保证已有区块的Merkle根可验证）"""
         return json.dumps(self.to_dict(), indent=2)
     
+    def leaf_hash(self) -> str:
+        """Merkle树叶子哈希（缓存，交易字段被修改后重新计算）"""
+        fields = (self.transaction_id, self.sender, self.receiver, self.amount, self.fee,
+                  self.data, self.timestamp, self.nonce, self.signature, self.public_key)
+        if self._leaf_hash is None or self._leaf_hash[0] != fields:
+            self._leaf_hash = (fields, CryptoUtils.hash_data(self.leaf_data()))
+        return self._leaf_hash[1]
+    
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'Transaction':
         """从字典创建交易"""
@@ -103,88 +151,174 @@ class Transaction:
         tx.transaction_id = data['transaction_id']
         tx.signature = data.get('signature', "")
         tx.public_key = data.get('public_key', "")
+        tx._leaf_hash = None
+        tx._signing_bytes = None
         
         return tx
     
     @classmethod
     def from_json(cls, json_str: str) -> 'Transaction':
         """从JSON创建交易"""
-        data = json.loads(json_str)
+        data = json_loads(json_str)
         return cls.from_dict(data)
 
 
+def verify_transactions(transactions: Sequence[Transaction]) -> List[bool]:
+    """批量验证交易：先做字段检查，再对通过检查的已签名交易统一验证签名"""
+    results = [tx.check_fields() for tx in transactions]
+    signed = [i for i, tx in enumerate(transactions) if results[i] and tx.is_signed()]
+    
+    verified = CryptoUtils.verify_signatures_batch([
+        (transactions[i].signing_bytes(), transactions[i].signature, transactions[i].public_key)
+        for i in signed
+    ])
+    for i, ok in zip(signed, verified):
+        results[i] = ok
+    
+    return results
+
+
 class TransactionPool:
     """交易池类"""
     
+    # 堆中条目超过在池交易数的该倍数时压缩掉已移除的条目
+    COMPACT_RATIO = 2
+    # 池中交易很少时按该数量计算压缩阈值，避免频繁重建小堆
+    COMPACT_MIN_SIZE = 64
+    
+    __slots__ = ('max_size', '_heap', '_min_heap', '_sequence', 'transaction_map')
+    
     def __init__(self, max_size: int = 10000):
         self.max_size = max_size
-        self.pending_transactions: List[Transaction] = []
+        # 最大堆（heapq为最小堆，存负的费率）：(-费率, 序号, 序列化字节数, 交易)，序号保证同费率按到达顺序出队
+        self._heap: List[Tuple[float, int, int, Transaction]] = []
+        # 最小堆：(费率, 序号, 交易)，用于交易池满时淘汰费率最低的交易
+        self._min_heap: List[Tuple[float, int, Transaction]] = []
+        self._sequence = itertools.count()
         self.transaction_map: Dict[str, Transaction] = {}
     
+    @property
+    def pending_transactions(self) -> List[Transaction]:
+        """按优先级排列的待处理交易"""
+        return [tx for _, _, _, tx in sorted(self._heap) if self._is_live(tx)]
+    
+    @staticmethod
+    def serialized_size(transaction: Transaction) -> int:
+        """交易序列化后的字节数"""
+        return len(json_dumps(transaction.to_dict()))
+    
+    @staticmethod
+    def fee_density(transaction: Transaction, size: Optional[int] = None) -> float:
+        """交易费率：每字节序列化数据的手续费（size为已算出的序列化字节数）"""
+        if size is None:
+            size = TransactionPool.serialized_size(transaction)
+        return transaction.fee / size
+    
+    def _is_live(self, transaction: Transaction) -> bool:
+        """堆中条目是否仍在池中（已移除的交易延迟出堆）"""
+        return self.transaction_map.get(transaction.transaction_id) is transaction
+    
     def add_transaction(self, transaction: Transaction) -> bool:
         """添加交易到池中"""
-        # 验证交易
-        if not transaction.is_valid():
-            return False
-        
+        return self.add_transactions([transaction])[0]
+    
+    def add_transactions(self, transactions: Sequence[Transaction]) -> List[bool]:
+        """批量添加交易，签名统一批量验证，返回每笔交易是否加入交易池"""
+        valid = verify_transactions(transactions)
+        return [ok and self._insert(tx) for tx, ok in zip(transactions, valid)]
+    
+    def _insert(self, transaction: Transaction) -> bool:
+        """把已验证的交易放入交易池"""
         # 检查是否已存在
         if transaction.transaction_id in self.transaction_map:
             return False
         
         # 检查池大小
-        if len(self.pending_transactions) >= self.max_size:
+        if len(self.transaction_map) >= self.max_size:
             # 移除费用最低的交易
             self._remove_lowest_fee_transaction()
         
-        # 添加交易
-        self.pending_transactions.append(transaction)
+        # 添加交易，按费率同时放入最大堆和最小堆；序列化字节数只算一次，打包时直接使用
+        size = self.serialized_size(transaction)
+        density = self.fee_density(transaction, size)
+        sequence = next(self._sequence)
+        heapq.heappush(self._heap, (-density, sequence, size, transaction))
+        heapq.heappush(self._min_heap, (density, sequence, transaction))
         self.transaction_map[transaction.transaction_id] = transaction
         
-        # 按费用排序（费用高的在前）
-        self.pending_transactions.sort(key=lambda tx: tx.fee, reverse=True)
-        
         return True
     
-    def get_transactions_for_block(self, max_count: int = 100) -> List[Transaction]:
-        """获取用于打包的交易"""
-        selected = self.pending_transactions[:max_count]
+    def get_transactions_for_block(self, max_count: int = 100,
+                                   max_bytes: Optional[int] = None) -> List[Transaction]:
+        """
+        获取用于打包的交易
         
-        # 从池中移除已选择的交易
-        for tx in selected:
-            if tx.transaction_id in self.transaction_map:
-                del self.transaction_map[tx.transaction_id]
+        按费率从高到低出堆，最多max_count笔；指定max_bytes时，
+        放不进剩余空间的交易跳过并在结束后放回堆中。
+        """
+        selected = []
+        skipped = []
+        used_bytes = 0
         
-        self.pending_transactions = self.pending_transactions[max_count:]
+        while self._heap and len(selected) < max_count:
+            entry = heapq.heappop(self._heap)
+            _, _, size, tx = entry
+            if not self._is_live(tx):
+                continue
+            
+            if max_bytes is not None:
+                if used_bytes + size > max_bytes:
+                    skipped.append(entry)
+                    continue
+                used_bytes += size
+            
+            # 从池中移除已选择的交易
+            del self.transaction_map[tx.transaction_id]
+            selected.append(tx)
         
+        for entry in skipped:
+            heapq.heappush(self._heap, entry)
+        
+        self._maybe_compact()
         return selected
     
     def remove_transaction(self, transaction_id: str) -> bool:
-        """移除交易"""
+        """移除交易，O(1)（堆中条目在出堆或压缩时清理）"""
         if transaction_id in self.transaction_map:
-            transaction = self.transaction_map[transaction_id]
             del self.transaction_map[transaction_id]
-            
-            if transaction in self.pending_transactions:
-                self.pending_transactions.remove(transaction)
-            
+            self._maybe_compact()
             return True
         return False
     
+    def _maybe_compact(self) -> None:
+        """已移除的条目占多数时重建两个堆，压缩代价均摊到每次移除上"""
+        limit = self.COMPACT_RATIO * max(len(self.transaction_map), self.COMPACT_MIN_SIZE)
+        if len(self._heap) <= limit and len(self._min_heap) <= limit:
+            return
+        
+        self._heap = [entry for entry in self._heap if self._is_live(entry[-1])]
+        self._min_heap = [entry for entry in self._min_heap if self._is_live(entry[-1])]
+        heapq.heapify(self._heap)
+        heapq.heapify(self._min_heap)
+    
     def _remove_lowest_fee_transaction(self) -> None:
-        """移除费用最低的交易"""
-        if self.pending_transactions:
-            lowest_fee_tx = min(self.pending_transactions, key=lambda tx: tx.fee)
-            self.remove_transaction(lowest_fee_tx.transaction_id)
+        """移除费率最低的交易（跳过最小堆中已不在池中的条目）"""
+        while self._min_heap:
+            _, _, tx = heapq.heappop(self._min_heap)
+            if self._is_live(tx):
+                self.remove_transaction(tx.transaction_id)
+                return
     
     def get_pool_status(self) -> Dict[str, Any]:
         """获取交易池状态"""
         return {
-            'pending_count': len(self.pending_transactions),
+            'pending_count': len(self.transaction_map),
             'max_size': self.max_size,
-            'total_fees': sum(tx.fee for tx in self.pending_transactions)
+            'total_fees': sum(tx.fee for tx in self.transaction_map.values())
         }
     
     def clear(self) -> None:
         """清空交易池"""
-        self.pending_transactions.clear()
-        self.transaction_map.clear() 
\ No newline at end of file
+        self._heap.clear()
+        self._min_heap.clear()
+        self.transaction_map.clear()
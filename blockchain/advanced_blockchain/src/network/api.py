@@ -1,17 +1,70 @@
 """
 区块链REST API服务
 """
+import base64
+import gzip
+import logging
 import json
-from flask import Flask, request, jsonify
-from flask_socketio import SocketIO
-from typing import Dict, Any
+import os
+import zlib
+import hashlib
+from flask import Flask, Response, request, jsonify, stream_with_context
+from flask.json.provider import JSONProvider
+from flask_socketio import SocketIO, join_room
+from collections import OrderedDict
+from typing import Dict, Any, Callable, Hashable, Optional, Set, Tuple
 from ..core.blockchain import Blockchain
 from ..core.transaction import Transaction
 from ..utils.crypto import Wallet
 from ..config import settings
-from ..storage.storage_manager import StorageManager
+from ..storage.storage_manager import StorageManager, AsyncWriteError
+from ..utils.serialization import json_dumps, json_loads, unpack
+from .schemas import (RequestValidationError, TransactionRequest, MineRequest,
+                      StoragePutRequest, decode_request)
 import time
 
+# 尝试使用gevent协程服务器：socket读写时让出协程，并发连接数不再受工作线程数限制
+try:
+    import gevent
+    GEVENT_AVAILABLE = True
+except ImportError:
+    gevent = None
+    GEVENT_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# 只读接口响应的缓存时间（秒）
+CHAIN_RESPONSE_TTL = 1
+STORAGE_STATS_TTL = 5
+
+# HTTP长轮询传输中超过该字节数的响应启用压缩
+WS_COMPRESSION_THRESHOLD = 1024
+# 压缩推送使用的zlib级别和房间名
+WS_COMPRESSION_LEVEL = 1
+COMPRESSED_ROOM = 'compressed'
+
+# 单个区块响应：按区块哈希缓存的序列化结果条目数，超过该字节数且客户端接受时gzip压缩
+BLOCK_BODY_CACHE_SIZE = 256
+GZIP_MIN_SIZE = 1024
+
+
+class FastJSONProvider(JSONProvider):
+    """
+    基于utils.serialization的Flask JSON提供者（orjson可用时使用orjson）
+
+    jsonify和request.get_json都经由app.json编解码，替换提供者后所有接口无需逐个修改。
+    """
+    
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return json_dumps(obj).decode('utf-8')
+    
+    def loads(self, s, **kwargs: Any) -> Any:
+        return json_loads(s)
+    
+    def response(self, *args: Any, **kwargs: Any) -> Response:
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(json_dumps(obj), mimetype='application/json')
+
 
 class BlockchainAPI:
     """区块链API类"""
@@ -20,16 +73,97 @@ class BlockchainAPI:
         self.blockchain = blockchain
         self.port = port
         self.app = Flask(__name__)
+        self.app.json = FastJSONProvider(self.app)
         self.app.config['SECRET_KEY'] = settings.SECRET_KEY
-        self.socketio = SocketIO(self.app, cors_allowed_origins="*")
+        self.socketio = SocketIO(self.app, cors_allowed_origins="*",
+                                 async_mode='gevent' if GEVENT_AVAILABLE else 'threading',
+                                 http_compression=True,
+                                 compression_threshold=WS_COMPRESSION_THRESHOLD)
+        # 订阅了压缩推送的WebSocket客户端
+        self._compressed_sids: Set[str] = set()
         
         # 存储管理器
         self.storage_manager = blockchain.storage_manager
         
+        # 只读接口的响应缓存: 名称 -> (缓存键, 过期时间, JSON字节, ETag)
+        self._response_cache: Dict[str, Tuple[Hashable, float, bytes, str]] = {}
+        # 区块响应体: 区块哈希 -> (JSON字节, gzip字节)
+        self._block_bodies: "OrderedDict[str, Tuple[bytes, Optional[bytes]]]" = OrderedDict()
+        
         # 设置路由
         self._setup_routes()
         self._setup_websocket_events()
         self._setup_storage_routes()
+        
+        @self.app.errorhandler(RequestValidationError)
+        def handle_validation_error(e):
+            return jsonify({'error': str(e)}), 400
+    
+    def _cached_response(self, name: str, key: Hashable, ttl: float,
+                         build: Callable[[], Dict[str, Any]]) -> Response:
+        """
+        返回缓存的JSON响应
+        
+        缓存键（如链尖哈希）未变且未过期时直接复用序列化好的字节；
+        响应带弱ETag，客户端的If-None-Match匹配时返回304。
+        """
+        now = time.time()
+        entry = self._response_cache.get(name)
+        if entry is None or entry[0] != key or now >= entry[1]:
+            body = json_dumps(build())
+            entry = (key, now + ttl, body, hashlib.sha1(body).hexdigest())
+            self._response_cache[name] = entry
+        
+        response = self.app.response_class(entry[2], mimetype='application/json')
+        response.set_etag(entry[3], weak=True)
+        response.cache_control.max_age = int(ttl)
+        return response.make_conditional(request)
+    
+    def _block_response(self, block) -> Response:
+        """
+        返回单个区块的JSON响应
+        
+        区块内容由其哈希唯一确定：以哈希作为强ETag，序列化和gzip压缩结果按哈希缓存。
+        同一高度的区块可能因链重组而被替换，因此要求客户端每次用ETag重新验证（no-cache）。
+        """
+        entry = self._block_bodies.get(block.hash)
+        if entry is None:
+            body = json_dumps(block.to_dict())
+            entry = (body, gzip.compress(body, 6) if len(body) >= GZIP_MIN_SIZE else None)
+            self._block_bodies[block.hash] = entry
+            if len(self._block_bodies) > BLOCK_BODY_CACHE_SIZE:
+                self._block_bodies.popitem(last=False)
+        else:
+            self._block_bodies.move_to_end(block.hash)
+        
+        body, compressed = entry
+        response = self.app.response_class(mimetype='application/json')
+        if compressed is not None and 'gzip' in request.accept_encodings:
+            response.set_data(compressed)
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response.set_data(body)
+        response.vary.add('Accept-Encoding')
+        response.set_etag(block.hash)
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+    
+    def _chain_key(self) -> Hashable:
+        """链状态的缓存键：链尖(高度, 哈希)和待处理交易数"""
+        return self.storage_manager.get_chain_tip(), len(self.blockchain.pending_transactions)
+    
+    def _broadcast(self, event: str, data: Dict[str, Any]) -> None:
+        """
+        向WebSocket客户端广播事件
+        
+        订阅了压缩推送的客户端收到一次压缩好的二进制负载（event + '_z'），
+        其余客户端仍收到原来的JSON事件。
+        """
+        compressed_sids = list(self._compressed_sids)
+        if compressed_sids:
+            payload = zlib.compress(json_dumps(data), WS_COMPRESSION_LEVEL)
+            self.socketio.emit(f'{event}_z', payload, to=COMPRESSED_ROOM)
+        self.socketio.emit(event, data, skip_sid=compressed_sids or None)
     
     def _setup_routes(self):
         """设置API路由"""
@@ -37,7 +171,7 @@ class BlockchainAPI:
         @self.app.route(f'{settings.API_PREFIX}/status', methods=['GET'])
         def get_status():
             """获取区块链状态"""
-            return jsonify({
+            return self._cached_response('status', self._chain_key(), CHAIN_RESPONSE_TTL, lambda: {
                 'status': 'active',
                 'stats': self.blockchain.get_blockchain_stats(),
                 'node_info': {
@@ -48,12 +182,36 @@ class BlockchainAPI:
         
         @self.app.route(f'{settings.API_PREFIX}/blocks', methods=['GET'])
         def get_blocks():
-            """获取所有区块"""
-            blocks = [block.to_dict() for block in self.blockchain.chain]
-            return jsonify({
-                'blocks': blocks,
-                'count': len(blocks)
-            })
+            """
+            获取区块（NDJSON流）
+            
+            首行为{"count": N}，之后每行一个区块，从存储逐个读取并序列化后立即发送。
+            支持?from=<高度>&limit=<数量>分页。
+            """
+            start = max(request.args.get('from', 0, type=int), 0)
+            limit = request.args.get('limit', None, type=int)
+            
+            tip = self.storage_manager.get_chain_tip()
+            height, tip_hash = tip if tip else (-1, "")
+            end = height + 1 if limit is None else min(height + 1, start + max(limit, 0))
+            count = max(end - start, 0)
+            
+            def generate():
+                yield json_dumps({'count': count}) + b'\n'
+                for block_data in self.storage_manager.iter_block_dicts(start, end):
+                    yield json_dumps(block_data) + b'\n'
+            
+            response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+            response.set_etag(f"{height}-{tip_hash}-{start}-{end}", weak=True)
+            response.cache_control.max_age = CHAIN_RESPONSE_TTL
+            return response.make_conditional(request)
+        
+        @self.app.route(f'{settings.API_PREFIX}/blocks/head', methods=['GET'])
+        def get_blocks_head():
+            """获取链尖的高度和哈希（同步时先比较链尖，再只下载缺少的区块）"""
+            tip = self.storage_manager.get_chain_tip()
+            height, tip_hash = tip if tip else (-1, None)
+            return jsonify({'height': height, 'hash': tip_hash})
         
         @self.app.route(f'{settings.API_PREFIX}/blocks/<int:block_index>', methods=['GET'])
         def get_block(block_index):
@@ -62,36 +220,30 @@ class BlockchainAPI:
                 return jsonify({'error': '区块不存在'}), 404
             
             block = self.blockchain.chain[block_index]
-            return jsonify(block.to_dict())
+            return self._block_response(block)
         
         @self.app.route(f'{settings.API_PREFIX}/transactions', methods=['POST'])
         def create_transaction():
             """创建新交易"""
+            # 字段缺失或类型错误时由RequestValidationError处理器返回400
+            data = decode_request(request.get_data(cache=False), TransactionRequest)
             try:
-                data = request.get_json()
-                
-                # 验证必需字段
-                required_fields = ['sender', 'receiver', 'amount', 'private_key']
-                for field in required_fields:
-                    if field not in data:
-                        return jsonify({'error': f'缺少字段: {field}'}), 400
-                
                 # 创建交易
                 transaction = Transaction(
-                    sender=data['sender'],
-                    receiver=data['receiver'],
-                    amount=float(data['amount']),
-                    fee=float(data.get('fee', 0.1)),
-                    data=data.get('data', '')
+                    sender=data.sender,
+                    receiver=data.receiver,
+                    amount=data.amount,
+                    fee=data.fee,
+                    data=data.data
                 )
                 
                 # 签名交易
-                transaction.sign_transaction(data['private_key'])
+                transaction.sign_transaction(data.private_key)
                 
                 # 添加到区块链
                 if self.blockchain.add_transaction(transaction):
                     # 广播交易
-                    self.socketio.emit('new_transaction', transaction.to_dict())
+                    self._broadcast('new_transaction', transaction.to_dict())
                     
                     return jsonify({
                         'success': True,
@@ -110,11 +262,15 @@ class BlockchainAPI:
             result = self.blockchain.get_transaction_by_id(transaction_id)
             if result:
                 transaction, block_index = result
-                return jsonify({
+                response = jsonify({
                     'transaction': transaction.to_dict(),
                     'block_index': block_index,
                     'confirmations': len(self.blockchain.chain) - block_index - 1
                 })
+                # 确认数随新区块变化，只提供基于响应内容的ETag供客户端重新验证
+                response.add_etag(weak=True)
+                response.cache_control.no_cache = True
+                return response.make_conditional(request)
             else:
                 return jsonify({'error': '交易不存在'}), 404
         
@@ -133,9 +289,9 @@ class BlockchainAPI:
         @self.app.route(f'{settings.API_PREFIX}/mine', methods=['POST'])
         def mine_block():
             """挖矿"""
+            data = decode_request(request.get_data(cache=False), MineRequest)
             try:
-                data = request.get_json()
-                miner_address = data.get('miner_address')
+                miner_address = data.miner_address
                 
                 if not miner_address:
                     return jsonify({'error': '需要矿工地址'}), 400
@@ -144,12 +300,13 @@ class BlockchainAPI:
                 new_block = self.blockchain.mine_pending_transactions(miner_address)
                 
                 if new_block:
-                    # 广播新区块
-                    self.socketio.emit('new_block', new_block.to_dict())
+                    # 广播新区块（区块字典只构造一次，广播和响应共用）
+                    block_dict = new_block.to_dict()
+                    self._broadcast('new_block', block_dict)
                     
                     return jsonify({
                         'success': True,
-                        'block': new_block.to_dict(),
+                        'block': block_dict,
                         'message': f'区块 #{new_block.index} 挖矿成功'
                     })
                 else:
@@ -183,11 +340,18 @@ class BlockchainAPI:
         
         @self.socketio.on('connect')
         def handle_connect():
-            print('客户端已连接')
+            logger.info("客户端已连接")
         
         @self.socketio.on('disconnect')
         def handle_disconnect():
-            print('客户端已断开连接')
+            self._compressed_sids.discard(request.sid)
+            logger.info("客户端已断开连接")
+        
+        @self.socketio.on('subscribe_compressed')
+        def handle_subscribe_compressed():
+            """之后的new_block/new_transaction改为推送zlib压缩的JSON（事件名加_z后缀）"""
+            join_room(COMPRESSED_ROOM)
+            self._compressed_sids.add(request.sid)
         
         @self.socketio.on('get_status')
         def handle_get_status():
@@ -219,10 +383,9 @@ class BlockchainAPI:
         def storage_stats():
             """获取存储统计信息"""
             try:
-                stats = self.storage_manager.get_storage_stats()
-                return jsonify({
+                return self._cached_response('storage_stats', None, STORAGE_STATS_TTL, lambda: {
                     'success': True,
-                    'data': stats
+                    'data': self.storage_manager.get_storage_stats()
                 })
             except Exception as e:
                 return jsonify({
@@ -232,21 +395,31 @@ class BlockchainAPI:
         
         @self.app.route('/api/v1/storage/put', methods=['POST'])
         def storage_put():
-            """存储键值对"""
+            """
+            存储键值对
+            
+            Content-Type为application/octet-stream时请求体即为原始值，key由查询参数给出；
+            否则按JSON {key, value(base64)} 解析。查询参数async=1时写入异步队列并返回202，
+            之后调用/storage/flush保证已提交。
+            """
             try:
-                data = request.get_json()
-                key = data.get('key')
-                value = data.get('value')
+                if request.mimetype == 'application/octet-stream':
+                    key = request.args.get('key')
+                    value_bytes = request.get_data(cache=False)
+                else:
+                    data = decode_request(request.get_data(cache=False), StoragePutRequest)
+                    key = data.key
+                    value_bytes = base64.b64decode(data.value) if data.value else None
                 
-                if not key or not value:
+                if not key or not value_bytes:
                     return jsonify({
                         'success': False,
                         'error': '缺少key或value参数'
                     }), 400
                 
-                # 解码base64值
-                import base64
-                value_bytes = base64.b64decode(value.encode('utf-8'))
+                if request.args.get('async') == '1':
+                    self.storage_manager.put_async(key, value_bytes)
+                    return jsonify({'success': True, 'queued': True}), 202
                 
                 success = self.storage_manager.storage.put(key, value_bytes)
                 return jsonify({
@@ -254,15 +427,79 @@ class BlockchainAPI:
                     'message': '存储成功' if success else '存储失败'
                 })
                 
+            except RequestValidationError as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e)
+                }), 400
+            
+            except Exception as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e)
+                }), 500
+        
+        @self.app.route('/api/v1/storage/batch_put', methods=['POST'])
+        def storage_batch_put():
+            """
+            批量存储键值对
+            
+            Content-Type为application/msgpack时请求体为{items: [[key, 原始字节], ...]}，
+            否则为JSON {items: [{key, value(base64)}, ...]}。
+            """
+            try:
+                if request.mimetype == 'application/msgpack':
+                    items = {key: value for key, value in unpack(request.get_data(cache=False))['items']}
+                else:
+                    items = {item['key']: base64.b64decode(item['value'])
+                             for item in request.get_json()['items']}
+                
+                if not items:
+                    return jsonify({
+                        'success': False,
+                        'error': '缺少items参数'
+                    }), 400
+                
+                success = self.storage_manager.storage.batch_put(items)
+                return jsonify({
+                    'success': success,
+                    'count': len(items),
+                    'message': '存储成功' if success else '存储失败'
+                })
+                
             except Exception as e:
                 return jsonify({
                     'success': False,
                     'error': str(e)
                 }), 500
         
-        @self.app.route('/api/v1/storage/<key>', methods=['GET'])
+        @self.app.route('/api/v1/storage/batch_delete', methods=['POST'])
+        def storage_batch_delete():
+            """批量删除键值对，请求体为JSON {keys: [...]}"""
+            try:
+                keys = request.get_json().get('keys') or []
+                if not keys:
+                    return jsonify({
+                        'success': False,
+                        'error': '缺少keys参数'
+                    }), 400
+                
+                success = self.storage_manager.storage.batch_delete(keys)
+                return jsonify({
+                    'success': success,
+                    'count': len(keys),
+                    'message': '删除成功' if success else '删除失败'
+                })
+                
+            except Exception as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e)
+                }), 500
+        
+        @self.app.route('/api/v1/storage/<path:key>', methods=['GET'])
         def storage_get(key):
-            """获取存储值"""
+            """获取存储值（Accept优先application/octet-stream时直接返回原始字节）"""
             try:
                 value = self.storage_manager.storage.get(key)
                 
@@ -272,8 +509,11 @@ class BlockchainAPI:
                         'error': '键不存在'
                     }), 404
                 
+                if request.accept_mimetypes.best_match(
+                        ['application/json', 'application/octet-stream']) == 'application/octet-stream':
+                    return Response(value, mimetype='application/octet-stream')
+                
                 # 编码为base64
-                import base64
                 value_encoded = base64.b64encode(value).decode('utf-8')
                 
                 return jsonify({
@@ -287,10 +527,14 @@ class BlockchainAPI:
                     'error': str(e)
                 }), 500
         
-        @self.app.route('/api/v1/storage/<key>', methods=['DELETE'])
+        @self.app.route('/api/v1/storage/<path:key>', methods=['DELETE'])
         def storage_delete(key):
-            """删除存储键值对"""
+            """删除存储键值对（查询参数async=1时放入异步队列并返回202）"""
             try:
+                if request.args.get('async') == '1':
+                    self.storage_manager.delete_async(key)
+                    return jsonify({'success': True, 'queued': True}), 202
+                
                 success = self.storage_manager.storage.delete(key)
                 return jsonify({
                     'success': success,
@@ -303,17 +547,38 @@ class BlockchainAPI:
                     'error': str(e)
                 }), 500
         
+        @self.app.route('/api/v1/storage/flush', methods=['POST'])
+        def storage_flush():
+            """等待异步写入队列中的写操作全部提交，自上次flush以来有写操作失败时返回500和失败的键"""
+            try:
+                self.storage_manager.flush()
+                return jsonify({'success': True})
+                
+            except AsyncWriteError as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e),
+                    'failed': e.count,
+                    'failed_keys': e.keys
+                }), 500
+            except Exception as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e)
+                }), 500
+        
         @self.app.route('/api/v1/storage/backup', methods=['POST'])
         def storage_backup():
             """备份存储数据"""
             try:
                 data = request.get_json()
-                backup_path = data.get('backup_path', f'./backup_{int(time.time())}.json')
+                backup_path = data.get('backup_path', f'./backup_{int(time.time())}.bak')
                 
                 success = self.storage_manager.backup_storage(backup_path)
                 return jsonify({
                     'success': success,
                     'backup_path': backup_path,
+                    'size': os.path.getsize(backup_path) if success else 0,
                     'message': '备份成功' if success else '备份失败'
                 })
                 
@@ -359,6 +624,7 @@ class BlockchainAPI:
                 return jsonify({
                     'success': success,
                     'export_path': export_path,
+                    'size': os.path.getsize(export_path) if success else 0,
                     'message': '导出成功' if success else '导出失败'
                 })
                 
@@ -498,9 +764,9 @@ class BlockchainAPI:
                 }), 500
     
     def run(self, host='127.0.0.1', port=5000, debug=False):
-        """启动API服务"""
-        print(f"启动区块链API服务: http://{host}:{port}")
-        print(f"WebSocket服务已启用")
-        print(f"API端点前缀: {settings.API_PREFIX}")
+        """启动API服务（gevent可用时使用gevent的WSGI服务器，否则为Werkzeug线程服务器）"""
+        logger.info("启动区块链API服务: http://%s:%s", host, port)
+        logger.info("WebSocket服务已启用 (async_mode: %s)", self.socketio.async_mode)
+        logger.info("API端点前缀: %s", settings.API_PREFIX)
         
         self.socketio.run(self.app, host=host, port=port, debug=debug) 
\ No newline at end of file
@@ -1,16 +1,28 @@
 """
 P2P网络节点
 """
+import logging
 import json
 import requests
+from requests.adapters import HTTPAdapter
+import queue
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List, Dict, Any, Optional
 from ..core.blockchain import Blockchain
 from ..core.transaction import Transaction
 from ..core.block import Block
+from ..utils.serialization import json_loads
 from ..config import settings
 
+logger = logging.getLogger(__name__)
+
+# 每个对等节点待发送消息队列的容量，队列满时丢弃最旧的消息
+PEER_QUEUE_SIZE = 256
+# 连续发送失败达到该次数后移除对等节点
+MAX_PEER_FAILURES = 3
+
 
 class P2PNode:
     """P2P网络节点"""
@@ -23,149 +35,237 @@ class P2PNode:
         self.running = False
         self.sync_thread = None
         
+        # 所有对等节点请求共用一个会话，连接保持复用（urllib3默认已设置TCP_NODELAY）
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(pool_connections=settings.MAX_PEERS,
+                                                  pool_maxsize=settings.MAX_PEERS * 2,
+                                                  max_retries=0))
+        
+        # 同步时向各对等节点的请求并发发出，总耗时取决于最慢的节点而不是所有节点之和
+        self.executor = ThreadPoolExecutor(max_workers=settings.MAX_PEERS,
+                                           thread_name_prefix="p2p")
+        
+        # 广播：每个对等节点一个有界发送队列和发送线程，慢节点只会积压自己的队列
+        self._peer_queues: Dict[str, queue.Queue] = {}
+        self._peers_lock = threading.Lock()
+        
+    @staticmethod
+    def _peer_key(peer: Dict[str, Any]) -> str:
+        return f"{peer['host']}:{peer['port']}"
+    
+    def _start_sender(self, peer: Dict[str, Any]) -> None:
+        """为对等节点创建发送队列并启动发送线程"""
+        peer_queue: queue.Queue = queue.Queue(maxsize=PEER_QUEUE_SIZE)
+        self._peer_queues[self._peer_key(peer)] = peer_queue
+        threading.Thread(target=self._sender_loop, args=(peer, peer_queue),
+                         name=f"p2p-sender-{self._peer_key(peer)}", daemon=True).start()
+    
+    def _sender_loop(self, peer: Dict[str, Any], peer_queue: queue.Queue) -> None:
+        """依次发送队列中的消息；队列中收到None或连续失败MAX_PEER_FAILURES次时退出"""
+        failures = 0
+        while True:
+            message = peer_queue.get()
+            if message is None:
+                return
+            
+            path, data, timeout, kind = message
+            try:
+                url = f"http://{peer['host']}:{peer['port']}{settings.API_PREFIX}{path}"
+                self.session.post(url, json=data, timeout=timeout)
+                failures = 0
+                logger.debug("%s已广播到: %s:%s", kind, peer['host'], peer['port'])
+                
+            except Exception as e:
+                failures += 1
+                logger.error("广播%s到 %s:%s 失败: %s", kind, peer['host'], peer['port'], e)
+                if failures >= MAX_PEER_FAILURES:
+                    logger.warning("对等节点 %s:%s 连续%s次发送失败，已移除",
+                                   peer['host'], peer['port'], failures)
+                    self.remove_peer(peer['host'], peer['port'])
+                    return
+    
+    def _enqueue(self, path: str, data: Dict[str, Any], timeout: float, kind: str) -> None:
+        """把消息放入每个对等节点的发送队列，队列已满时丢弃最旧的一条"""
+        message = (path, data, timeout, kind)
+        for peer_queue in list(self._peer_queues.values()):
+            while True:
+                try:
+                    peer_queue.put_nowait(message)
+                    break
+                except queue.Full:
+                    try:
+                        peer_queue.get_nowait()
+                    except queue.Empty:
+                        pass
+    
     def add_peer(self, peer_host: str, peer_port: int) -> bool:
         """添加对等节点"""
         peer = {'host': peer_host, 'port': peer_port}
         
-        # 检查是否已存在
-        for existing_peer in self.peers:
-            if existing_peer['host'] == peer_host and existing_peer['port'] == peer_port:
-                return False
+        # 检查是否已存在（每个已添加的节点都有发送队列，按"host:port"直接查找）
+        if self._peer_key(peer) in self._peer_queues:
+            return False
         
         # 测试连接
         if self._test_peer_connection(peer):
-            self.peers.append(peer)
-            print(f"已添加对等节点: {peer_host}:{peer_port}")
+            with self._peers_lock:
+                if self._peer_key(peer) in self._peer_queues:
+                    return False
+                self.peers.append(peer)
+                self._start_sender(peer)
+            logger.info("已添加对等节点: %s:%s", peer_host, peer_port)
             return True
         else:
-            print(f"无法连接到对等节点: {peer_host}:{peer_port}")
+            logger.warning("无法连接到对等节点: %s:%s", peer_host, peer_port)
             return False
     
+    def remove_peer(self, peer_host: str, peer_port: int) -> bool:
+        """移除对等节点并停止其发送线程"""
+        with self._peers_lock:
+            for peer in self.peers:
+                if peer['host'] == peer_host and peer['port'] == peer_port:
+                    self.peers.remove(peer)
+                    peer_queue = self._peer_queues.pop(self._peer_key(peer), None)
+                    if peer_queue is not None:
+                        # 丢弃积压的消息，唤醒发送线程退出
+                        with peer_queue.mutex:
+                            peer_queue.queue.clear()
+                        peer_queue.put_nowait(None)
+                    return True
+        return False
+    
     def _test_peer_connection(self, peer: Dict[str, Any]) -> bool:
         """测试对等节点连接"""
         try:
             url = f"http://{peer['host']}:{peer['port']}{settings.API_PREFIX}/status"
-            response = requests.get(url, timeout=5)
+            response = self.session.get(url, timeout=5)
             return response.status_code == 200
         except Exception:
             return False
     
     def broadcast_transaction(self, transaction: Transaction) -> None:
         """广播交易到所有对等节点"""
-        transaction_data = transaction.to_dict()
+        # 将交易数据转换为API格式
+        api_data = {
+            'sender': transaction.sender,
+            'receiver': transaction.receiver,
+            'amount': transaction.amount,
+            'fee': transaction.fee,
+            'data': transaction.data,
+            'signature': transaction.signature,
+            'public_key': transaction.public_key
+        }
         
-        for peer in self.peers:
-            try:
-                url = f"http://{peer['host']}:{peer['port']}{settings.API_PREFIX}/transactions"
-                
-                # 将交易数据转换为API格式
-                api_data = {
-                    'sender': transaction.sender,
-                    'receiver': transaction.receiver,
-                    'amount': transaction.amount,
-                    'fee': transaction.fee,
-                    'data': transaction.data,
-                    'signature': transaction.signature,
-                    'public_key': transaction.public_key
-                }
-                
-                requests.post(url, json=api_data, timeout=5)
-                print(f"交易已广播到: {peer['host']}:{peer['port']}")
-                
-            except Exception as e:
-                print(f"广播交易到 {peer['host']}:{peer['port']} 失败: {e}")
+        self._enqueue('/transactions', api_data, 5, "交易")
     
     def broadcast_block(self, block: Block) -> None:
         """广播区块到所有对等节点"""
         block_data = block.to_dict()
         
-        for peer in self.peers:
-            try:
-                url = f"http://{peer['host']}:{peer['port']}{settings.API_PREFIX}/blocks"
-                requests.post(url, json=block_data, timeout=10)
-                print(f"区块已广播到: {peer['host']}:{peer['port']}")
-                
-            except Exception as e:
-                print(f"广播区块到 {peer['host']}:{peer['port']} 失败: {e}")
+        self._enqueue('/blocks', block_data, 10, "区块")
     
     def sync_blockchain(self) -> None:
-        """同步区块链"""
+        """
+        同步区块链
+        
+        先并发获取各节点的链尖，只向最高的节点下载本地之后的区块并追加到链尾；
+        新区块接不上本地链尖（发生分叉）时才下载完整的链。
+        """
         if not self.peers:
             return
         
-        # 获取最长链
-        longest_chain = None
-        longest_length = len(self.blockchain.chain)
+        tip = self.blockchain.storage_manager.get_chain_tip()
+        local_height = tip[0] if tip else -1
         
-        for peer in self.peers:
-            try:
-                url = f"http://{peer['host']}:{peer['port']}{settings.API_PREFIX}/blocks"
-                response = requests.get(url, timeout=10)
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    peer_blocks = data.get('blocks', [])
-                    
-                    if len(peer_blocks) > longest_length:
-                        longest_chain = peer_blocks
-                        longest_length = len(peer_blocks)
-                        
-            except Exception as e:
-                print(f"从 {peer['host']}:{peer['port']} 同步失败: {e}")
+        best_peer = None
+        best_height = local_height
+        futures = {self.executor.submit(self._fetch_peer_head, peer): peer for peer in list(self.peers)}
+        for future in as_completed(futures):
+            head = future.result()
+            if head and head.get('height', -1) > best_height:
+                best_peer = futures[future]
+                best_height = head['height']
         
-        # 如果发现更长的链，进行同步
-        if longest_chain:
-            self._update_blockchain(longest_chain)
+        if best_peer is None:
+            return
+        
+        new_blocks = self._fetch_peer_blocks(best_peer, start=local_height + 1)
+        if new_blocks and self.blockchain.append_blocks([Block.from_dict(data) for data in new_blocks]):
+            logger.info("区块链已同步 %s 个新区块，新高度: %s", len(new_blocks), local_height + len(new_blocks))
+            return
+        
+        # 增量同步失败，回退到下载完整的链
+        chain_data = self._fetch_peer_blocks(best_peer)
+        if chain_data and len(chain_data) > local_height + 1:
+            self._update_blockchain(chain_data)
     
-    def _update_blockchain(self, new_chain_data: List[Dict[str, Any]]) -> None:
-        """更新区块链"""
+    def _fetch_peer_head(self, peer: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """获取对等节点的链尖{height, hash}"""
         try:
-            # 验证新链
-            temp_blockchain = Blockchain(difficulty=self.blockchain.difficulty)
-            temp_blockchain.chain = []
-            
-            for block_data in new_chain_data:
-                block = Block.from_dict(block_data)
-                temp_blockchain.chain.append(block)
-            
-            # 验证链的有效性
-            if temp_blockchain.is_chain_valid():
-                # 备份当前链
-                old_chain = self.blockchain.chain.copy()
+            url = f"http://{peer['host']}:{peer['port']}{settings.API_PREFIX}/blocks/head"
+            response = self.session.get(url, timeout=5)
+            if response.status_code == 200:
+                return response.json()
+        except Exception as e:
+            logger.error("获取 %s:%s 链尖失败: %s", peer['host'], peer['port'], e)
+        return None
+    
+    def _fetch_peer_blocks(self, peer: Dict[str, Any], start: int = 0) -> Optional[List[Dict[str, Any]]]:
+        """下载对等节点从start高度开始的区块（NDJSON流）"""
+        try:
+            url = f"http://{peer['host']}:{peer['port']}{settings.API_PREFIX}/blocks"
+            with self.session.get(url, params={'from': start}, timeout=10, stream=True) as response:
+                if response.status_code != 200:
+                    return None
                 
-                # 更新链
-                self.blockchain.chain = temp_blockchain.chain
+                # 首行为区块数，其后每行一个区块
+                lines = response.iter_lines()
+                header = json_loads(next(lines))
+                if header.get('count', 0) <= 0:
+                    return None
                 
-                # 重新计算余额
-                self.blockchain.balances = {}
-                for block in self.blockchain.chain:
-                    self.blockchain._update_balances_from_block(block)
+                return [json_loads(line) for line in lines if line]
                 
-                print(f"区块链已同步，新长度: {len(self.blockchain.chain)}")
+        except Exception as e:
+            logger.error("从 %s:%s 同步失败: %s", peer['host'], peer['port'], e)
+            return None
+    
+    def _update_blockchain(self, new_chain_data: List[Dict[str, Any]]) -> None:
+        """切换到对等节点的更长链（只回滚和应用分叉点之后的区块）"""
+        try:
+            new_chain = [Block.from_dict(block_data) for block_data in new_chain_data]
+            
+            if self.blockchain.reorganize(new_chain):
+                logger.info("区块链已同步，新长度: %s", len(new_chain))
             else:
-                print("接收到的链验证失败，拒绝同步")
+                logger.warning("接收到的链验证失败，拒绝同步")
                 
         except Exception as e:
-            print(f"更新区块链失败: {e}")
+            logger.error("更新区块链失败: %s", e)
     
     def discover_peers(self) -> None:
-        """发现新的对等节点"""
+        """发现新的对等节点（各节点返回的列表先合并去重，只尝试连接未知的节点）"""
         known_peers = self.peers.copy()
+        candidates = set()
         
         for peer in known_peers:
             try:
                 url = f"http://{peer['host']}:{peer['port']}{settings.API_PREFIX}/peers"
-                response = requests.get(url, timeout=5)
+                response = self.session.get(url, timeout=5)
                 
                 if response.status_code == 200:
-                    peer_list = response.json().get('peers', [])
-                    
-                    for new_peer in peer_list:
-                        if len(self.peers) < settings.MAX_PEERS:
-                            self.add_peer(new_peer['host'], new_peer['port'])
+                    for new_peer in response.json().get('peers', []):
+                        candidates.add((new_peer['host'], new_peer['port']))
                             
             except Exception as e:
-                print(f"从 {peer['host']}:{peer['port']} 发现节点失败: {e}")
+                logger.error("从 %s:%s 发现节点失败: %s", peer['host'], peer['port'], e)
+        
+        candidates.discard((self.host, self.port))
+        for host, port in candidates:
+            if len(self.peers) >= settings.MAX_PEERS:
+                break
+            if f"{host}:{port}" not in self._peer_queues:
+                self.add_peer(host, port)
     
     def start_sync_thread(self) -> None:
         """启动同步线程"""
@@ -176,14 +276,14 @@ class P2PNode:
         self.sync_thread = threading.Thread(target=self._sync_loop)
         self.sync_thread.daemon = True
         self.sync_thread.start()
-        print("同步线程已启动")
+        logger.info("同步线程已启动")
     
     def stop_sync_thread(self) -> None:
         """停止同步线程"""
         self.running = False
         if self.sync_thread:
             self.sync_thread.join()
-        print("同步线程已停止")
+        logger.info("同步线程已停止")
     
     def _sync_loop(self) -> None:
         """同步循环"""
@@ -200,7 +300,7 @@ class P2PNode:
                 time.sleep(settings.SYNC_INTERVAL)
                 
             except Exception as e:
-                print(f"同步循环错误: {e}")
+                logger.error("同步循环错误: %s", e)
                 time.sleep(5)
     
     def get_peer_info(self) -> Dict[str, Any]:
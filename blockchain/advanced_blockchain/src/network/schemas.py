@@ -0,0 +1,85 @@
+"""
+API请求体结构定义与解析
+"""
+from dataclasses import dataclass, fields, MISSING
+from typing import Any, Type, TypeVar, get_type_hints
+from ..utils.serialization import json_loads
+
+# 尝试导入msgspec：直接从请求字节解码并按类型校验（C实现），不可用时退回逐字段检查
+try:
+    import msgspec
+    MSGSPEC_AVAILABLE = True
+except ImportError:
+    msgspec = None
+    MSGSPEC_AVAILABLE = False
+
+T = TypeVar('T')
+
+
+class RequestValidationError(ValueError):
+    """请求体缺少字段或字段类型错误"""
+
+
+@dataclass
+class TransactionRequest:
+    """POST /transactions"""
+    sender: str
+    receiver: str
+    amount: float
+    private_key: str
+    fee: float = 0.1
+    data: str = ''
+
+
+@dataclass
+class MineRequest:
+    """POST /mine"""
+    miner_address: str
+
+
+@dataclass
+class StoragePutRequest:
+    """POST /storage/put（JSON形式，value为base64）"""
+    key: str
+    value: str
+
+
+def decode_request(body: bytes, schema: Type[T]) -> T:
+    """把请求体解码为schema实例，失败时抛出RequestValidationError"""
+    if MSGSPEC_AVAILABLE:
+        try:
+            # strict=False允许字符串形式的数字，与原先的float(...)转换一致
+            return msgspec.json.decode(body, type=schema, strict=False)
+        except (msgspec.ValidationError, msgspec.DecodeError) as e:
+            raise RequestValidationError(str(e)) from None
+
+    try:
+        data = json_loads(body)
+    except ValueError:
+        raise RequestValidationError("请求体不是有效的JSON") from None
+    if not isinstance(data, dict):
+        raise RequestValidationError("请求体必须是JSON对象")
+
+    hints = get_type_hints(schema)
+    values = {}
+    for field in fields(schema):
+        if field.name not in data:
+            if field.default is MISSING:
+                raise RequestValidationError(f"缺少字段: {field.name}")
+            continue
+        values[field.name] = _coerce(data[field.name], hints[field.name], field.name)
+    return schema(**values)
+
+
+def _coerce(value: Any, field_type: type, name: str) -> Any:
+    """按字段类型检查并转换单个值"""
+    if field_type is float:
+        if isinstance(value, bool):
+            raise RequestValidationError(f"字段类型错误: {name}")
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            raise RequestValidationError(f"字段类型错误: {name}") from None
+    if not isinstance(value, field_type):
+        raise RequestValidationError(f"字段类型错误: {name}")
+    return value
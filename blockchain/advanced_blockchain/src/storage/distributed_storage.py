@@ -1,13 +1,62 @@
 """
 分布式存储实现
 """
+import base64
+import bisect
+import logging
 import json
 import time
 import hashlib
+import queue
 import threading
+from contextlib import contextmanager, ExitStack
 import requests
-from typing import Optional, List, Dict, Any, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from functools import partial
+from requests.adapters import HTTPAdapter
+from urllib.parse import quote
+from typing import Optional, List, Dict, Any, Iterator, Callable, Iterable, Tuple
 from .storage_interface import StorageInterface
+from ..utils.serialization import pack, MSGPACK_AVAILABLE
+
+logger = logging.getLogger(__name__)
+
+# 尝试导入xxhash：键路由的哈希计算，不可用时退回hashlib.blake2b
+try:
+    import xxhash
+    XXHASH_AVAILABLE = True
+except ImportError:
+    xxhash = None
+    XXHASH_AVAILABLE = False
+
+# eventual一致性下的异步复制：固定数量的复制线程和有界队列（队列满时写入方等待）
+REPLICATION_WORKERS = 4
+REPLICATION_QUEUE_SIZE = 1024
+# 复制线程每次从队列中合并发送的最大任务数
+REPLICATION_BATCH_MAX = 1000
+
+# 对等节点读取的备份请求：首个请求超过延迟阈值（读取延迟p95的估计）仍未返回时向下一个节点再发一次
+HEDGE_DELAY_DEFAULT = 0.05
+HEDGE_DELAY_MIN = 0.01
+HEDGE_DELAY_MAX = 1.0
+# 读取延迟EWMA的平滑系数
+READ_LATENCY_ALPHA = 0.1
+# 后台健康检查的间隔（秒），读写路径只查询node_health
+HEALTH_CHECK_INTERVAL = 2.0
+# 对等节点请求的(连接超时, 读取超时)（秒）：连接不上的节点很快判定失败，读取超时按请求类型区分
+CONNECT_TIMEOUT = 0.3
+HEALTH_TIMEOUT = (CONNECT_TIMEOUT, 2.0)
+READ_TIMEOUT = (CONNECT_TIMEOUT, 5.0)
+WRITE_TIMEOUT = (CONNECT_TIMEOUT, 10.0)
+BATCH_TIMEOUT = (CONNECT_TIMEOUT, 30.0)
+# 熔断：节点连续失败达到阈值后在退避时间内不再发起任何请求（退避按连续失败次数指数增长）
+CIRCUIT_FAILURE_THRESHOLD = 3
+CIRCUIT_BASE_BACKOFF = 1.0
+CIRCUIT_MAX_BACKOFF = 60.0
+# 一致性哈希环上每个对等节点的虚拟节点数
+VNODES_PER_NODE = 100
+# 按键分条的写锁数量：同一键的本地写入和复制入队保持顺序，不同键互不阻塞
+KEY_LOCK_STRIPES = 64
 
 # 尝试导入LevelDB存储，如果不可用则使用SQLite
 try:
@@ -18,6 +67,13 @@ except ImportError:
     DEFAULT_STORAGE_CLASS = SQLiteStorage
 
 
+def _hash64(data: bytes) -> int:
+    """计算64位哈希值，用于一致性哈希环"""
+    if XXHASH_AVAILABLE:
+        return xxhash.xxh3_64_intdigest(data)
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'big')
+
+
 class DistributedStorage(StorageInterface):
     """分布式存储实现"""
     
@@ -43,219 +99,535 @@ class DistributedStorage(StorageInterface):
         self.replication_factor = min(replication_factor, len(self.peer_nodes) + 1)
         self.consistency_level = consistency_level
         self.lock = threading.RLock()
+        self._key_locks = [threading.Lock() for _ in range(KEY_LOCK_STRIPES)]
         
         # 节点健康状态
         self.node_health = {node: True for node in self.peer_nodes}
+        # 熔断状态：节点 -> (连续失败次数, 熔断截止时间)
+        self._circuit: Dict[str, Tuple[int, float]] = {}
         
-        print(f"✅ 分布式存储已初始化:")
-        print(f"   本地节点: {getattr(local_storage, 'db_path', 'unknown')}")
-        print(f"   对等节点: {len(self.peer_nodes)}")
-        print(f"   复制因子: {self.replication_factor}")
-        print(f"   一致性级别: {self.consistency_level}")
+        # 一致性哈希环：(有序的虚拟节点哈希, 对应的节点)，节点增删时重建
+        self._ring: Tuple[List[int], List[str]] = ([], [])
+        self._rebuild_ring()
+        
+        # 复用到各对等节点的HTTP连接：每个节点一个连接池（之后添加的节点留有余量），
+        # 每个池的连接数覆盖全部复制线程和请求线程同时访问同一节点的情况
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max(len(self.peer_nodes) * 2, 10),
+                              pool_maxsize=REPLICATION_WORKERS * 2,
+                              max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        # 同步复制时并发访问各目标节点
+        self._executor = ThreadPoolExecutor(max_workers=REPLICATION_WORKERS * 2,
+                                            thread_name_prefix="replicate")
+        
+        # 异步复制队列：(键, 值, 操作)，复制线程在首次使用时启动
+        self._replication_queue: queue.Queue = queue.Queue(maxsize=REPLICATION_QUEUE_SIZE)
+        self._replication_workers: List[threading.Thread] = []
+        
+        # 对等节点读取延迟的EWMA均值和方差（秒），用于估计备份请求的延迟阈值
+        self._latency_lock = threading.Lock()
+        self._read_latency_mean: Optional[float] = None
+        self._read_latency_var = 0.0
+        
+        # 后台线程定期探测各对等节点并更新node_health
+        self._health_stop = threading.Event()
+        self._health_thread = threading.Thread(target=self._health_loop, daemon=True,
+                                               name="storage-health")
+        self._health_thread.start()
+        
+        logger.debug("分布式存储已初始化: 本地节点 %s, 对等节点 %s, 复制因子 %s, 一致性级别 %s",
+                     getattr(self.local_storage, 'db_path', 'unknown'), len(self.peer_nodes),
+                     self.replication_factor, self.consistency_level)
     
-    def _get_key_hash(self, key: str) -> str:
+    def _get_key_hash(self, key: str) -> int:
         """计算键的哈希值，用于分布式路由"""
-        return hashlib.md5(key.encode('utf-8')).hexdigest()
+        return _hash64(key.encode('utf-8'))
+    
+    def _rebuild_ring(self) -> None:
+        """按当前对等节点重建一致性哈希环"""
+        points = sorted((_hash64(f"{node}#{i}".encode('utf-8')), node)
+                        for node in self.peer_nodes for i in range(VNODES_PER_NODE))
+        self._ring = ([h for h, _ in points], [node for _, node in points])
     
     def _select_nodes_for_key(self, key: str) -> List[str]:
-        """为键选择存储节点"""
-        key_hash = self._get_key_hash(key)
-        
-        # 基于哈希值选择节点
-        available_nodes = [node for node in self.peer_nodes 
-                          if self.node_health.get(node, False)]
-        
-        if not available_nodes:
+        """为键选择存储节点：从键在哈希环上的位置顺时针取不同的健康节点"""
+        ring_hashes, ring_nodes = self._ring
+        if not ring_nodes:
             return []
         
-        # 使用一致性哈希选择节点
+        count = self.replication_factor - 1  # -1 因为本地节点总是包含
         selected_nodes = []
-        hash_int = int(key_hash, 16)
-        
-        for i in range(self.replication_factor - 1):  # -1 因为本地节点总是包含
-            node_index = (hash_int + i) % len(available_nodes)
-            selected_nodes.append(available_nodes[node_index])
+        start = bisect.bisect_right(ring_hashes, self._get_key_hash(key))
+        size = len(ring_nodes)
+        for i in range(size):
+            if len(selected_nodes) >= count:
+                break
+            node = ring_nodes[(start + i) % size]
+            if node not in selected_nodes and self.node_health.get(node, False):
+                selected_nodes.append(node)
         
         return selected_nodes
     
     def _check_node_health(self, node: str) -> bool:
-        """检查节点健康状态"""
+        """检查节点健康状态（熔断期间直接判定为不健康，不发请求）"""
+        if self._circuit_open(node):
+            return False
         try:
-            response = requests.get(f"{node}/api/v1/storage/health", timeout=3)
-            healthy = response.status_code == 200
-            self.node_health[node] = healthy
-            return healthy
-        except:
-            self.node_health[node] = False
+            response = self.session.get(f"{node}/api/v1/storage/health", timeout=HEALTH_TIMEOUT)
+        except Exception as e:
+            self._mark_node_failed(node, "节点 %s 健康检查失败: %s", e)
+            return False
+        
+        if response.status_code != 200:
+            self._mark_node_failed(node, "节点 %s 健康检查返回 %s", response.status_code)
             return False
+        self._mark_node_ok(node)
+        return True
     
-    def _replicate_to_peers(self, key: str, value: bytes, operation: str = "put") -> Dict[str, bool]:
-        """复制数据到对等节点"""
-        results = {}
-        selected_nodes = self._select_nodes_for_key(key)
+    def _circuit_open(self, node: str) -> bool:
+        """节点是否处于熔断期"""
+        state = self._circuit.get(node)
+        return state is not None and time.monotonic() < state[1]
+    
+    def _mark_node_ok(self, node: str) -> None:
+        """节点请求成功：标记为健康并重置熔断状态"""
+        if not self.node_health.get(node, False):
+            logger.info("节点 %s 已恢复", node)
+        self.node_health[node] = True
+        self._circuit.pop(node, None)
+    
+    def _mark_node_failed(self, node: str, message: str, error: Any) -> None:
+        """
+        把节点标记为不健康，连续失败达到阈值后打开熔断
         
-        for node in selected_nodes:
-            try:
-                if not self._check_node_health(node):
-                    results[node] = False
-                    continue
-                
-                if operation == "put":
-                    # 发送PUT请求
-                    import base64
-                    data = {
-                        'key': key,
-                        'value': base64.b64encode(value).decode('utf-8')
-                    }
-                    response = requests.post(
-                        f"{node}/api/v1/storage/put",
-                        json=data,
-                        timeout=10
+        只在节点由健康变为不健康时记录warning，之后的重复失败只记录debug，避免大量节点同时失败时刷屏。
+        """
+        if self.node_health.get(node, False):
+            logger.warning(message, node, error)
+        else:
+            logger.debug(message, node, error)
+        self.node_health[node] = False
+        
+        failures = self._circuit.get(node, (0, 0.0))[0] + 1
+        open_until = 0.0
+        if failures >= CIRCUIT_FAILURE_THRESHOLD:
+            backoff = min(CIRCUIT_BASE_BACKOFF * 2 ** min(failures - CIRCUIT_FAILURE_THRESHOLD, 16),
+                          CIRCUIT_MAX_BACKOFF)
+            open_until = time.monotonic() + backoff
+        self._circuit[node] = (failures, open_until)
+    
+    @contextmanager
+    def _locked_keys(self, keys):
+        """持有keys所在分条的写锁（按分条序号顺序获取，避免死锁）"""
+        stripes = sorted({hash(key) % KEY_LOCK_STRIPES for key in keys})
+        with ExitStack() as stack:
+            for stripe in stripes:
+                stack.enter_context(self._key_locks[stripe])
+            yield
+    
+    def _health_loop(self) -> None:
+        """健康检查线程：每隔HEALTH_CHECK_INTERVAL探测一次全部对等节点"""
+        while not self._health_stop.wait(HEALTH_CHECK_INTERVAL):
+            for node in list(self.peer_nodes):
+                if self._health_stop.is_set():
+                    break
+                self._check_node_health(node)
+    
+    def _replicate_async(self, key: str, value: bytes, operation: str) -> None:
+        """把复制任务放入队列，由复制线程在后台执行"""
+        if not self._replication_workers:
+            with self.lock:
+                if not self._replication_workers:
+                    for i in range(REPLICATION_WORKERS):
+                        worker = threading.Thread(target=self._replication_loop,
+                                                  name=f"replication-{i}", daemon=True)
+                        worker.start()
+                        self._replication_workers.append(worker)
+        self._replication_queue.put((key, value, operation))
+    
+    def _replication_loop(self) -> None:
+        """
+        复制线程：取出队列中积压的全部任务（最多REPLICATION_BATCH_MAX个）合并发送，收到None时退出
+        
+        不等待凑批：队列空闲时单个任务立即发送；上一次发送期间到达的任务在下一轮一起发送。
+        连续的同类操作合并为一个批量请求，不同操作之间保持原有顺序。
+        """
+        while True:
+            task = self._replication_queue.get()
+            tasks = []
+            # 每个线程只取走一个None，其余的留给其他复制线程
+            while task is not None:
+                tasks.append(task)
+                if len(tasks) >= REPLICATION_BATCH_MAX:
+                    break
+                try:
+                    task = self._replication_queue.get_nowait()
+                except queue.Empty:
+                    break
+            stop = task is None
+            start = 0
+            while start < len(tasks):
+                operation = tasks[start][2]
+                end = start
+                while end < len(tasks) and tasks[end][2] == operation:
+                    end += 1
+                run = tasks[start:end]
+                try:
+                    if len(run) == 1:
+                        self._replicate_to_peers(*run[0])
+                    else:
+                        self._replicate_batch_to_peers({key: value for key, value, _ in run}, operation)
+                except Exception as e:
+                    logger.error("异步复制失败（%s 个操作）: %s", len(run), e)
+                start = end
+            
+            if stop:
+                return
+    
+    def _replicate_batch_to_peers(self, items: Dict[str, bytes], operation: str = "put") -> Dict[str, bool]:
+        """
+        批量复制到对等节点：按目标节点分组，每个节点只发送一个批量请求（各节点并发）
+        
+        items为键到值的映射（删除时值被忽略），返回各节点的复制结果。
+        """
+        return self._fan_out(self._batch_calls(items, operation))
+    
+    def _batch_calls(self, items: Dict[str, bytes], operation: str) -> Dict[str, Callable[[], bool]]:
+        """按目标节点分组items，返回每个节点的批量复制调用"""
+        by_node: Dict[str, Dict[str, bytes]] = {}
+        for key, value in items.items():
+            for node in self._select_nodes_for_key(key):
+                by_node.setdefault(node, {})[key] = value
+        return {node: partial(self._send_batch_to_node, node, node_items, operation)
+                for node, node_items in by_node.items()}
+    
+    def _send_batch_to_node(self, node: str, items: Dict[str, bytes], operation: str) -> bool:
+        """向单个节点发送批量复制请求"""
+        try:
+            if not self.node_health.get(node, False):
+                return False
+            
+            if operation == "put":
+                if MSGPACK_AVAILABLE:
+                    # msgpack直接携带二进制值
+                    response = self.session.post(
+                        f"{node}/api/v1/storage/batch_put",
+                        data=pack({'items': list(items.items())}),
+                        headers={'Content-Type': 'application/msgpack'},
+                        timeout=BATCH_TIMEOUT
                     )
-                    results[node] = response.status_code == 200
-                    
-                elif operation == "delete":
-                    # 发送DELETE请求
-                    response = requests.delete(
-                        f"{node}/api/v1/storage/{key}",
-                        timeout=10
+                else:
+                    response = self.session.post(
+                        f"{node}/api/v1/storage/batch_put",
+                        json={'items': [{'key': key, 'value': base64.b64encode(value).decode('ascii')}
+                                        for key, value in items.items()]},
+                        timeout=BATCH_TIMEOUT
                     )
-                    results[node] = response.status_code == 200
-                    
-            except Exception as e:
-                print(f"复制到节点 {node} 失败: {e}")
-                results[node] = False
-                self.node_health[node] = False
+            else:
+                response = self.session.post(
+                    f"{node}/api/v1/storage/batch_delete",
+                    json={'keys': list(items)},
+                    timeout=BATCH_TIMEOUT
+                )
+            self._mark_node_ok(node)
+            return response.status_code == 200
+            
+        except Exception as e:
+            self._mark_node_failed(node, "批量复制到节点 %s 失败: %s", e)
+            return False
+    
+    def _required_successes(self, attempted: int) -> int:
+        """按一致性级别计算除本地外需要成功复制的对等节点数（本地节点计为一个成功副本）"""
+        replicas = attempted + 1
+        if self.consistency_level == "strong":
+            # 强一致性：所有节点都必须成功
+            return replicas - 1
+        if self.consistency_level == "quorum":
+            # 法定人数：包括本地在内的大多数节点成功即可
+            return replicas // 2
+        return 1
+    
+    def _fan_out(self, calls: Dict[str, Callable[[], bool]],
+                 required: Optional[int] = None) -> Dict[str, bool]:
+        """并发执行各节点的复制调用，返回已完成节点的结果"""
+        if len(calls) == 1:
+            node, call = next(iter(calls.items()))
+            return {node: call()}
+        return self._collect(self._submit(calls), required)
+    
+    def _submit(self, calls: Dict[str, Callable[[], bool]]) -> Dict[Future, str]:
+        """把各节点的复制调用提交到线程池"""
+        return {self._executor.submit(call): node for node, call in calls.items()}
+    
+    def _collect(self, futures: Dict[Future, str], required: Optional[int] = None) -> Dict[str, bool]:
+        """
+        收集复制结果
         
+        required不为None时，成功数达到required或已不可能达到时即返回，其余请求在后台继续完成。
+        """
+        results = {}
+        successes = 0
+        if required is not None and required <= 0:
+            return results
+        for future in as_completed(futures):
+            ok = future.result()
+            results[futures[future]] = ok
+            successes += ok
+            if required is not None and (successes >= required or
+                                         successes + len(futures) - len(results) < required):
+                break
         return results
     
-    def _read_from_peers(self, key: str) -> Optional[bytes]:
-        """从对等节点读取数据"""
-        selected_nodes = self._select_nodes_for_key(key)
+    def _replicate_sync(self, calls: Dict[str, Callable[[], bool]],
+                        local_write: Callable[[], bool], keys: Iterable[str]) -> bool:
+        """
+        同步写入：先把复制请求提交到线程池，再在当前线程写本地，两者并发进行
         
-        for node in selected_nodes:
-            try:
-                if not self._check_node_health(node):
-                    continue
-                
-                response = requests.get(
-                    f"{node}/api/v1/storage/{key}",
-                    timeout=5
+        本地写入成功且达到一致性级别所需的成功节点数时返回True。本地写入失败时撤销对等节点上的写入后返回False。
+        本地写入留在当前线程，以便并入调用方打开的write_batch。
+        """
+        required = self._required_successes(len(calls))
+        futures = self._submit(calls)
+        if not local_write():
+            self._undo_replication(futures, keys)
+            return False
+        results = self._collect(futures, required)
+        return sum(results.values()) >= required
+    
+    def _undo_replication(self, futures: Dict[Future, str], keys: Iterable[str]) -> None:
+        """
+        撤销复制：尚未开始的请求取消，已写入成功的节点恢复为本地的原值（本地没有的键删除）
+        
+        等已开始的请求完成后再撤销，避免撤销请求先于原请求到达；调用方持有键锁，期间不会有同一键的新写入。
+        """
+        started = [future for future in futures if not future.cancel()]
+        succeeded = {futures[future] for future in started if future.result()}
+        if not succeeded:
+            return
+        
+        # 本地写入失败，本地存储中仍是写入前的值
+        previous = {key: self.local_storage.get(key) for key in keys}
+        restore = {key: value for key, value in previous.items() if value is not None}
+        remove = {key: b"" for key, value in previous.items() if value is None}
+        for items, operation in ((restore, "put"), (remove, "delete")):
+            if not items:
+                continue
+            calls = {node: call for node, call in self._batch_calls(items, operation).items()
+                     if node in succeeded}
+            failed = [node for node, ok in self._fan_out(calls).items() if not ok]
+            if failed:
+                logger.error("撤销节点上的写入失败: %s", failed)
+    
+    def _replicate_to_peers(self, key: str, value: bytes, operation: str = "put") -> Dict[str, bool]:
+        """复制数据到对等节点（各节点并发）"""
+        return self._fan_out(self._key_calls(key, value, operation))
+    
+    def _key_calls(self, key: str, value: bytes, operation: str) -> Dict[str, Callable[[], bool]]:
+        """返回键的各目标节点的复制调用"""
+        return {node: partial(self._send_to_node, node, key, value, operation)
+                for node in self._select_nodes_for_key(key)}
+    
+    def _send_to_node(self, node: str, key: str, value: bytes, operation: str) -> bool:
+        """向单个节点复制一个键"""
+        try:
+            if not self.node_health.get(node, False):
+                return False
+            
+            if operation == "put":
+                # 发送PUT请求，请求体为原始字节
+                response = self.session.post(
+                    f"{node}/api/v1/storage/put",
+                    params={'key': key},
+                    data=value,
+                    headers={'Content-Type': 'application/octet-stream'},
+                    timeout=WRITE_TIMEOUT
                 )
+            else:
+                # 发送DELETE请求
+                response = self.session.delete(
+                    f"{node}/api/v1/storage/{quote(key, safe='')}",
+                    timeout=WRITE_TIMEOUT
+                )
+            self._mark_node_ok(node)
+            return response.status_code == 200
+            
+        except Exception as e:
+            self._mark_node_failed(node, "复制到节点 %s 失败: %s", e)
+            return False
+    
+    def _read_from_peers(self, key: str) -> Optional[bytes]:
+        """
+        从对等节点读取数据（备份请求）
+        
+        先向第一个节点发请求，超过延迟阈值未返回或读取失败时再向下一个节点发请求，
+        返回最先得到的数据，其余请求取消或忽略其结果。
+        """
+        nodes = self._select_nodes_for_key(key)
+        pending = set()
+        next_node = 0
+        
+        while True:
+            if next_node < len(nodes):
+                pending.add(self._executor.submit(self._read_from_node, nodes[next_node], key))
+                next_node += 1
+            if not pending:
+                return None
+            
+            timeout = self._hedge_delay() if next_node < len(nodes) else None
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                value = future.result()
+                if value is not None:
+                    for other in pending:
+                        other.cancel()
+                    return value
+    
+    def _read_from_node(self, node: str, key: str) -> Optional[bytes]:
+        """从单个节点读取一个键，不存在或失败时返回None"""
+        try:
+            if not self.node_health.get(node, False):
+                return None
+            
+            start = time.monotonic()
+            response = self.session.get(
+                f"{node}/api/v1/storage/{quote(key, safe='')}",
+                headers={'Accept': 'application/octet-stream, application/json;q=0.5'},
+                timeout=READ_TIMEOUT
+            )
+            self._record_read_latency(time.monotonic() - start)
+            self._mark_node_ok(node)
+            
+            if response.status_code == 200:
+                if response.headers.get('Content-Type', '').startswith('application/octet-stream'):
+                    return response.content
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    if 'value' in data:
-                        import base64
-                        return base64.b64decode(data['value'].encode('utf-8'))
-                        
-            except Exception as e:
-                print(f"从节点 {node} 读取失败: {e}")
-                self.node_health[node] = False
+                # 不支持原始字节响应的节点仍返回base64编码的JSON
+                data = response.json()
+                if 'value' in data:
+                    return base64.b64decode(data['value'])
+                    
+        except Exception as e:
+            self._mark_node_failed(node, "从节点 %s 读取失败: %s", e)
         
         return None
     
+    def _exists_on_node(self, node: str, key: str) -> bool:
+        """检查单个节点上是否存在键"""
+        if not self.node_health.get(node, False):
+            return False
+        try:
+            response = self.session.head(f"{node}/api/v1/storage/{quote(key, safe='')}", timeout=READ_TIMEOUT)
+            self._mark_node_ok(node)
+            return response.status_code == 200
+        except Exception as e:
+            self._mark_node_failed(node, "检查节点 %s 上的键失败: %s", e)
+            return False
+    
+    def _record_read_latency(self, latency: float) -> None:
+        """更新读取延迟的EWMA均值和方差"""
+        with self._latency_lock:
+            if self._read_latency_mean is None:
+                self._read_latency_mean = latency
+                return
+            diff = latency - self._read_latency_mean
+            self._read_latency_mean += READ_LATENCY_ALPHA * diff
+            self._read_latency_var = (1 - READ_LATENCY_ALPHA) * (
+                self._read_latency_var + READ_LATENCY_ALPHA * diff * diff)
+    
+    def _hedge_delay(self) -> float:
+        """备份请求的延迟阈值：按正态近似取读取延迟的p95（均值 + 1.645倍标准差）"""
+        with self._latency_lock:
+            if self._read_latency_mean is None:
+                return HEDGE_DELAY_DEFAULT
+            p95 = self._read_latency_mean + 1.645 * self._read_latency_var ** 0.5
+        return min(max(p95, HEDGE_DELAY_MIN), HEDGE_DELAY_MAX)
+    
     # ========== 存储接口实现 ==========
     
     def put(self, key: str, value: bytes) -> bool:
         """分布式存储键值对"""
-        with self.lock:
-            # 首先存储到本地
-            local_success = self.local_storage.put(key, value)
-            
+        with self._locked_keys((key,)):
             if self.consistency_level == "eventual":
-                # 异步复制到其他节点
-                threading.Thread(
-                    target=self._replicate_to_peers,
-                    args=(key, value, "put"),
-                    daemon=True
-                ).start()
+                # 首先存储到本地，再异步复制到其他节点
+                local_success = self.local_storage.put(key, value)
+                self._replicate_async(key, value, "put")
                 return local_success
             
             else:
-                # 同步复制
-                replication_results = self._replicate_to_peers(key, value, "put")
-                successful_replications = sum(1 for success in replication_results.values() if success)
-                
-                if self.consistency_level == "strong":
-                    # 强一致性：所有节点都必须成功
-                    required_success = len(replication_results)
-                elif self.consistency_level == "quorum":
-                    # 法定人数：大多数节点成功即可
-                    required_success = len(replication_results) // 2 + 1
-                else:
-                    required_success = 1
-                
-                return local_success and successful_replications >= required_success
+                # 同步复制，与本地写入并发
+                return self._replicate_sync(self._key_calls(key, value, "put"),
+                                            partial(self.local_storage.put, key, value), (key,))
     
     def get(self, key: str) -> Optional[bytes]:
         """分布式获取值"""
-        with self.lock:
-            # 首先尝试从本地获取
-            value = self.local_storage.get(key)
-            
-            if value is not None:
-                return value
+        # 首先尝试从本地获取
+        value = self.local_storage.get(key)
+        
+        if value is not None:
+            return value
+        
+        # 如果本地没有，尝试从对等节点获取
+        if self.peer_nodes:
+            peer_value = self._read_from_peers(key)
             
-            # 如果本地没有，尝试从对等节点获取
-            if self.peer_nodes:
-                peer_value = self._read_from_peers(key)
-                
-                # 如果从对等节点获取到数据，同步到本地
-                if peer_value is not None:
+            # 如果从对等节点获取到数据，同步到本地（期间本地已有写入时以本地为准）
+            if peer_value is not None:
+                with self._locked_keys((key,)):
+                    value = self.local_storage.get(key)
+                    if value is not None:
+                        return value
                     self.local_storage.put(key, peer_value)
-                    return peer_value
-            
-            return None
+                return peer_value
+        
+        return None
     
     def delete(self, key: str) -> bool:
         """分布式删除键值对"""
-        with self.lock:
-            # 首先从本地删除
-            local_success = self.local_storage.delete(key)
-            
+        with self._locked_keys((key,)):
             if self.consistency_level == "eventual":
-                # 异步删除其他节点
-                threading.Thread(
-                    target=self._replicate_to_peers,
-                    args=(key, b"", "delete"),
-                    daemon=True
-                ).start()
+                # 首先从本地删除，再异步删除其他节点
+                local_success = self.local_storage.delete(key)
+                self._replicate_async(key, b"", "delete")
                 return local_success
             
             else:
-                # 同步删除
-                replication_results = self._replicate_to_peers(key, b"", "delete")
-                successful_replications = sum(1 for success in replication_results.values() if success)
-                
-                if self.consistency_level == "strong":
-                    required_success = len(replication_results)
-                elif self.consistency_level == "quorum":
-                    required_success = len(replication_results) // 2 + 1
-                else:
-                    required_success = 1
-                
-                return local_success and successful_replications >= required_success
+                # 同步删除，与本地删除并发
+                return self._replicate_sync(self._key_calls(key, b"", "delete"),
+                                            partial(self.local_storage.delete, key), (key,))
     
     def exists(self, key: str) -> bool:
-        """检查键是否存在"""
-        return self.get(key) is not None
+        """检查键是否存在：先查本地，本地没有时询问对等节点（HEAD请求，不传输值也不写回本地）"""
+        if self.local_storage.exists(key):
+            return True
+        calls = {node: partial(self._exists_on_node, node, key)
+                 for node in self._select_nodes_for_key(key)}
+        return any(self._fan_out(calls, required=1).values())
     
     def batch_put(self, items: Dict[str, bytes]) -> bool:
-        """批量存储"""
-        # TODO: 优化批量操作的分布式实现
-        results = []
-        for key, value in items.items():
-            results.append(self.put(key, value))
-        return all(results)
+        """批量存储：本地一次批量写入，每个对等节点一个批量复制请求"""
+        with self._locked_keys(items):
+            if self.consistency_level == "eventual":
+                local_success = self.local_storage.batch_put(items)
+                for key, value in items.items():
+                    self._replicate_async(key, value, "put")
+                return local_success
+            
+            return self._replicate_sync(self._batch_calls(items, "put"),
+                                        partial(self.local_storage.batch_put, items), items)
     
     def batch_delete(self, keys: List[str]) -> bool:
-        """批量删除"""
-        # TODO: 优化批量操作的分布式实现
-        results = []
-        for key in keys:
-            results.append(self.delete(key))
-        return all(results)
+        """批量删除：本地一次批量删除，每个对等节点一个批量复制请求"""
+        with self._locked_keys(keys):
+            if self.consistency_level == "eventual":
+                local_success = self.local_storage.batch_delete(keys)
+                for key in keys:
+                    self._replicate_async(key, b"", "delete")
+                return local_success
+            
+            return self._replicate_sync(self._batch_calls(dict.fromkeys(keys, b""), "delete"),
+                                        partial(self.local_storage.batch_delete, keys), keys)
     
     def scan(self, prefix: str, limit: int = 100) -> Iterator[tuple]:
         """扫描指定前缀的键值对"""
@@ -263,7 +635,16 @@ class DistributedStorage(StorageInterface):
         yield from self.local_storage.scan(prefix, limit)
     
     def close(self) -> None:
-        """关闭存储连接"""
+        """关闭存储连接（先完成队列中的复制任务）"""
+        for _ in self._replication_workers:
+            self._replication_queue.put(None)
+        for worker in self._replication_workers:
+            worker.join()
+        self._replication_workers = []
+        self._health_stop.set()
+        self._health_thread.join()
+        self._executor.shutdown(wait=True)
+        self.session.close()
         self.local_storage.close()
     
     def get_stats(self) -> Dict[str, Any]:
@@ -291,7 +672,8 @@ class DistributedStorage(StorageInterface):
         if node_url not in self.peer_nodes:
             self.peer_nodes.append(node_url)
             self.node_health[node_url] = self._check_node_health(node_url)
-            print(f"✅ 已添加对等节点: {node_url}")
+            self._rebuild_ring()
+            logger.debug("已添加对等节点: %s", node_url)
             return True
         return False
     
@@ -300,7 +682,8 @@ class DistributedStorage(StorageInterface):
         if node_url in self.peer_nodes:
             self.peer_nodes.remove(node_url)
             self.node_health.pop(node_url, None)
-            print(f"✅ 已移除对等节点: {node_url}")
+            self._rebuild_ring()
+            logger.debug("已移除对等节点: %s", node_url)
             return True
         return False
     
@@ -1,12 +1,69 @@
 """
 LevelDB存储实现
 """
+import base64
+import logging
 import os
-import json
+import struct
 import plyvel
 import threading
-from typing import Optional, List, Dict, Any, Iterator
+from contextlib import contextmanager
+from typing import Optional, List, Dict, Any, Iterator, Tuple
 from .storage_interface import StorageInterface, BlockStorageInterface, StateStorageInterface
+from ..utils.serialization import pack, unpack, json_loads, open_file, write_frames, iter_frames
+
+logger = logging.getLogger(__name__)
+
+
+# 交易位置记录：32字节区块哈希 + 4字节大端交易序号
+TX_LOCATION_FORMAT = '>32sI'
+TX_LOCATION_SIZE = struct.calcsize(TX_LOCATION_FORMAT)
+# 非哈希格式区块的交易位置记录为映射（msgpack或旧的JSON），以此前缀与定长记录区分
+TX_LOCATION_MAP_PREFIXES = (b'\x82\xaablock_hash', b'{"block_hash"')
+
+# 余额记录：1字节0标记 + 8字节大端double（旧格式为十进制字符串，不会以0字节开头）
+BALANCE_FORMAT = '>xd'
+BALANCE_SIZE = struct.calcsize(BALANCE_FORMAT)
+
+# LevelDB打开参数：区块数据以追加写入为主，较大的memtable和SST文件减少压缩次数，较大的块缓存提高读命中率
+WRITE_BUFFER_SIZE = 64 * 1024 * 1024
+MAX_FILE_SIZE = 16 * 1024 * 1024
+MAX_OPEN_FILES = 1000
+LRU_CACHE_SIZE = 256 * 1024 * 1024
+
+# 二进制备份文件头；没有该文件头的备份按旧的JSON格式恢复
+BACKUP_MAGIC = b'LDBBAK1\n'
+# 恢复时每个WriteBatch写入的记录数
+RESTORE_BATCH_SIZE = 10000
+
+
+def encode_hash(block_hash: str) -> bytes:
+    """把64位十六进制哈希编码为32字节原始摘要（其他格式按UTF-8保存）"""
+    if len(block_hash) == 64:
+        try:
+            return bytes.fromhex(block_hash)
+        except ValueError:
+            pass
+    return block_hash.encode('utf-8')
+
+
+def encode_balance(balance: float) -> bytes:
+    """把余额编码为定长二进制（double按位保存，读回与写入完全一致）"""
+    return struct.pack(BALANCE_FORMAT, balance)
+
+
+def decode_balance(value: bytes) -> float:
+    """解码余额记录（兼容旧的十进制字符串格式）"""
+    if len(value) == BALANCE_SIZE and value[0] == 0:
+        return struct.unpack(BALANCE_FORMAT, value)[0]
+    return float(value.decode('utf-8'))
+
+
+def decode_hash(value: bytes) -> str:
+    """把存储的哈希还原为十六进制字符串（兼容旧的十六进制文本格式）"""
+    if len(value) == 32:
+        return value.hex()
+    return value.decode('utf-8')
 
 
 class LevelDBStorage(StorageInterface, BlockStorageInterface, StateStorageInterface):
@@ -14,7 +71,11 @@ class LevelDBStorage(StorageInterface, BlockStorageInterface, StateStorageInterf
     
     def __init__(self, db_path: str = "./blockchain_data", 
                  create_if_missing: bool = True,
-                 compression: str = 'snappy'):
+                 compression: str = 'snappy',
+                 write_buffer_size: int = WRITE_BUFFER_SIZE,
+                 max_file_size: int = MAX_FILE_SIZE,
+                 max_open_files: int = MAX_OPEN_FILES,
+                 lru_cache_size: int = LRU_CACHE_SIZE):
         """
         初始化LevelDB存储
         
@@ -22,9 +83,19 @@ class LevelDBStorage(StorageInterface, BlockStorageInterface, StateStorageInterf
             db_path: 数据库路径
             create_if_missing: 如果数据库不存在是否创建
             compression: 压缩算法 ('snappy', 'lz4', None)
+            write_buffer_size: memtable大小（字节）
+            max_file_size: 单个SST文件大小（字节）
+            max_open_files: 最多同时打开的文件数
+            lru_cache_size: 块缓存大小（字节）
         """
         self.db_path = db_path
-        self.lock = threading.RLock()
+        
+        # LevelDB本身是线程安全的，读写不再加锁；锁只保护关闭
+        self._close_lock = threading.Lock()
+        self._closed = False
+        
+        # 各线程当前打开的WriteBatch（write_batch上下文内该线程的写入都进入该批次）
+        self._local = threading.local()
         
         # 创建数据库目录
         os.makedirs(db_path, exist_ok=True)
@@ -43,98 +114,138 @@ class LevelDBStorage(StorageInterface, BlockStorageInterface, StateStorageInterf
                 create_if_missing=create_if_missing,
                 compression=compression_type,
                 bloom_filter_bits=10,  # 布隆过滤器
-                block_cache_size=100 * 1024 * 1024  # 100MB缓存
+                write_buffer_size=write_buffer_size,
+                max_file_size=max_file_size,
+                max_open_files=max_open_files,
+                lru_cache_size=lru_cache_size
             )
-            print(f"✅ LevelDB存储已初始化: {db_path}")
+            logger.debug("LevelDB存储已初始化: %s", db_path)
             
         except Exception as e:
             raise Exception(f"无法初始化LevelDB存储: {e}")
     
     # ========== 基础存储接口实现 ==========
     
+    @contextmanager
+    def write_batch(self):
+        """
+        合并上下文内的所有写入为一个WriteBatch，正常退出时一次原子写入，发生异常时丢弃
+        
+        批次属于打开它的线程，其他线程的写入直接写数据库；嵌套使用时并入外层批次。
+        """
+        if getattr(self._local, 'batch', None) is not None:
+            yield
+            return
+        
+        self._local.batch = self.db.write_batch(transaction=True)
+        try:
+            yield
+            self._local.batch.write()
+        finally:
+            self._local.batch = None
+    
+    def _writer(self):
+        """写入目标：当前线程有打开的批次时为该WriteBatch，否则直接写数据库"""
+        batch = getattr(self._local, 'batch', None)
+        return batch if batch is not None else self.db
+    
     def put(self, key: str, value: bytes) -> bool:
         """存储键值对"""
+        return self._put_b(key.encode('utf-8'), value)
+    
+    def get(self, key: str) -> Optional[bytes]:
+        """获取值"""
+        return self._get_b(key.encode('utf-8'))
+    
+    def delete(self, key: str) -> bool:
+        """删除键值对"""
+        return self._delete_b(key.encode('utf-8'))
+    
+    # 以下字节键方法供内部使用：区块、索引等键直接拼接为bytes，不再经过str再编码
+    
+    def _put_b(self, key: bytes, value: bytes) -> bool:
+        """按字节键存储"""
         try:
-            with self.lock:
-                self.db.put(key.encode('utf-8'), value)
-                return True
+            self._writer().put(key, value)
+            return True
         except Exception as e:
-            print(f"存储失败 {key}: {e}")
+            logger.error("存储失败 %s: %s", key, e)
             return False
     
-    def get(self, key: str) -> Optional[bytes]:
-        """获取值"""
+    def _get_b(self, key: bytes) -> Optional[bytes]:
+        """按字节键读取"""
         try:
-            with self.lock:
-                value = self.db.get(key.encode('utf-8'))
-                return value
+            return self.db.get(key)
         except Exception as e:
-            print(f"读取失败 {key}: {e}")
+            logger.error("读取失败 %s: %s", key, e)
             return None
     
-    def delete(self, key: str) -> bool:
-        """删除键值对"""
+    def _delete_b(self, key: bytes) -> bool:
+        """按字节键删除"""
         try:
-            with self.lock:
-                self.db.delete(key.encode('utf-8'))
-                return True
+            self._writer().delete(key)
+            return True
         except Exception as e:
-            print(f"删除失败 {key}: {e}")
+            logger.error("删除失败 %s: %s", key, e)
             return False
     
     def exists(self, key: str) -> bool:
-        """检查键是否存在"""
-        return self.get(key) is not None
+        """检查键是否存在（不存在时多由布隆过滤器直接判定；命中的块不放入缓存）"""
+        try:
+            return self.db.get(key.encode('utf-8'), fill_cache=False) is not None
+        except Exception as e:
+            logger.error("检查存在性失败 %s: %s", key, e)
+            return False
     
     def batch_put(self, items: Dict[str, bytes]) -> bool:
         """批量存储"""
         try:
-            with self.lock:
-                with self.db.write_batch() as batch:
-                    for key, value in items.items():
-                        batch.put(key.encode('utf-8'), value)
+            with self.write_batch():
+                batch = self._local.batch
+                for key, value in items.items():
+                    batch.put(key.encode('utf-8'), value)
                 return True
         except Exception as e:
-            print(f"批量存储失败: {e}")
+            logger.error("批量存储失败: %s", e)
             return False
     
     def batch_delete(self, keys: List[str]) -> bool:
         """批量删除"""
         try:
-            with self.lock:
-                with self.db.write_batch() as batch:
-                    for key in keys:
-                        batch.delete(key.encode('utf-8'))
+            with self.write_batch():
+                batch = self._local.batch
+                for key in keys:
+                    batch.delete(key.encode('utf-8'))
                 return True
         except Exception as e:
-            print(f"批量删除失败: {e}")
+            logger.error("批量删除失败: %s", e)
             return False
     
     def scan(self, prefix: str, limit: int = 100) -> Iterator[tuple]:
         """扫描指定前缀的键值对"""
         try:
-            with self.lock:
-                prefix_bytes = prefix.encode('utf-8')
-                count = 0
+            prefix_bytes = prefix.encode('utf-8')
+            count = 0
+            
+            for key, value in self.db.iterator(prefix=prefix_bytes):
+                if count >= limit:
+                    break
+                yield (key.decode('utf-8'), value)
+                count += 1
                 
-                for key, value in self.db.iterator(prefix=prefix_bytes):
-                    if count >= limit:
-                        break
-                    yield (key.decode('utf-8'), value)
-                    count += 1
-                    
         except Exception as e:
-            print(f"扫描失败 {prefix}: {e}")
+            logger.error("扫描失败 %s: %s", prefix, e)
     
     def close(self) -> None:
         """关闭存储连接"""
         try:
-            with self.lock:
-                if hasattr(self, 'db') and self.db:
+            with self._close_lock:
+                if not self._closed and hasattr(self, 'db') and self.db:
+                    self._closed = True
                     self.db.close()
-                    print("✅ LevelDB连接已关闭")
+                    logger.debug("LevelDB连接已关闭")
         except Exception as e:
-            print(f"关闭LevelDB失败: {e}")
+            logger.error("关闭LevelDB失败: %s", e)
     
     def get_stats(self) -> Dict[str, Any]:
         """获取存储统计信息"""
@@ -166,43 +277,47 @@ class LevelDBStorage(StorageInterface, BlockStorageInterface, StateStorageInterf
     
     # ========== 区块存储接口实现 ==========
     
-    def store_block(self, block_hash: str, block_data: bytes) -> bool:
-        """存储区块"""
-        key = f"block:{block_hash}"
-        return self.put(key, block_data)
+    def store_block(self, block_hash: str, block_data: bytes,
+                    block_height: Optional[int] = None) -> bool:
+        """存储区块（高度由store_block_index单独索引，这里不使用block_height）"""
+        return self._put_b(b"block:" + block_hash.encode('utf-8'), block_data)
     
     def get_block(self, block_hash: str) -> Optional[bytes]:
         """获取区块"""
-        key = f"block:{block_hash}"
-        return self.get(key)
+        return self._get_b(b"block:" + block_hash.encode('utf-8'))
     
     def store_block_index(self, block_height: int, block_hash: str) -> bool:
         """存储区块索引"""
-        key = f"height:{block_height:010d}"  # 补零对齐，便于排序
-        return self.put(key, block_hash.encode('utf-8'))
+        key = b"height:%010d" % block_height  # 补零对齐，便于排序
+        return self._put_b(key, encode_hash(block_hash))
     
     def get_block_hash_by_height(self, height: int) -> Optional[str]:
         """根据高度获取区块哈希"""
-        key = f"height:{height:010d}"
-        value = self.get(key)
-        return value.decode('utf-8') if value else None
+        value = self._get_b(b"height:%010d" % height)
+        return decode_hash(value) if value else None
     
     def store_transaction_index(self, tx_hash: str, block_hash: str, tx_index: int) -> bool:
         """存储交易索引"""
-        key = f"tx:{tx_hash}"
+        key = b"tx:" + tx_hash.encode('utf-8')
+        hash_bytes = encode_hash(block_hash)
+        if len(hash_bytes) == 32:
+            return self._put_b(key, struct.pack(TX_LOCATION_FORMAT, hash_bytes, tx_index))
+        
         location_data = {
             'block_hash': block_hash,
             'tx_index': tx_index
         }
-        return self.put(key, json.dumps(location_data).encode('utf-8'))
+        return self._put_b(key, pack(location_data))
     
     def get_transaction_location(self, tx_hash: str) -> Optional[tuple]:
         """获取交易位置信息"""
-        key = f"tx:{tx_hash}"
-        value = self.get(key)
+        value = self._get_b(b"tx:" + tx_hash.encode('utf-8'))
         if value:
+            if len(value) == TX_LOCATION_SIZE and not value.startswith(TX_LOCATION_MAP_PREFIXES):
+                hash_bytes, tx_index = struct.unpack(TX_LOCATION_FORMAT, value)
+                return (hash_bytes.hex(), tx_index)
             try:
-                location_data = json.loads(value.decode('utf-8'))
+                location_data = unpack(value)
                 return (location_data['block_hash'], location_data['tx_index'])
             except:
                 return None
@@ -212,113 +327,116 @@ class LevelDBStorage(StorageInterface, BlockStorageInterface, StateStorageInterf
     
     def store_account_balance(self, address: str, balance: float) -> bool:
         """存储账户余额"""
-        key = f"balance:{address}"
-        return self.put(key, str(balance).encode('utf-8'))
+        return self._put_b(b"balance:" + address.encode('utf-8'), encode_balance(balance))
     
     def get_account_balance(self, address: str) -> Optional[float]:
         """获取账户余额"""
-        key = f"balance:{address}"
-        value = self.get(key)
+        value = self._get_b(b"balance:" + address.encode('utf-8'))
         if value:
             try:
-                return float(value.decode('utf-8'))
-            except:
+                return decode_balance(value)
+            except ValueError:
                 return None
         return None
     
     def store_utxo(self, utxo_key: str, utxo_data: bytes) -> bool:
         """存储UTXO"""
-        key = f"utxo:{utxo_key}"
-        return self.put(key, utxo_data)
+        return self._put_b(b"utxo:" + utxo_key.encode('utf-8'), utxo_data)
     
     def get_utxo(self, utxo_key: str) -> Optional[bytes]:
         """获取UTXO"""
-        key = f"utxo:{utxo_key}"
-        return self.get(key)
+        return self._get_b(b"utxo:" + utxo_key.encode('utf-8'))
     
     def delete_utxo(self, utxo_key: str) -> bool:
         """删除已花费的UTXO"""
-        key = f"utxo:{utxo_key}"
-        return self.delete(key)
+        return self._delete_b(b"utxo:" + utxo_key.encode('utf-8'))
     
     # ========== 扩展功能 ==========
     
+    def get_latest_block_index(self) -> Optional[Tuple[int, str]]:
+        """获取最新区块的(高度, 哈希)：高度键补零有序，反向迭代一次seek即可定位"""
+        try:
+            for key, value in self.db.iterator(prefix=b"height:", reverse=True):
+                return int(key[len(b"height:"):]), decode_hash(value)
+            return None
+        except Exception as e:
+            logger.error("获取最新区块索引失败: %s", e)
+            return None
+    
     def get_latest_block_height(self) -> int:
         """获取最新区块高度"""
-        try:
-            latest_height = -1
-            for key, _ in self.scan("height:", limit=1000):
-                if key.startswith("height:"):
-                    height = int(key.split(":")[1])
-                    latest_height = max(latest_height, height)
-            return latest_height
-        except:
-            return -1
-    
-    def get_all_accounts(self) -> List[str]:
-        """获取所有账户地址"""
-        accounts = []
-        try:
-            for key, _ in self.scan("balance:", limit=10000):
-                if key.startswith("balance:"):
-                    address = key.split(":", 1)[1]
-                    accounts.append(address)
-        except:
-            pass
-        return accounts
+        latest = self.get_latest_block_index()
+        return latest[0] if latest else -1
+    
+    def get_all_accounts(self) -> Iterator[str]:
+        """逐个返回所有账户地址（只迭代balance:前缀的键）"""
+        prefix = b"balance:"
+        for key in self.db.iterator(prefix=prefix, include_value=False):
+            yield key[len(prefix):].decode('utf-8')
+    
+    def iter_account_balances(self) -> Iterator[Tuple[str, float]]:
+        """一次前缀扫描逐个返回(地址, 余额)"""
+        prefix = b"balance:"
+        for key, value in self.db.iterator(prefix=prefix):
+            try:
+                yield key[len(prefix):].decode('utf-8'), decode_balance(value)
+            except ValueError:
+                continue
     
     def backup_to_file(self, backup_path: str) -> bool:
-        """备份数据到文件"""
+        """备份数据到文件（原始键值逐条写为二进制帧，路径以.gz结尾时gzip压缩）"""
         try:
-            backup_data = {}
-            
-            # 备份所有数据
-            for key, value in self.db.iterator():
-                key_str = key.decode('utf-8')
-                # 根据数据类型进行不同处理
-                if key_str.startswith(('balance:', 'height:')):
-                    backup_data[key_str] = value.decode('utf-8')
-                else:
-                    # 对于二进制数据，使用base64编码
-                    import base64
-                    backup_data[key_str] = base64.b64encode(value).decode('utf-8')
-            
-            # 写入备份文件
-            with open(backup_path, 'w', encoding='utf-8') as f:
-                json.dump(backup_data, f, indent=2, ensure_ascii=False)
+            with open_file(backup_path, 'wb') as f:
+                f.write(BACKUP_MAGIC)
+                write_frames(f, self.db.iterator())
             
-            print(f"✅ 数据已备份到: {backup_path}")
+            logger.debug("数据已备份到: %s", backup_path)
             return True
             
         except Exception as e:
-            print(f"备份失败: {e}")
+            logger.error("备份失败: %s", e)
             return False
     
     def restore_from_file(self, backup_path: str) -> bool:
-        """从文件恢复数据"""
+        """从文件恢复数据（逐条读取，分批写入）"""
         try:
-            with open(backup_path, 'r', encoding='utf-8') as f:
-                backup_data = json.load(f)
-            
-            # 批量恢复数据
-            batch_items = {}
-            
-            for key, value in backup_data.items():
-                if key.startswith(('balance:', 'height:')):
-                    batch_items[key] = value.encode('utf-8')
+            with open_file(backup_path, 'rb') as f:
+                header = f.read(len(BACKUP_MAGIC))
+                if header != BACKUP_MAGIC:
+                    items = self._iter_json_backup(header + f.read())
                 else:
-                    # 解码base64数据
-                    import base64
-                    batch_items[key] = base64.b64decode(value.encode('utf-8'))
-            
-            # 批量写入
-            result = self.batch_put(batch_items)
-            
-            if result:
-                print(f"✅ 数据已从备份恢复: {backup_path}")
+                    items = iter_frames(f)
+                self._bulk_load(items)
             
-            return result
+            logger.debug("数据已从备份恢复: %s", backup_path)
+            return True
             
         except Exception as e:
-            print(f"恢复失败: {e}")
-            return False 
\ No newline at end of file
+            logger.error("恢复失败: %s", e)
+            return False
+    
+    def _bulk_load(self, items: Iterator[Tuple[bytes, bytes]]) -> None:
+        """每RESTORE_BATCH_SIZE条提交一个不fsync的WriteBatch，最后一次fsync落盘"""
+        batch = self.db.write_batch()
+        count = 0
+        for key, value in items:
+            batch.put(key, value)
+            count += 1
+            if count % RESTORE_BATCH_SIZE == 0:
+                batch.write()
+                batch = self.db.write_batch()
+        batch.write()
+        # 最后写入一个sync批次，把之前未fsync的日志一次落盘
+        self.db.write_batch(sync=True).write()
+    
+    def _iter_json_backup(self, data: bytes) -> Iterator[Tuple[bytes, bytes]]:
+        """逐条还原旧的JSON格式备份中的键值"""
+        for key, value in json_loads(data).items():
+            if key.startswith('balance:'):
+                raw = value.encode('utf-8')
+            elif key.startswith('height:'):
+                raw = encode_hash(value)
+            else:
+                # 解码base64数据
+                raw = base64.b64decode(value)
+            yield key.encode('utf-8'), raw
@@ -1,13 +1,47 @@
 """
 SQLite存储实现 - LevelDB的替代方案
 """
+import base64
+import logging
 import os
-import json
+import shutil
 import sqlite3
+import tempfile
 import threading
 import time
-from typing import Optional, List, Dict, Any, Iterator
+import warnings
+from contextlib import contextmanager
+from typing import Optional, List, Dict, Any, Iterator, Tuple
 from .storage_interface import StorageInterface, BlockStorageInterface, StateStorageInterface
+from ..utils.serialization import unpack, json_loads, dump_json_stream, open_file
+
+logger = logging.getLogger(__name__)
+
+# 备份中以base64保存的二进制列
+BINARY_COLUMNS = frozenset(('value', 'block_data', 'utxo_data'))
+
+# SQLite数据库文件头，用于区分原生备份和JSON备份
+SQLITE_HEADER = b'SQLite format 3\x00'
+
+# 连接参数：8KB页（只对新建数据库生效）、256MB内存映射读取、64MB页缓存
+PAGE_SIZE = 8192
+MMAP_SIZE = 256 * 1024 * 1024
+CACHE_SIZE_KIB = 64 * 1024
+WAL_AUTOCHECKPOINT = 1000
+# 每个连接缓存的预编译语句数（默认128），覆盖全部固定SQL，避免重复解析和生成执行计划
+STATEMENT_CACHE_SIZE = 256
+# 后台执行PRAGMA optimize的间隔（秒）
+OPTIMIZE_INTERVAL = 15 * 60
+# 保留的空闲只读连接数上限，超出的连接用完即关闭
+READER_POOL_SIZE = 8
+
+
+def _prefix_upper_bound(prefix: str) -> Optional[str]:
+    """返回大于所有以prefix开头的字符串的最小上界，不存在时（空前缀等）返回None"""
+    prefix = prefix.rstrip(chr(0x10FFFF))
+    if not prefix:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
 
 
 class SQLiteStorage(StorageInterface, BlockStorageInterface, StateStorageInterface):
@@ -23,22 +57,43 @@ class SQLiteStorage(StorageInterface, BlockStorageInterface, StateStorageInterfa
             create_if_missing: 如果数据库不存在是否创建
         """
         self.db_path = db_path
+        # 写连接的锁：所有写入在同一个连接上串行执行（可重入，批次内的单条写入复用批次持有的锁）
         self.lock = threading.RLock()
+        # write_batch打开期间各写操作不单独提交
+        self._in_batch = False
+        self._batch_owner: Optional[int] = None
+        self._closed = False
+        
+        # 读取从只读连接池取连接（WAL模式下读写互不阻塞）；内存数据库无法多连接共享，读取也走写连接
+        self._idle_readers: List[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+        self._shared_reads = db_path == ':memory:'
         
         # 创建数据库目录
         os.makedirs(os.path.dirname(db_path) if os.path.dirname(db_path) else '.', exist_ok=True)
         
         try:
             # 初始化数据库连接
-            self.conn = sqlite3.connect(db_path, check_same_thread=False)
+            self.conn = sqlite3.connect(db_path, check_same_thread=False,
+                                        cached_statements=STATEMENT_CACHE_SIZE)
+            self.conn.execute(f"PRAGMA page_size={PAGE_SIZE}")  # 必须在建表和切换WAL之前
             self.conn.execute("PRAGMA journal_mode=WAL")  # 启用WAL模式提高并发性能
             self.conn.execute("PRAGMA synchronous=NORMAL")  # 平衡安全性和性能
-            self.conn.execute("PRAGMA cache_size=10000")  # 增大缓存
+            self.conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")  # 读取直接访问内存映射，减少pread调用
+            self.conn.execute("PRAGMA temp_store=MEMORY")
+            self.conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")  # 负数表示KiB
+            self.conn.execute(f"PRAGMA wal_autocheckpoint={WAL_AUTOCHECKPOINT}")
             
             # 创建表结构
             self._create_tables()
             
-            print(f"✅ SQLite存储已初始化: {db_path}")
+            # 后台定期更新查询规划器统计信息
+            self._optimize_stop = threading.Event()
+            self._optimize_thread = threading.Thread(target=self._optimize_loop, daemon=True,
+                                                     name="sqlite-optimize")
+            self._optimize_thread.start()
+            
+            logger.debug("SQLite存储已初始化: %s", db_path)
             
         except Exception as e:
             raise Exception(f"无法初始化SQLite存储: {e}")
@@ -107,12 +162,88 @@ class SQLiteStorage(StorageInterface, BlockStorageInterface, StateStorageInterfa
             
             # 创建索引
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_blocks_height ON blocks(block_height)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_key_value_key ON key_value(key)')
+            # key_value.key是主键，已有自动索引；删除旧版本创建的重复索引
+            cursor.execute('DROP INDEX IF EXISTS idx_key_value_key')
+            # 覆盖索引：按tx_hash查位置时只读索引，不再回表；主键自动索引是唯一索引，查询规划器总会优先选它，
+            # 因此查询处用INDEXED BY指定（block_height_index.height是INTEGER PRIMARY KEY即rowid，按高度查询本就只有一次查找）
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_tx_covering ON transaction_index(tx_hash, block_hash, tx_index)')
             
             self.conn.commit()
     
     # ========== 基础存储接口实现 ==========
     
+    @contextmanager
+    def write_batch(self):
+        """
+        合并上下文内的所有写入为一个事务，正常退出时一次提交，发生异常时回滚
+        
+        批次打开期间持有存储锁，其他线程的读写等待提交完成；嵌套使用时并入外层批次。
+        """
+        with self.lock:
+            if self._in_batch:
+                yield
+                return
+            
+            self._in_batch = True
+            self._batch_owner = threading.get_ident()
+            try:
+                # 开始时即取得写锁，避免事务中途由读升级为写时与其他连接冲突
+                if not self.conn.in_transaction:
+                    self.conn.execute("BEGIN IMMEDIATE")
+                yield
+                self.conn.commit()
+            except BaseException:
+                self.conn.rollback()
+                raise
+            finally:
+                self._in_batch = False
+                self._batch_owner = None
+    
+    @contextmanager
+    def _reading(self):
+        """
+        取得用于读取的连接
+        
+        一般从只读连接池取一个连接，不加锁，用完放回池中（空闲连接超过READER_POOL_SIZE时关闭），
+        连接不随线程保留；当前线程打开了write_batch时使用写连接，以读到批次内尚未提交的写入。
+        """
+        if self._shared_reads or self._batch_owner == threading.get_ident():
+            with self.lock:
+                yield self.conn
+            return
+        
+        with self._readers_lock:
+            conn = self._idle_readers.pop() if self._idle_readers else None
+        if conn is None:
+            conn = self._open_reader()
+        
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            with self._readers_lock:
+                if not self._closed and len(self._idle_readers) < READER_POOL_SIZE:
+                    self._idle_readers.append(conn)
+                    conn = None
+            if conn is not None:
+                conn.close()
+    
+    def _open_reader(self) -> sqlite3.Connection:
+        """打开一个只读连接"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+        conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+        conn.execute("PRAGMA query_only=ON")
+        return conn
+    
+    def _commit(self) -> None:
+        """提交单个写操作（批次打开时推迟到批次结束）"""
+        if not self._in_batch:
+            self.conn.commit()
+    
     def put(self, key: str, value: bytes) -> bool:
         """存储键值对"""
         try:
@@ -122,22 +253,22 @@ class SQLiteStorage(StorageInterface, BlockStorageInterface, StateStorageInterfa
                     'INSERT OR REPLACE INTO key_value (key, value, updated_at) VALUES (?, ?, julianday("now"))',
                     (key, value)
                 )
-                self.conn.commit()
+                self._commit()
                 return True
         except Exception as e:
-            print(f"存储失败 {key}: {e}")
+            logger.error("存储失败 %s: %s", key, e)
             return False
     
     def get(self, key: str) -> Optional[bytes]:
         """获取值"""
         try:
-            with self.lock:
-                cursor = self.conn.cursor()
+            with self._reading() as conn:
+                cursor = conn.cursor()
                 cursor.execute('SELECT value FROM key_value WHERE key = ?', (key,))
                 result = cursor.fetchone()
                 return result[0] if result else None
         except Exception as e:
-            print(f"读取失败 {key}: {e}")
+            logger.error("读取失败 %s: %s", key, e)
             return None
     
     def delete(self, key: str) -> bool:
@@ -146,21 +277,21 @@ class SQLiteStorage(StorageInterface, BlockStorageInterface, StateStorageInterfa
             with self.lock:
                 cursor = self.conn.cursor()
                 cursor.execute('DELETE FROM key_value WHERE key = ?', (key,))
-                self.conn.commit()
+                self._commit()
                 return True
         except Exception as e:
-            print(f"删除失败 {key}: {e}")
+            logger.error("删除失败 %s: %s", key, e)
             return False
     
     def exists(self, key: str) -> bool:
         """检查键是否存在"""
         try:
-            with self.lock:
-                cursor = self.conn.cursor()
+            with self._reading() as conn:
+                cursor = conn.cursor()
                 cursor.execute('SELECT 1 FROM key_value WHERE key = ? LIMIT 1', (key,))
                 return cursor.fetchone() is not None
         except Exception as e:
-            print(f"检查存在性失败 {key}: {e}")
+            logger.error("检查存在性失败 %s: %s", key, e)
             return False
     
     def batch_put(self, items: Dict[str, bytes]) -> bool:
@@ -173,10 +304,10 @@ class SQLiteStorage(StorageInterface, BlockStorageInterface, StateStorageInterfa
                     'INSERT OR REPLACE INTO key_value (key, value, updated_at) VALUES (?, ?, julianday("now"))',
                     [(key, value) for key, value in items.items()]
                 )
-                self.conn.commit()
+                self._commit()
                 return True
         except Exception as e:
-            print(f"批量存储失败: {e}")
+            logger.error("批量存储失败: %s", e)
             return False
     
     def batch_delete(self, keys: List[str]) -> bool:
@@ -185,43 +316,67 @@ class SQLiteStorage(StorageInterface, BlockStorageInterface, StateStorageInterfa
             with self.lock:
                 cursor = self.conn.cursor()
                 cursor.executemany('DELETE FROM key_value WHERE key = ?', [(key,) for key in keys])
-                self.conn.commit()
+                self._commit()
                 return True
         except Exception as e:
-            print(f"批量删除失败: {e}")
+            logger.error("批量删除失败: %s", e)
             return False
     
     def scan(self, prefix: str, limit: int = 100) -> Iterator[tuple]:
-        """扫描指定前缀的键值对"""
+        """扫描指定前缀的键值对（主键范围查询，结果逐行返回）"""
+        upper = _prefix_upper_bound(prefix)
         try:
-            with self.lock:
-                cursor = self.conn.cursor()
-                cursor.execute(
-                    'SELECT key, value FROM key_value WHERE key LIKE ? LIMIT ?',
-                    (f'{prefix}%', limit)
-                )
+            with self._reading() as conn:
+                if upper is None:
+                    cursor = conn.execute(
+                        'SELECT key, value FROM key_value WHERE key >= ? ORDER BY key LIMIT ?',
+                        (prefix, limit)
+                    )
+                else:
+                    cursor = conn.execute(
+                        'SELECT key, value FROM key_value WHERE key >= ? AND key < ? ORDER BY key LIMIT ?',
+                        (prefix, upper, limit)
+                    )
                 
-                for row in cursor.fetchall():
+                for row in cursor:
                     yield (row[0], row[1])
                     
         except Exception as e:
-            print(f"扫描失败 {prefix}: {e}")
+            logger.error("扫描失败 %s: %s", prefix, e)
+    
+    def _optimize_loop(self) -> None:
+        """每隔OPTIMIZE_INTERVAL执行一次PRAGMA optimize"""
+        while not self._optimize_stop.wait(OPTIMIZE_INTERVAL):
+            try:
+                with self.lock:
+                    self.conn.execute("PRAGMA optimize")
+            except Exception as e:
+                logger.error("PRAGMA optimize失败: %s", e)
     
     def close(self) -> None:
-        """关闭存储连接"""
+        """关闭存储连接（关闭前执行一次PRAGMA optimize）"""
         try:
+            if hasattr(self, '_optimize_stop'):
+                self._optimize_stop.set()
+                self._optimize_thread.join()
             with self.lock:
-                if hasattr(self, 'conn') and self.conn:
+                if hasattr(self, 'conn') and self.conn and not self._closed:
+                    self._closed = True
+                    with self._readers_lock:
+                        for conn in self._idle_readers:
+                            conn.close()
+                        self._idle_readers = []
+                    self.conn.execute("PRAGMA optimize")
                     self.conn.close()
-                    print("✅ SQLite连接已关闭")
+                    logger.debug("SQLite连接已关闭")
         except Exception as e:
-            print(f"关闭SQLite失败: {e}")
+            logger.error("关闭SQLite失败: %s", e)
     
     def get_stats(self) -> Dict[str, Any]:
         """获取存储统计信息"""
         try:
-            with self.lock:
-                cursor = self.conn.cursor()
+            with self._reading() as conn:
+                cursor = conn.cursor()
                 
                 # 获取各表的统计信息
                 stats = {'db_path': self.db_path}
@@ -249,39 +404,41 @@ class SQLiteStorage(StorageInterface, BlockStorageInterface, StateStorageInterfa
     
     # ========== 区块存储接口实现 ==========
     
-    def store_block(self, block_hash: str, block_data: bytes) -> bool:
+    def store_block(self, block_hash: str, block_data: bytes,
+                    block_height: Optional[int] = None) -> bool:
         """存储区块"""
+        if block_height is None:
+            warnings.warn("store_block未传入block_height时需要解析区块数据，该用法已弃用",
+                          DeprecationWarning, stacklevel=2)
+            # 从区块数据中提取高度（JSON或msgpack格式）
+            try:
+                block_height = unpack(block_data).get('index', 0)
+            except Exception:
+                block_height = 0
+        
         try:
             with self.lock:
                 cursor = self.conn.cursor()
-                
-                # 从区块数据中提取高度（假设是JSON格式）
-                try:
-                    block_dict = json.loads(block_data.decode('utf-8'))
-                    block_height = block_dict.get('index', 0)
-                except:
-                    block_height = 0
-                
                 cursor.execute(
                     'INSERT OR REPLACE INTO blocks (block_hash, block_data, block_height) VALUES (?, ?, ?)',
                     (block_hash, block_data, block_height)
                 )
-                self.conn.commit()
+                self._commit()
                 return True
         except Exception as e:
-            print(f"存储区块失败 {block_hash}: {e}")
+            logger.error("存储区块失败 %s: %s", block_hash, e)
             return False
     
     def get_block(self, block_hash: str) -> Optional[bytes]:
         """获取区块"""
         try:
-            with self.lock:
-                cursor = self.conn.cursor()
+            with self._reading() as conn:
+                cursor = conn.cursor()
                 cursor.execute('SELECT block_data FROM blocks WHERE block_hash = ?', (block_hash,))
                 result = cursor.fetchone()
                 return result[0] if result else None
         except Exception as e:
-            print(f"获取区块失败 {block_hash}: {e}")
+            logger.error("获取区块失败 %s: %s", block_hash, e)
             return None
     
     def store_block_index(self, block_height: int, block_hash: str) -> bool:
@@ -293,22 +450,22 @@ class SQLiteStorage(StorageInterface, BlockStorageInterface, StateStorageInterfa
                     'INSERT OR REPLACE INTO block_height_index (height, block_hash) VALUES (?, ?)',
                     (block_height, block_hash)
                 )
-                self.conn.commit()
+                self._commit()
                 return True
         except Exception as e:
-            print(f"存储区块索引失败 {block_height}: {e}")
+            logger.error("存储区块索引失败 %s: %s", block_height, e)
             return False
     
     def get_block_hash_by_height(self, height: int) -> Optional[str]:
         """根据高度获取区块哈希"""
         try:
-            with self.lock:
-                cursor = self.conn.cursor()
+            with self._reading() as conn:
+                cursor = conn.cursor()
                 cursor.execute('SELECT block_hash FROM block_height_index WHERE height = ?', (height,))
                 result = cursor.fetchone()
                 return result[0] if result else None
         except Exception as e:
-            print(f"获取区块哈希失败 {height}: {e}")
+            logger.error("获取区块哈希失败 %s: %s", height, e)
             return None
     
     def store_transaction_index(self, tx_hash: str, block_hash: str, tx_index: int) -> bool:
@@ -320,22 +477,23 @@ class SQLiteStorage(StorageInterface, BlockStorageInterface, StateStorageInterfa
                     'INSERT OR REPLACE INTO transaction_index (tx_hash, block_hash, tx_index) VALUES (?, ?, ?)',
                     (tx_hash, block_hash, tx_index)
                 )
-                self.conn.commit()
+                self._commit()
                 return True
         except Exception as e:
-            print(f"存储交易索引失败 {tx_hash}: {e}")
+            logger.error("存储交易索引失败 %s: %s", tx_hash, e)
             return False
     
     def get_transaction_location(self, tx_hash: str) -> Optional[tuple]:
         """获取交易位置信息"""
         try:
-            with self.lock:
-                cursor = self.conn.cursor()
-                cursor.execute('SELECT block_hash, tx_index FROM transaction_index WHERE tx_hash = ?', (tx_hash,))
+            with self._reading() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT block_hash, tx_index FROM transaction_index INDEXED BY idx_tx_covering '
+                               'WHERE tx_hash = ?', (tx_hash,))
                 result = cursor.fetchone()
                 return (result[0], result[1]) if result else None
         except Exception as e:
-            print(f"获取交易位置失败 {tx_hash}: {e}")
+            logger.error("获取交易位置失败 %s: %s", tx_hash, e)
             return None
     
     # ========== 状态存储接口实现 ==========
@@ -349,22 +507,22 @@ class SQLiteStorage(StorageInterface, BlockStorageInterface, StateStorageInterfa
                     'INSERT OR REPLACE INTO account_balances (address, balance, updated_at) VALUES (?, ?, julianday("now"))',
                     (address, balance)
                 )
-                self.conn.commit()
+                self._commit()
                 return True
         except Exception as e:
-            print(f"存储账户余额失败 {address}: {e}")
+            logger.error("存储账户余额失败 %s: %s", address, e)
             return False
     
     def get_account_balance(self, address: str) -> Optional[float]:
         """获取账户余额"""
         try:
-            with self.lock:
-                cursor = self.conn.cursor()
+            with self._reading() as conn:
+                cursor = conn.cursor()
                 cursor.execute('SELECT balance FROM account_balances WHERE address = ?', (address,))
                 result = cursor.fetchone()
                 return result[0] if result else None
         except Exception as e:
-            print(f"获取账户余额失败 {address}: {e}")
+            logger.error("获取账户余额失败 %s: %s", address, e)
             return None
     
     def store_utxo(self, utxo_key: str, utxo_data: bytes) -> bool:
@@ -376,22 +534,22 @@ class SQLiteStorage(StorageInterface, BlockStorageInterface, StateStorageInterfa
                     'INSERT OR REPLACE INTO utxos (utxo_key, utxo_data) VALUES (?, ?)',
                     (utxo_key, utxo_data)
                 )
-                self.conn.commit()
+                self._commit()
                 return True
         except Exception as e:
-            print(f"存储UTXO失败 {utxo_key}: {e}")
+            logger.error("存储UTXO失败 %s: %s", utxo_key, e)
             return False
     
     def get_utxo(self, utxo_key: str) -> Optional[bytes]:
         """获取UTXO"""
         try:
-            with self.lock:
-                cursor = self.conn.cursor()
+            with self._reading() as conn:
+                cursor = conn.cursor()
                 cursor.execute('SELECT utxo_data FROM utxos WHERE utxo_key = ?', (utxo_key,))
                 result = cursor.fetchone()
                 return result[0] if result else None
         except Exception as e:
-            print(f"获取UTXO失败 {utxo_key}: {e}")
+            logger.error("获取UTXO失败 %s: %s", utxo_key, e)
             return None
     
     def delete_utxo(self, utxo_key: str) -> bool:
@@ -400,10 +558,10 @@ class SQLiteStorage(StorageInterface, BlockStorageInterface, StateStorageInterfa
             with self.lock:
                 cursor = self.conn.cursor()
                 cursor.execute('DELETE FROM utxos WHERE utxo_key = ?', (utxo_key,))
-                self.conn.commit()
+                self._commit()
                 return True
         except Exception as e:
-            print(f"删除UTXO失败 {utxo_key}: {e}")
+            logger.error("删除UTXO失败 %s: %s", utxo_key, e)
             return False
     
     # ========== 扩展功能 ==========
@@ -411,116 +569,202 @@ class SQLiteStorage(StorageInterface, BlockStorageInterface, StateStorageInterfa
     def get_latest_block_height(self) -> int:
         """获取最新区块高度"""
         try:
-            with self.lock:
-                cursor = self.conn.cursor()
+            with self._reading() as conn:
+                cursor = conn.cursor()
                 cursor.execute('SELECT MAX(height) FROM block_height_index')
                 result = cursor.fetchone()
                 return result[0] if result[0] is not None else -1
         except Exception as e:
-            print(f"获取最新区块高度失败: {e}")
+            logger.error("获取最新区块高度失败: %s", e)
             return -1
     
-    def get_all_accounts(self) -> List[str]:
+    def get_latest_block_index(self) -> Optional[Tuple[int, str]]:
+        """获取最新区块的(高度, 哈希)"""
+        try:
+            with self._reading() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT height, block_hash FROM block_height_index ORDER BY height DESC LIMIT 1')
+                result = cursor.fetchone()
+                return (result[0], result[1]) if result else None
+        except Exception as e:
+            logger.error("获取最新区块索引失败: %s", e)
+            return None
+    
+    def get_all_accounts(self) -> Iterator[str]:
         """获取所有账户地址"""
         try:
-            with self.lock:
-                cursor = self.conn.cursor()
+            with self._reading() as conn:
+                cursor = conn.cursor()
                 cursor.execute('SELECT address FROM account_balances')
-                return [row[0] for row in cursor.fetchall()]
+                rows = cursor.fetchall()
         except Exception as e:
-            print(f"获取所有账户失败: {e}")
-            return []
+            logger.error("获取所有账户失败: %s", e)
+            return iter(())
+        return (row[0] for row in rows)
+    
+    def iter_account_balances(self) -> Iterator[Tuple[str, float]]:
+        """一次查询返回全部(地址, 余额)"""
+        try:
+            with self._reading() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT address, balance FROM account_balances')
+                rows = cursor.fetchall()
+        except Exception as e:
+            logger.error("获取所有余额失败: %s", e)
+            return iter(())
+        return iter(rows)
     
     def backup_to_file(self, backup_path: str) -> bool:
-        """备份数据到文件"""
+        """
+        备份数据到文件
+        
+        默认使用SQLite在线备份API按页复制为数据库文件；路径以.json或.json.gz结尾时导出为JSON。
+        路径以.gz结尾时gzip压缩。
+        """
+        if backup_path.endswith(('.json', '.json.gz')):
+            return self.export_json(backup_path)
+        
         try:
-            with self.lock:
-                cursor = self.conn.cursor()
-                
-                backup_data = {
-                    'key_value': [],
-                    'blocks': [],
-                    'block_height_index': [],
-                    'transaction_index': [],
-                    'account_balances': [],
-                    'utxos': []
-                }
-                
-                # 备份各表数据
-                for table_name in backup_data.keys():
-                    cursor.execute(f'SELECT * FROM {table_name}')
-                    rows = cursor.fetchall()
-                    
-                    # 获取列名
-                    column_names = [description[0] for description in cursor.description]
-                    
-                    # 转换为字典格式
-                    for row in rows:
-                        row_dict = dict(zip(column_names, row))
-                        
-                        # 处理二进制数据
-                        for key, value in row_dict.items():
-                            if isinstance(value, bytes):
-                                import base64
-                                row_dict[key] = base64.b64encode(value).decode('utf-8')
-                        
-                        backup_data[table_name].append(row_dict)
-                
-                # 写入备份文件
-                with open(backup_path, 'w', encoding='utf-8') as f:
-                    json.dump(backup_data, f, indent=2, ensure_ascii=False)
+            if not backup_path.endswith('.gz'):
+                self._backup_database(backup_path)
+            else:
+                with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(backup_path))) as tmp_dir:
+                    tmp_path = os.path.join(tmp_dir, 'backup.db')
+                    self._backup_database(tmp_path)
+                    with open(tmp_path, 'rb') as src, open_file(backup_path, 'wb') as dst:
+                        shutil.copyfileobj(src, dst)
+            
+            logger.debug("数据已备份到: %s", backup_path)
+            return True
+            
+        except Exception as e:
+            logger.error("备份失败: %s", e)
+            return False
+    
+    def _backup_database(self, path: str) -> None:
+        """用在线备份API把数据库复制到path（只读连接上一步完成，得到一致的快照且不阻塞写入）"""
+        if os.path.exists(path):
+            os.remove(path)
+        dst = sqlite3.connect(path)
+        try:
+            with self._reading() as conn:
+                conn.backup(dst)
+        finally:
+            dst.close()
+    
+    def export_json(self, export_path: str) -> bool:
+        """各表逐行流式导出为JSON，路径以.gz结尾时gzip压缩"""
+        tables = ('key_value', 'blocks', 'block_height_index', 'transaction_index',
+                  'account_balances', 'utxos')
+        try:
+            with self._reading() as conn:
+                # 只读连接上在一个读事务内导出各表，得到一致的快照且不阻塞写入
+                snapshot = conn is not self.conn
+                if snapshot:
+                    conn.execute("BEGIN")
+                try:
+                    with open_file(export_path, 'wb') as f:
+                        dump_json_stream(f, ((table_name, self._iter_table_rows(conn, table_name))
+                                             for table_name in tables))
+                finally:
+                    if snapshot:
+                        conn.execute("COMMIT")
                 
-                print(f"✅ 数据已备份到: {backup_path}")
+                logger.debug("数据已导出到: %s", export_path)
                 return True
                 
         except Exception as e:
-            print(f"备份失败: {e}")
+            logger.error("备份失败: %s", e)
             return False
     
+    def _iter_table_rows(self, conn: sqlite3.Connection, table_name: str) -> Iterator[Dict[str, Any]]:
+        """逐行读取表数据为字典，二进制列编码为base64"""
+        cursor = conn.cursor()
+        cursor.execute(f'SELECT * FROM {table_name}')
+        column_names = [description[0] for description in cursor.description]
+        
+        for row in cursor:
+            row_dict = dict(zip(column_names, row))
+            for key, value in row_dict.items():
+                if isinstance(value, bytes):
+                    row_dict[key] = base64.b64encode(value).decode('ascii')
+            yield row_dict
+    
+    def _restore_database(self, backup_path: str) -> None:
+        """用在线备份API把备份数据库复制回当前数据库（.gz备份先解压到临时文件）"""
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(backup_path))) as tmp_dir:
+            if backup_path.endswith('.gz'):
+                source_path = os.path.join(tmp_dir, 'restore.db')
+                with open_file(backup_path, 'rb') as src, open(source_path, 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+            else:
+                source_path = backup_path
+            
+            source = sqlite3.connect(source_path)
+            try:
+                with self.lock:
+                    source.backup(self.conn)
+                    # 旧版本的备份可能缺少新增的索引
+                    self._create_tables()
+            finally:
+                source.close()
+    
+    @staticmethod
+    def _decode_backup_row(row_dict: Dict[str, Any], columns: List[str],
+                           binary_positions: List[int]) -> List[Any]:
+        """按列顺序取出一行的值，并解码base64编码的二进制列"""
+        values = [row_dict[col] for col in columns]
+        for i in binary_positions:
+            if isinstance(values[i], str):
+                try:
+                    values[i] = base64.b64decode(values[i])
+                except ValueError:
+                    pass
+        return values
+    
     def restore_from_file(self, backup_path: str) -> bool:
-        """从文件恢复数据"""
+        """从文件恢复数据（自动识别数据库文件备份和JSON备份）"""
         try:
-            with open(backup_path, 'r', encoding='utf-8') as f:
-                backup_data = json.load(f)
+            with open_file(backup_path, 'rb') as f:
+                if f.read(len(SQLITE_HEADER)) == SQLITE_HEADER:
+                    self._restore_database(backup_path)
+                    logger.debug("数据已从备份恢复: %s", backup_path)
+                    return True
+                f.seek(0)
+                backup_data = json_loads(f.read())
             
             with self.lock:
-                cursor = self.conn.cursor()
-                
-                # 清空现有数据
-                for table_name in backup_data.keys():
-                    cursor.execute(f'DELETE FROM {table_name}')
-                
-                # 恢复数据
-                for table_name, rows in backup_data.items():
-                    if not rows:
-                        continue
-                    
-                    # 获取列名
-                    columns = list(rows[0].keys())
-                    placeholders = ', '.join(['?' for _ in columns])
-                    
-                    for row_dict in rows:
-                        # 处理base64编码的二进制数据
-                        values = []
-                        for col in columns:
-                            value = row_dict[col]
-                            if col in ['value', 'block_data', 'utxo_data'] and isinstance(value, str):
-                                import base64
-                                try:
-                                    value = base64.b64decode(value.encode('utf-8'))
-                                except:
-                                    pass
-                            values.append(value)
+                # 恢复期间关闭同步：失败时整个事务回滚，而中途崩溃可用同一备份重新恢复
+                self.conn.execute("PRAGMA synchronous=OFF")
+                try:
+                    # 清空和写入都在同一个事务内，失败时不会留下清空了一半的表
+                    with self.write_batch():
+                        cursor = self.conn.cursor()
+                        
+                        # 清空现有数据
+                        for table_name in backup_data.keys():
+                            cursor.execute(f'DELETE FROM {table_name}')
                         
-                        cursor.execute(
-                            f'INSERT INTO {table_name} ({", ".join(columns)}) VALUES ({placeholders})',
-                            values
-                        )
+                        # 恢复数据
+                        for table_name, rows in backup_data.items():
+                            if not rows:
+                                continue
+                            
+                            # 获取列名，二进制列的位置每个表只计算一次
+                            columns = list(rows[0].keys())
+                            placeholders = ', '.join(['?' for _ in columns])
+                            binary_positions = [i for i, col in enumerate(columns) if col in BINARY_COLUMNS]
+                            
+                            cursor.executemany(
+                                f'INSERT INTO {table_name} ({", ".join(columns)}) VALUES ({placeholders})',
+                                (self._decode_backup_row(row_dict, columns, binary_positions) for row_dict in rows)
+                            )
+                finally:
+                    self.conn.execute("PRAGMA synchronous=NORMAL")
                 
-                self.conn.commit()
-                print(f"✅ 数据已从备份恢复: {backup_path}")
+                logger.debug("数据已从备份恢复: %s", backup_path)
                 return True
                 
         except Exception as e:
-            print(f"恢复失败: {e}")
+            logger.error("恢复失败: %s", e)
             return False 
\ No newline at end of file
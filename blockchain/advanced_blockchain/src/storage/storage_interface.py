@@ -58,8 +58,9 @@ class BlockStorageInterface(ABC):
     """区块存储接口"""
     
     @abstractmethod
-    def store_block(self, block_hash: str, block_data: bytes) -> bool:
-        """存储区块"""
+    def store_block(self, block_hash: str, block_data: bytes,
+                    block_height: Optional[int] = None) -> bool:
+        """存储区块（block_height为区块高度，由调用方直接给出）"""
         pass
     
     @abstractmethod
@@ -1,11 +1,17 @@
 """
 存储管理器 - 统一管理区块链数据存储
 """
-import json
+import logging
+import queue
+import threading
 import time
-from typing import Optional, List, Dict, Any
+from contextlib import contextmanager
+from typing import Optional, List, Dict, Any, Iterator, Tuple
 from ..core.block import Block
 from ..core.transaction import Transaction
+from ..utils.serialization import pack, unpack, dump_json_stream, open_file, MSGPACK_AVAILABLE
+
+logger = logging.getLogger(__name__)
 
 # 尝试导入不同的存储后端
 try:
@@ -13,11 +19,26 @@ try:
     LEVELDB_AVAILABLE = True
 except ImportError:
     LEVELDB_AVAILABLE = False
-    print("⚠️ LevelDB不可用，将使用SQLite存储")
+    logger.warning("LevelDB不可用，将使用SQLite存储")
 
 from .sqlite_storage import SQLiteStorage
 from .distributed_storage import DistributedStorage
 
+# 异步写入队列的容量（队列满时写入方等待）和后台线程每次合并提交的最大写操作数
+WRITE_QUEUE_SIZE = 10000
+WRITE_BATCH_MAX = 1000
+# flush()报告的失败键最多保留的个数（失败总数另外计数）
+WRITE_FAILURE_KEYS = 100
+
+
+class AsyncWriteError(IOError):
+    """自上次flush()以来有异步写操作未能提交"""
+    
+    def __init__(self, count: int, keys: List[str]):
+        super().__init__(f"{count} 个异步写操作失败: {', '.join(keys)}")
+        self.count = count
+        self.keys = keys
+
 
 class StorageManager:
     """存储管理器 - 为区块链提供统一的存储接口"""
@@ -32,6 +53,7 @@ class StorageManager:
                 'type': 'leveldb' | 'sqlite' | 'distributed',
                 'path': './blockchain_data',
                 'compression': 'snappy',
+                'leveldb_options': {'write_buffer_size': ..., 'lru_cache_size': ...},
                 'distributed': {
                     'peers': ['http://node1:5000'],
                     'replication_factor': 2,
@@ -44,7 +66,7 @@ class StorageManager:
         
         # 如果指定了LevelDB但不可用，则降级到SQLite
         if self.storage_type == 'leveldb' and not LEVELDB_AVAILABLE:
-            print("⚠️ LevelDB不可用，自动切换到SQLite存储")
+            logger.warning("LevelDB不可用，自动切换到SQLite存储")
             self.storage_type = 'sqlite'
             storage_config['type'] = 'sqlite'
         
@@ -52,7 +74,8 @@ class StorageManager:
         if self.storage_type == 'leveldb' and LEVELDB_AVAILABLE:
             self.local_storage = LevelDBStorage(
                 db_path=storage_config.get('path', './blockchain_data'),
-                compression=storage_config.get('compression', 'snappy')
+                compression=storage_config.get('compression', 'snappy'),
+                **storage_config.get('leveldb_options', {})
             )
         else:
             # 使用SQLite存储
@@ -73,7 +96,98 @@ class StorageManager:
         else:
             self.storage = self.local_storage
         
-        print(f"✅ 存储管理器已初始化 (类型: {self.storage_type})")
+        # 异步写入：(操作, 键, 值)，由后台线程合并为批次提交，首次使用时启动
+        self._write_queue: queue.Queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+        self._writer_thread: Optional[threading.Thread] = None
+        self._writer_lock = threading.Lock()
+        # 自上次flush()以来失败的异步写操作数和部分失败的键
+        self._write_failures = 0
+        self._write_failure_keys: List[str] = []
+        
+        logger.debug("存储管理器已初始化 (类型: %s)", self.storage_type)
+    
+    # ========== 批量写入 ==========
+    
+    @contextmanager
+    def batch(self):
+        """把上下文内的写操作合并为一次原子提交（本地存储不支持批量写入时逐条写入）"""
+        write_batch = getattr(self.local_storage, 'write_batch', None)
+        if write_batch is None:
+            yield
+            return
+        
+        with write_batch():
+            yield
+    
+    # ========== 异步写入 ==========
+    
+    def put_async(self, key: str, value: bytes) -> None:
+        """把写入放入异步队列后立即返回，调用flush()后保证已提交"""
+        self._enqueue_write(('put', key, value))
+    
+    def delete_async(self, key: str) -> None:
+        """把删除放入异步队列后立即返回，调用flush()后保证已提交"""
+        self._enqueue_write(('delete', key, None))
+    
+    def flush(self) -> None:
+        """等待异步队列中已有的写操作全部提交，自上次flush()以来有写操作失败时抛出AsyncWriteError"""
+        if self._writer_thread is None:
+            return
+        self._write_queue.join()
+        
+        with self._writer_lock:
+            count, keys = self._write_failures, self._write_failure_keys
+            self._write_failures, self._write_failure_keys = 0, []
+        if count:
+            raise AsyncWriteError(count, keys)
+    
+    def _record_write_failures(self, keys: List[str]) -> None:
+        with self._writer_lock:
+            self._write_failures += len(keys)
+            room = WRITE_FAILURE_KEYS - len(self._write_failure_keys)
+            self._write_failure_keys.extend(keys[:room])
+    
+    def _enqueue_write(self, operation: Tuple[str, str, Optional[bytes]]) -> None:
+        with self._writer_lock:
+            if self._writer_thread is None:
+                self._writer_thread = threading.Thread(target=self._writer_loop,
+                                                       name="storage-writer", daemon=True)
+                self._writer_thread.start()
+        self._write_queue.put(operation)
+    
+    def _writer_loop(self) -> None:
+        """取出队列中积压的写操作（最多WRITE_BATCH_MAX个），在一个批次中提交；收到None时退出"""
+        while True:
+            operations = [self._write_queue.get()]
+            while len(operations) < WRITE_BATCH_MAX:
+                try:
+                    operations.append(self._write_queue.get_nowait())
+                except queue.Empty:
+                    break
+            
+            stop = None in operations
+            failed = []
+            try:
+                with self.batch():
+                    for operation in operations:
+                        if operation is None:
+                            continue
+                        action, key, value = operation
+                        ok = self.storage.put(key, value) if action == 'put' else self.storage.delete(key)
+                        if not ok:
+                            failed.append(key)
+            except Exception as e:
+                logger.error("异步写入失败（%s 个操作）: %s", len(operations), e)
+                # 批次提交失败，整批都未写入
+                failed = [operation[1] for operation in operations if operation is not None]
+            finally:
+                if failed:
+                    self._record_write_failures(failed)
+                for _ in operations:
+                    self._write_queue.task_done()
+            
+            if stop:
+                return
     
     # ========== 区块存储管理 ==========
     
@@ -81,10 +195,10 @@ class StorageManager:
         """存储区块及其索引"""
         try:
             # 序列化区块数据
-            block_data = json.dumps(block.to_dict()).encode('utf-8')
+            block_data = block.to_bytes()
             
             # 存储区块内容
-            if not self.local_storage.store_block(block.hash, block_data):
+            if not self.local_storage.store_block(block.hash, block_data, block.index):
                 return False
             
             # 存储区块高度索引
@@ -95,12 +209,12 @@ class StorageManager:
             for tx_index, transaction in enumerate(block.transactions):
                 if not self.local_storage.store_transaction_index(
                     transaction.transaction_id, block.hash, tx_index):
-                    print(f"警告: 交易索引存储失败 {transaction.transaction_id}")
+                    logger.warning("交易索引存储失败 %s", transaction.transaction_id)
             
             return True
             
         except Exception as e:
-            print(f"存储区块失败: {e}")
+            logger.error("存储区块失败: %s", e)
             return False
     
     def get_block_by_hash(self, block_hash: str) -> Optional[Block]:
@@ -108,11 +222,10 @@ class StorageManager:
         try:
             block_data = self.local_storage.get_block(block_hash)
             if block_data:
-                block_dict = json.loads(block_data.decode('utf-8'))
-                return Block.from_dict(block_dict)
+                return Block.from_bytes(block_data)
             return None
         except Exception as e:
-            print(f"获取区块失败 {block_hash}: {e}")
+            logger.error("获取区块失败 %s: %s", block_hash, e)
             return None
     
     def get_block_by_height(self, height: int) -> Optional[Block]:
@@ -123,13 +236,56 @@ class StorageManager:
                 return self.get_block_by_hash(block_hash)
             return None
         except Exception as e:
-            print(f"获取区块失败 (高度 {height}): {e}")
+            logger.error("获取区块失败 (高度 %s): %s", height, e)
             return None
     
     def get_latest_block_height(self) -> int:
         """获取最新区块高度"""
         return self.local_storage.get_latest_block_height()
     
+    def get_chain_tip(self) -> Optional[Tuple[int, str]]:
+        """获取最新区块的(高度, 哈希)，不读取区块本身；空链时返回None"""
+        return self.local_storage.get_latest_block_index()
+    
+    def get_chain_snapshot(self) -> Dict[str, Any]:
+        """一次查询获取链尖：高度、最新区块哈希和最新区块（空链时高度为-1）"""
+        latest = self.get_chain_tip()
+        if latest is None:
+            return {'height': -1, 'tip_hash': None, 'tip_block': None}
+        
+        height, tip_hash = latest
+        return {
+            'height': height,
+            'tip_hash': tip_hash,
+            'tip_block': self.get_block_by_hash(tip_hash)
+        }
+    
+    def iter_blocks(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Block]:
+        """按高度顺序逐个读取[start, stop)范围内的区块（stop为None时到最新区块），内存中只保留当前区块"""
+        end = self.get_latest_block_height() + 1
+        if stop is not None:
+            end = min(end, stop)
+        for height in range(start, end):
+            block = self.get_block_by_height(height)
+            if block:
+                yield block
+    
+    def iter_block_dicts(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        按高度顺序逐个读取区块的字典形式
+        
+        存储的数据就是Block.to_dict()的序列化结果，直接解码即可，
+        不构造Block对象（省去重新计算Merkle根和区块哈希）。
+        """
+        end = self.get_latest_block_height() + 1
+        if stop is not None:
+            end = min(end, stop)
+        for height in range(start, end):
+            block_hash = self.local_storage.get_block_hash_by_height(height)
+            block_data = self.local_storage.get_block(block_hash) if block_hash else None
+            if block_data:
+                yield unpack(block_data)
+    
     # ========== 交易存储管理 ==========
     
     def get_transaction_by_hash(self, tx_hash: str) -> Optional[tuple]:
@@ -143,7 +299,7 @@ class StorageManager:
                     return block.transactions[tx_index], block.index
             return None
         except Exception as e:
-            print(f"获取交易失败 {tx_hash}: {e}")
+            logger.error("获取交易失败 %s: %s", tx_hash, e)
             return None
     
     # ========== 状态存储管理 ==========
@@ -159,7 +315,7 @@ class StorageManager:
             return success_count == len(balances)
             
         except Exception as e:
-            print(f"存储余额失败: {e}")
+            logger.error("存储余额失败: %s", e)
             return False
     
     def get_balance(self, address: str) -> float:
@@ -171,13 +327,11 @@ class StorageManager:
         """获取所有账户余额"""
         balances = {}
         try:
-            accounts = self.local_storage.get_all_accounts()
-            for address in accounts:
-                balance = self.get_balance(address)
+            for address, balance in self.local_storage.iter_account_balances():
                 if balance > 0:
                     balances[address] = balance
         except Exception as e:
-            print(f"获取所有余额失败: {e}")
+            logger.error("获取所有余额失败: %s", e)
         
         return balances
     
@@ -186,10 +340,9 @@ class StorageManager:
     def store_blockchain_metadata(self, metadata: Dict[str, Any]) -> bool:
         """存储区块链元数据"""
         try:
-            metadata_json = json.dumps(metadata).encode('utf-8')
-            return self.storage.put("blockchain:metadata", metadata_json)
+            return self.storage.put("blockchain:metadata", pack(metadata))
         except Exception as e:
-            print(f"存储元数据失败: {e}")
+            logger.error("存储元数据失败: %s", e)
             return False
     
     def get_blockchain_metadata(self) -> Dict[str, Any]:
@@ -197,9 +350,9 @@ class StorageManager:
         try:
             data = self.storage.get("blockchain:metadata")
             if data:
-                return json.loads(data.decode('utf-8'))
+                return unpack(data)
         except Exception as e:
-            print(f"获取元数据失败: {e}")
+            logger.error("获取元数据失败: %s", e)
         
         return {
             'difficulty': 4,
@@ -224,38 +377,39 @@ class StorageManager:
     # ========== 数据同步与备份 ==========
     
     def export_blockchain_data(self, export_path: str) -> bool:
-        """导出区块链数据"""
+        """导出区块链数据（扩展名为.msgpack时导出为msgpack二进制格式，否则为JSON；再加.gz时gzip压缩）"""
         try:
-            export_data = {
-                'metadata': self.get_blockchain_metadata(),
-                'blocks': [],
-                'balances': self.get_all_balances(),
-                'export_time': time.time()
-            }
-            
-            # 导出所有区块
-            latest_height = self.get_latest_block_height()
-            for height in range(latest_height + 1):
-                block = self.get_block_by_height(height)
-                if block:
-                    export_data['blocks'].append(block.to_dict())
-            
-            # 写入文件
-            with open(export_path, 'w', encoding='utf-8') as f:
-                json.dump(export_data, f, indent=2, ensure_ascii=False)
+            if export_path.endswith(('.msgpack', '.msgpack.gz')) and MSGPACK_AVAILABLE:
+                export_data = {
+                    'metadata': self.get_blockchain_metadata(),
+                    'blocks': list(self.iter_block_dicts()),
+                    'balances': self.get_all_balances(),
+                    'export_time': time.time()
+                }
+                with open_file(export_path, 'wb') as f:
+                    f.write(pack(export_data))
+            else:
+                # JSON导出逐个区块流式写入
+                with open_file(export_path, 'wb') as f:
+                    dump_json_stream(f, [
+                        ('metadata', self.get_blockchain_metadata()),
+                        ('blocks', self.iter_block_dicts()),
+                        ('balances', self.get_all_balances()),
+                        ('export_time', time.time())
+                    ])
             
-            print(f"✅ 区块链数据已导出到: {export_path}")
+            logger.debug("区块链数据已导出到: %s", export_path)
             return True
             
         except Exception as e:
-            print(f"导出数据失败: {e}")
+            logger.error("导出数据失败: %s", e)
             return False
     
     def import_blockchain_data(self, import_path: str) -> bool:
         """导入区块链数据"""
         try:
-            with open(import_path, 'r', encoding='utf-8') as f:
-                import_data = json.load(f)
+            with open_file(import_path, 'rb') as f:
+                import_data = unpack(f.read())
             
             # 导入元数据
             if 'metadata' in import_data:
@@ -271,11 +425,11 @@ class StorageManager:
             if 'balances' in import_data:
                 self.store_balances(import_data['balances'])
             
-            print(f"✅ 区块链数据已从文件导入: {import_path}")
+            logger.debug("区块链数据已从文件导入: %s", import_path)
             return True
             
         except Exception as e:
-            print(f"导入数据失败: {e}")
+            logger.error("导入数据失败: %s", e)
             return False
     
     def backup_storage(self, backup_path: str) -> bool:
@@ -321,7 +475,7 @@ class StorageManager:
                     cursor.execute('DELETE FROM blocks WHERE block_height < ?', (cleanup_height,))
                     self.local_storage.conn.commit()
                     
-                    print(f"✅ 已清理高度小于 {cleanup_height} 的旧区块")
+                    logger.debug("已清理高度小于 %s 的旧区块", cleanup_height)
                     return True
             else:  # LevelDB
                 delete_keys = []
@@ -331,14 +485,18 @@ class StorageManager:
                 
                 result = self.storage.batch_delete(delete_keys)
                 if result:
-                    print(f"✅ 已清理 {len(delete_keys)} 个旧区块索引")
+                    logger.debug("已清理 %s 个旧区块索引", len(delete_keys))
                 return result
             
         except Exception as e:
-            print(f"清理数据失败: {e}")
+            logger.error("清理数据失败: %s", e)
             return False
     
     def close(self) -> None:
-        """关闭存储管理器"""
+        """关闭存储管理器（先提交异步队列中的写操作）"""
+        if self._writer_thread is not None:
+            self._write_queue.put(None)
+            self._writer_thread.join()
+            self._writer_thread = None
         self.storage.close()
-        print("✅ 存储管理器已关闭") 
\ No newline at end of file
+        logger.debug("存储管理器已关闭") 
\ No newline at end of file
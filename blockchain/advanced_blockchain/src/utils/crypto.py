@@ -2,10 +2,36 @@
 加密和签名工具模块
 """
 import hashlib
+import os
 import ecdsa
 import base58
 import secrets
-from typing import Tuple, Optional
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Tuple, Optional, Iterable, List, Sequence, Union
+
+# 尝试导入coincurve（libsecp256k1绑定），用于加速签名验证
+try:
+    import coincurve
+    from coincurve.ecdsa import deserialize_compact, cdata_to_der
+    COINCURVE_AVAILABLE = True
+except ImportError:
+    coincurve = None
+    COINCURVE_AVAILABLE = False
+
+SECP256K1_ORDER = ecdsa.SECP256k1.order
+
+# 签名验证结果缓存的条目数
+VERIFY_CACHE_SIZE = 65536
+# 批量验证的签名数达到该值时分块交给线程池并行验证（libsecp256k1调用期间释放GIL）
+PARALLEL_VERIFY_MIN = 256
+
+_verify_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _to_bytes(data: Union[str, bytes]) -> bytes:
+    """字符串按UTF-8编码，字节串原样返回"""
+    return data.encode('utf-8') if isinstance(data, str) else data
 
 
 class CryptoUtils:
@@ -60,23 +86,36 @@ class CryptoUtils:
         return base58.b58encode(address_bytes).decode()
     
     @staticmethod
-    def sign_data(data: str, private_key_hex: str) -> str:
+    def sign_data(data: Union[str, bytes], private_key_hex: str) -> str:
         """对数据进行签名"""
         private_key_bytes = bytes.fromhex(private_key_hex)
         private_key = ecdsa.SigningKey.from_string(private_key_bytes, curve=ecdsa.SECP256k1)
         
-        data_hash = hashlib.sha256(data.encode('utf-8')).digest()
+        data_hash = hashlib.sha256(_to_bytes(data)).digest()
         signature = private_key.sign(data_hash)
         return signature.hex()
     
     @staticmethod
-    def verify_signature(data: str, signature_hex: str, public_key_hex: str) -> bool:
-        """验证签名"""
+    def verify_signature(data: Union[str, bytes], signature_hex: str, public_key_hex: str) -> bool:
+        """
+        验证签名
+        
+        结果按(数据, 签名, 公钥)缓存：同一笔交易在入池、打包和验证区块时会被多次验证，
+        缓存键包含被签名的数据本身，交易字段被修改后不会命中旧结果。
+        """
+        return _verify_signature_cached(_to_bytes(data), signature_hex, public_key_hex)
+    
+    @staticmethod
+    def _verify_signature_uncached(data: bytes, signature_hex: str, public_key_hex: str) -> bool:
+        """不经缓存验证签名"""
+        if COINCURVE_AVAILABLE:
+            return CryptoUtils._verify_with_secp256k1(data, signature_hex, public_key_hex)
+        
         try:
             public_key_bytes = bytes.fromhex(public_key_hex)
             public_key = ecdsa.VerifyingKey.from_string(public_key_bytes, curve=ecdsa.SECP256k1)
             
-            data_hash = hashlib.sha256(data.encode('utf-8')).digest()
+            data_hash = hashlib.sha256(_to_bytes(data)).digest()
             signature_bytes = bytes.fromhex(signature_hex)
             
             public_key.verify(signature_bytes, data_hash)
@@ -84,12 +123,87 @@ class CryptoUtils:
         except Exception:
             return False
     
+    @staticmethod
+    def _verify_with_secp256k1(data: Union[str, bytes], signature_hex: str, public_key_hex: str) -> bool:
+        """
+        使用libsecp256k1验证ecdsa库生成的签名
+        
+        ecdsa的sign()会对传入的SHA-256摘要再做一次SHA-1，签名的消息值为该SHA-1摘要（160位，不截断），
+        左侧补零到32字节后数值不变。libsecp256k1只接受low-S签名，而(r, s)与(r, n-s)等价，验证前先规范化。
+        """
+        try:
+            signature_bytes = bytes.fromhex(signature_hex)
+            if len(signature_bytes) != 64:
+                return False
+            
+            r = int.from_bytes(signature_bytes[:32], 'big')
+            s = int.from_bytes(signature_bytes[32:], 'big')
+            if s > SECP256K1_ORDER // 2:
+                s = SECP256K1_ORDER - s
+            compact = r.to_bytes(32, 'big') + s.to_bytes(32, 'big')
+            
+            public_key = coincurve.PublicKey(b'\x04' + bytes.fromhex(public_key_hex))
+            data_hash = hashlib.sha256(_to_bytes(data)).digest()
+            message = hashlib.sha1(data_hash).digest().rjust(32, b'\x00')
+            
+            return public_key.verify(cdata_to_der(deserialize_compact(compact)), message, hasher=None)
+        except Exception:
+            return False
+    
+    @staticmethod
+    def verify_batch(items: Iterable[Tuple[str, str, str]]) -> bool:
+        """批量验证签名，items为(数据, 签名, 公钥)，全部有效时返回True；重复的条目只验证一次"""
+        unique = list(set(items))
+        if _parallel_workers(len(unique)) > 1:
+            return all(CryptoUtils.verify_signatures_batch(unique))
+        return all(CryptoUtils.verify_signature(data, signature_hex, public_key_hex)
+                   for data, signature_hex, public_key_hex in unique)
+    
+    @staticmethod
+    def verify_signatures_batch(items: Sequence[Tuple[str, str, str]]) -> List[bool]:
+        """批量验证签名，items为(数据, 签名, 公钥)，返回每一条的验证结果；重复的条目只验证一次"""
+        unique = list(dict.fromkeys(items))
+        workers = _parallel_workers(len(unique))
+        if workers > 1:
+            chunk = -(-len(unique) // workers)
+            chunks = [unique[i:i + chunk] for i in range(0, len(unique), chunk)]
+            verified = [ok for part in _get_verify_executor().map(_verify_chunk, chunks) for ok in part]
+        else:
+            verified = _verify_chunk(unique)
+        
+        results = dict(zip(unique, verified))
+        return [results[item] for item in items]
+    
     @staticmethod
     def generate_nonce() -> str:
         """生成随机nonce"""
         return secrets.token_hex(16)
 
 
+def _parallel_workers(count: int) -> int:
+    """批量验证使用的线程数，条目少、只有一个CPU或没有libsecp256k1时为1"""
+    if not COINCURVE_AVAILABLE or count < PARALLEL_VERIFY_MIN:
+        return 1
+    return min(os.cpu_count() or 1, count // (PARALLEL_VERIFY_MIN // 4))
+
+
+def _get_verify_executor() -> ThreadPoolExecutor:
+    global _verify_executor
+    if _verify_executor is None:
+        _verify_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1,
+                                              thread_name_prefix="verify")
+    return _verify_executor
+
+
+def _verify_chunk(items: Sequence[Tuple[str, str, str]]) -> List[bool]:
+    return [CryptoUtils.verify_signature(*item) for item in items]
+
+
+@lru_cache(maxsize=VERIFY_CACHE_SIZE)
+def _verify_signature_cached(data: bytes, signature_hex: str, public_key_hex: str) -> bool:
+    return CryptoUtils._verify_signature_uncached(data, signature_hex, public_key_hex)
+
+
 class Wallet:
     """数字钱包类"""
     
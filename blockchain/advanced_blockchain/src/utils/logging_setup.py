@@ -0,0 +1,38 @@
+"""
+日志配置模块
+"""
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+DEFAULT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+_listener: Optional[QueueListener] = None
+
+
+def setup_logging(level: str = "INFO", fmt: str = DEFAULT_FORMAT) -> QueueListener:
+    """
+    配置根日志器为异步输出
+
+    调用方线程只把日志记录放入队列，格式化和写stdout由QueueListener的后台线程完成，
+    挖矿和存储路径上不会因为终端输出而阻塞。重复调用时只更新日志级别。
+    """
+    global _listener
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    if _listener is not None:
+        return _listener
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(fmt))
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    root.addHandler(QueueHandler(log_queue))
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
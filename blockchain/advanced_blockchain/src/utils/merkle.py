@@ -2,14 +2,27 @@
 Merkle树实现
 """
 import hashlib
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterable, Tuple
+
+
+def _hash_pairs(level: List[str]) -> List[str]:
+    """两两计算一层相邻节点（偶数个）的父节点哈希"""
+    sha256 = hashlib.sha256
+    return [sha256((left + right).encode('utf-8')).hexdigest()
+            for left, right in zip(level[0::2], level[1::2])]
 
 
 class MerkleTree:
     """Merkle树类"""
     
-    def __init__(self, transactions: List[str]):
+    def __init__(self, transactions: List[str], prehashed: bool = False):
+        """
+        Args:
+            transactions: 叶子数据列表
+            prehashed: 为True时transactions已经是叶子哈希，不再重复计算
+        """
         self.transactions = transactions
+        self.prehashed = prehashed
         self.tree_levels = []
         self.root = self._build_tree()
     
@@ -23,29 +36,32 @@ class MerkleTree:
             return None
         
         # 计算叶子节点
-        current_level = [self._hash_data(tx) for tx in self.transactions]
+        if self.prehashed:
+            current_level = list(self.transactions)
+        else:
+            current_level = [self._hash_data(tx) for tx in self.transactions]
         self.tree_levels.append(current_level[:])
         
         # 构建树的每一层
         while len(current_level) > 1:
-            next_level = []
-            
             # 如果节点数为奇数，复制最后一个节点
             if len(current_level) % 2 == 1:
                 current_level.append(current_level[-1])
             
             # 两两组合计算父节点
-            for i in range(0, len(current_level), 2):
-                left = current_level[i]
-                right = current_level[i + 1]
-                parent_hash = self._hash_data(left + right)
-                next_level.append(parent_hash)
-            
-            current_level = next_level
+            current_level = _hash_pairs(current_level)
             self.tree_levels.append(current_level[:])
         
         return current_level[0] if current_level else None
     
+    @staticmethod
+    def compute_root_from_hashes(leaf_hashes: Iterable[str]) -> Optional[str]:
+        """根据已计算的叶子哈希计算Merkle根"""
+        streaming = StreamingMerkle()
+        for leaf_hash in leaf_hashes:
+            streaming.push(leaf_hash)
+        return streaming.root()
+    
     def get_merkle_path(self, transaction_index: int) -> List[Dict[str, Any]]:
         """获取交易的Merkle路径（用于SPV验证）"""
         if transaction_index >= len(self.transactions):
@@ -81,10 +97,15 @@ class MerkleTree:
     def verify_transaction(self, transaction: str, transaction_index: int, 
                           merkle_path: List[Dict[str, Any]]) -> bool:
         """验证交易是否在Merkle树中"""
+        return self.verify_leaf(self._hash_data(transaction), transaction_index, merkle_path)
+    
+    def verify_leaf(self, leaf_hash: str, transaction_index: int,
+                    merkle_path: List[Dict[str, Any]]) -> bool:
+        """根据叶子哈希验证其是否在Merkle树中"""
         if not merkle_path:
             return False
         
-        current_hash = self._hash_data(transaction)
+        current_hash = leaf_hash
         
         # 沿着Merkle路径计算根哈希
         for step in merkle_path:
@@ -105,4 +126,44 @@ class MerkleTree:
             'transaction_count': len(self.transactions),
             'tree_depth': len(self.tree_levels),
             'tree_levels': self.tree_levels
-        } 
\ No newline at end of file
+        }
+
+
+class StreamingMerkle:
+    """流式Merkle根计算（leading edge），只保存O(log n)个未合并的子树根"""
+    
+    def __init__(self):
+        # (子树高度, 子树根哈希)，自底向上高度严格递减
+        self.stack: List[Tuple[int, str]] = []
+        self.leaf_count = 0
+    
+    @staticmethod
+    def _hash_pair(left: str, right: str) -> str:
+        """计算父节点哈希"""
+        return hashlib.sha256((left + right).encode('utf-8')).hexdigest()
+    
+    def push(self, leaf_hash: str) -> None:
+        """追加一个叶子哈希，与栈顶同高度的子树逐级合并"""
+        height, node = 0, leaf_hash
+        while self.stack and self.stack[-1][0] == height:
+            _, left = self.stack.pop()
+            node = self._hash_pair(left, node)
+            height += 1
+        self.stack.append((height, node))
+        self.leaf_count += 1
+    
+    def root(self) -> Optional[str]:
+        """计算当前的Merkle根（奇数节点与自身配对，与MerkleTree一致）"""
+        if not self.stack:
+            return None
+        
+        height, node = self.stack[-1]
+        for left_height, left in reversed(self.stack[:-1]):
+            # 右侧不完整的子树在每一层都是最后一个奇数节点，与自身配对提升
+            while height < left_height:
+                node = self._hash_pair(node, node)
+                height += 1
+            node = self._hash_pair(left, node)
+            height += 1
+        
+        return node
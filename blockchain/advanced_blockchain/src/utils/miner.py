@@ -0,0 +1,231 @@
+"""
+工作量证明挖矿模块
+"""
+import logging
+import os
+import queue
+import hashlib
+import threading
+import multiprocessing
+from functools import lru_cache
+from typing import Any, Optional, Tuple, Callable
+
+logger = logging.getLogger(__name__)
+
+# 每批nonce只有十进制末尾LANE_DIGITS位不同，共LANES条lane
+LANE_DIGITS = 2
+LANES = 10 ** LANE_DIGITS
+
+# 多进程挖矿：每个进程每次扫描PARALLEL_CHUNK个nonce后检查是否已有进程找到解
+PARALLEL_CHUNK = LANES * 1024
+# 低于该难度时期望尝试次数太少，不值得启动子进程
+PARALLEL_DIFFICULTY = 5
+# 等待子进程结果时检查子进程是否存活的间隔（秒）
+WORKER_POLL_INTERVAL = 1.0
+
+
+@lru_cache(maxsize=None)
+def difficulty_target(difficulty: int) -> bytes:
+    """
+    计算难度对应的哈希上界
+
+    哈希的前difficulty个十六进制位为0，等价于其256位大端整数小于 2^(256-4*difficulty)，
+    两边都用32字节大端表示时，可以直接用bytes比较（memcmp）代替十六进制前缀判断。
+    """
+    return (1 << (256 - 4 * difficulty)).to_bytes(32, 'big')
+
+
+class MiningProgress:
+    """挖矿进度：挖矿循环每批写入当前nonce，其他线程只读采样"""
+    
+    def __init__(self, start_nonce: int = 0):
+        self.start_nonce = start_nonce
+        self.nonce = start_nonce
+    
+    @property
+    def attempts(self) -> int:
+        """已尝试的nonce个数"""
+        return self.nonce - self.start_nonce
+
+
+class ProgressReporter:
+    """后台进度报告线程，每隔interval秒采样一次挖矿进度，挖矿循环本身不做任何输出"""
+    
+    def __init__(self, progress: MiningProgress, report: Callable[[MiningProgress], None],
+                 interval: float = 1.0):
+        self.progress = progress
+        self.report = report
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+    
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            self.report(self.progress)
+    
+    def __enter__(self) -> 'ProgressReporter':
+        self._thread.start()
+        return self
+    
+    def __exit__(self, *exc_info) -> None:
+        self._stop_event.set()
+        self._thread.join()
+
+
+def mine(prefix: bytes, suffix: bytes, difficulty: int,
+         start_nonce: int = 0, end_nonce: Optional[int] = None,
+         progress: Optional[MiningProgress] = None,
+         midstate: Optional[Any] = None) -> Optional[Tuple[int, str]]:
+    """
+    在 [start_nonce, end_nonce) 范围内搜索满足难度的nonce
+
+    区块头的布局为 prefix + str(nonce) + suffix，prefix在整个搜索过程中不变，
+    因此只对其做一次SHA-256吸收（midstate），每次尝试只需复制状态并追加nonce部分。
+    nonce按LANES个一批处理：同一批的nonce共享除末尾LANE_DIGITS位以外的全部数字，
+    这部分只编码和吸收一次，每条lane只追加自己的末尾数字。
+    各lane追加的尾部（补零的末尾数字 + suffix）在搜索开始前预先构造好，循环中不再拼接。
+    难度判断直接比较原始摘要与目标上界，只有找到解时才转换为十六进制。
+
+    Args:
+        prefix: nonce之前的固定区块头字节
+        suffix: nonce之后的固定区块头字节
+        difficulty: 哈希前导零（十六进制位）个数
+        start_nonce: 起始nonce
+        end_nonce: 结束nonce（不包含），None表示不限
+        progress: 进度对象，每批nonce更新一次当前nonce（供ProgressReporter采样）
+        midstate: 已吸收prefix的SHA-256状态（如区块缓存的头部midstate），只复制不修改；
+            None时由prefix计算
+
+    Returns:
+        (nonce, 十六进制哈希)，在范围内未找到时返回None
+    """
+    def in_range(n: int) -> bool:
+        return end_nonce is None or n < end_nonce
+
+    if difficulty <= 0:
+        if not in_range(start_nonce):
+            return None
+        return start_nonce, hashlib.sha256(prefix + str(start_nonce).encode() + suffix).hexdigest()
+
+    target = difficulty_target(difficulty)
+    if midstate is None:
+        midstate = hashlib.sha256(prefix)
+    lane_tails = tuple(f"{lane:0{LANE_DIGITS}d}".encode() + suffix for lane in range(LANES))
+
+    def try_nonce(n: int) -> Optional[str]:
+        state = midstate.copy()
+        state.update(str(n).encode() + suffix)
+        return state.hexdigest() if state.digest() < target else None
+
+    if progress is None:
+        progress = MiningProgress(start_nonce)
+    
+    nonce = start_nonce
+
+    # 逐个处理到LANES的整数倍（且不小于LANES），之后每批nonce的高位数字相同
+    while in_range(nonce) and (nonce < LANES or nonce % LANES):
+        digest = try_nonce(nonce)
+        if digest:
+            return nonce, digest
+        nonce += 1
+
+    while end_nonce is None or nonce + LANES <= end_nonce:
+        batch = midstate.copy()
+        batch.update(str(nonce // LANES).encode())
+
+        for lane, tail in enumerate(lane_tails):
+            state = batch.copy()
+            state.update(tail)
+            if state.digest() < target:
+                return nonce + lane, state.hexdigest()
+
+        nonce += LANES
+        progress.nonce = nonce
+
+    # 范围末尾不足一批的nonce
+    while in_range(nonce):
+        digest = try_nonce(nonce)
+        if digest:
+            return nonce, digest
+        nonce += 1
+
+    return None
+
+
+def _mine_worker(prefix: bytes, suffix: bytes, difficulty: int, start_nonce: int,
+                 worker_id: int, workers: int, found, results) -> None:
+    """挖矿子进程：按PARALLEL_CHUNK交错扫描nonce，直到自己或其他进程找到解"""
+    midstate = hashlib.sha256(prefix)
+    chunk_start = start_nonce + worker_id * PARALLEL_CHUNK
+    
+    while not found.is_set():
+        result = mine(prefix, suffix, difficulty, chunk_start, chunk_start + PARALLEL_CHUNK,
+                      midstate=midstate)
+        if result:
+            found.set()
+            results.put(result)
+            return
+        chunk_start += workers * PARALLEL_CHUNK
+
+
+def mine_parallel(prefix: bytes, suffix: bytes, difficulty: int, start_nonce: int = 0,
+                  workers: Optional[int] = None) -> Tuple[int, str]:
+    """
+    多进程搜索满足难度的nonce
+    
+    第i个进程扫描 start_nonce + (k*workers + i)*PARALLEL_CHUNK 开始的各段nonce，
+    各进程的范围互不重叠，除找到解时设置的共享Event外不需要任何通信。
+    返回最先找到的解（不一定是最小的nonce）。难度较低、只有一个CPU或无法创建子进程时
+    退回单进程的mine。
+    
+    Args:
+        prefix: nonce之前的固定区块头字节
+        suffix: nonce之后的固定区块头字节
+        difficulty: 哈希前导零（十六进制位）个数
+        start_nonce: 起始nonce
+        workers: 进程数，None表示使用全部CPU
+    
+    Returns:
+        (nonce, 十六进制哈希)
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or difficulty < PARALLEL_DIFFICULTY:
+        return mine(prefix, suffix, difficulty, start_nonce)
+    
+    found = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(
+            target=_mine_worker,
+            args=(prefix, suffix, difficulty, start_nonce, i, workers, found, results),
+            daemon=True
+        )
+        for i in range(workers)
+    ]
+    
+    started = []
+    try:
+        for process in processes:
+            process.start()
+            started.append(process)
+        while True:
+            try:
+                return results.get(timeout=WORKER_POLL_INTERVAL)
+            except queue.Empty:
+                if any(process.is_alive() for process in started):
+                    continue
+            # 子进程全部退出（被杀死等）且没有结果时单进程挖矿
+            try:
+                return results.get_nowait()
+            except queue.Empty:
+                logger.warning("挖矿子进程全部异常退出，改为单进程挖矿")
+                return mine(prefix, suffix, difficulty, start_nonce)
+    except OSError:
+        # 无法创建子进程时单进程挖矿
+        found.set()
+        return mine(prefix, suffix, difficulty, start_nonce)
+    finally:
+        found.set()
+        for process in started:
+            process.join()
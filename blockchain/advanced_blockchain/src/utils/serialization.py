@@ -0,0 +1,117 @@
+"""
+序列化工具模块
+"""
+import gzip
+import json
+import struct
+from typing import Any, Union, BinaryIO, Iterable, Iterator, Tuple
+
+# 尝试导入orjson，如果不可用则使用标准库json
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+# 尝试导入msgpack，用于存储层的紧凑二进制编码
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    msgpack = None
+    MSGPACK_AVAILABLE = False
+
+
+# 导出/备份文件以.gz结尾时使用的gzip压缩级别（较低级别压缩速度接近磁盘写入速度）
+GZIP_LEVEL = 3
+
+# 二进制备份中每条记录的帧头：键长度、值长度（大端32位无符号整数）
+FRAME_HEADER = struct.Struct('>II')
+
+
+def open_file(path: str, mode: str = 'rb') -> BinaryIO:
+    """以二进制模式打开导出/备份文件，路径以.gz结尾时透明地进行gzip压缩或解压"""
+    if path.endswith('.gz'):
+        return gzip.open(path, mode, compresslevel=GZIP_LEVEL)
+    return open(path, mode)
+
+
+def json_dumps(obj: Any, indent: bool = False) -> bytes:
+    """序列化为UTF-8编码的JSON字节"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(obj, ensure_ascii=False, indent=2 if indent else None).encode('utf-8')
+
+
+def json_loads(data: Union[bytes, str]) -> Any:
+    """从JSON字节或字符串反序列化"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def pack(obj: Any) -> bytes:
+    """序列化为存储格式：msgpack可用时使用msgpack，否则使用紧凑JSON"""
+    if MSGPACK_AVAILABLE:
+        return msgpack.packb(obj, use_bin_type=True)
+    return json_dumps(obj)
+
+
+def unpack(data: bytes) -> Any:
+    """反序列化存储数据，根据首字节区分JSON与msgpack（兼容旧的JSON数据）"""
+    stripped = data.lstrip()
+    if stripped[:1] in (b'{', b'['):
+        return json_loads(data)
+    if not MSGPACK_AVAILABLE:
+        raise ValueError("数据为msgpack格式，但msgpack不可用")
+    return msgpack.unpackb(data, raw=False)
+
+
+def dump_json_stream(f: BinaryIO, fields: Iterable[Tuple[str, Any]]) -> None:
+    """
+    把一个JSON对象流式写入二进制文件
+    
+    fields为(键, 值)序列；值为迭代器时逐个元素序列化并写为数组，
+    不需要先在内存中构建完整的列表。
+    """
+    f.write(b'{')
+    for i, (key, value) in enumerate(fields):
+        if i:
+            f.write(b',')
+        f.write(json_dumps(key) + b':')
+        
+        if isinstance(value, Iterator):
+            f.write(b'[')
+            for j, item in enumerate(value):
+                if j:
+                    f.write(b',')
+                f.write(json_dumps(item))
+            f.write(b']')
+        else:
+            f.write(json_dumps(value))
+    f.write(b'}')
+
+
+def write_frames(f: BinaryIO, items: Iterable[Tuple[bytes, bytes]]) -> None:
+    """把(键, 值)字节对逐条写为 键长度|值长度|键|值 的二进制帧"""
+    for key, value in items:
+        f.write(FRAME_HEADER.pack(len(key), len(value)))
+        f.write(key)
+        f.write(value)
+
+
+def iter_frames(f: BinaryIO) -> Iterator[Tuple[bytes, bytes]]:
+    """逐条读取write_frames写入的(键, 值)字节对"""
+    while True:
+        header = f.read(FRAME_HEADER.size)
+        if not header:
+            return
+        if len(header) < FRAME_HEADER.size:
+            raise ValueError("备份文件被截断")
+        key_len, value_len = FRAME_HEADER.unpack(header)
+        key = f.read(key_len)
+        value = f.read(value_len)
+        if len(key) < key_len or len(value) < value_len:
+            raise ValueError("备份文件被截断")
+        yield key, value
@@ -0,0 +1,185 @@
+"""
+链同步测试
+
+两个节点共享创世区块和初始余额，分别验证追加区块、切换到更长分叉（包括回滚旧记账方式的区块）、写入失败回滚后的余额，以及区块缓存遇到读不到的高度时的行为。
+"""
+import shutil
+
+import pytest
+
+from src.core import blockchain as blockchain_module
+from src.core.block import Block
+from src.core.blockchain import Blockchain
+from src.core.transaction import Transaction
+from src.utils.crypto import Wallet
+
+
+def _open(storage_type: str, path: str) -> Blockchain:
+    return Blockchain(difficulty=2, storage_config={'type': storage_type, 'path': path}, mining_workers=1)
+
+
+@pytest.fixture(params=['sqlite', 'leveldb'])
+def nodes(request, tmp_path):
+    """返回(付款钱包, 节点A, 节点B)，两个节点从同一份存储复制而来"""
+    storage_type = request.param
+    if storage_type == 'leveldb':
+        pytest.importorskip('plyvel')
+
+    sender = Wallet()
+    path_a, path_b = str(tmp_path / 'a'), str(tmp_path / 'b')
+    seed = _open(storage_type, path_a)
+    seed.storage_manager.store_balances({sender.address: 100.0})
+    seed.storage_manager.close()
+    if storage_type == 'sqlite':
+        shutil.copy(path_a + '.db', path_b + '.db')
+    else:
+        shutil.copytree(path_a, path_b)
+
+    node_a, node_b = _open(storage_type, path_a), _open(storage_type, path_b)
+    yield sender, node_a, node_b
+    node_a.storage_manager.close()
+    node_b.storage_manager.close()
+
+
+def _mine_transfer(chain: Blockchain, sender: Wallet, receiver: str, amount: float, miner: str) -> None:
+    transaction = Transaction(sender.address, receiver, amount, fee=1.0)
+    transaction.sign_transaction(sender.private_key)
+    assert chain.add_transaction(transaction)
+    assert chain.mine_pending_transactions(miner) is not None
+
+
+def _balances(chain: Blockchain, addresses):
+    """内存中的余额和存储中的余额"""
+    return ({address: chain.get_balance(address) for address in addresses},
+            {address: chain.storage_manager.get_balance(address) for address in addresses})
+
+
+def test_append_blocks(nodes):
+    sender, node_a, node_b = nodes
+    receiver, miner = Wallet().address, Wallet().address
+    for amount in (10.0, 20.0):
+        _mine_transfer(node_a, sender, receiver, amount, miner)
+
+    assert node_b.append_blocks(node_a.chain[1:])
+
+    addresses = (sender.address, receiver, miner)
+    assert node_b.get_latest_block().hash == node_a.get_latest_block().hash
+    assert _balances(node_b, addresses) == _balances(node_a, addresses)
+    assert node_b.get_balance(sender.address) == 100.0 - 32.0
+
+
+def test_reorganize_to_longer_fork(nodes):
+    sender, node_a, node_b = nodes
+    receiver, miner_a, miner_b = Wallet().address, Wallet().address, Wallet().address
+    _mine_transfer(node_b, sender, receiver, 5.0, miner_b)
+    for _ in range(3):
+        _mine_transfer(node_a, sender, receiver, 10.0, miner_a)
+
+    # 不比本地链长的链不切换
+    assert not node_b.reorganize(node_a.chain[:2])
+    assert node_b.reorganize(node_a.chain)
+
+    addresses = (sender.address, receiver, miner_a, miner_b)
+    assert node_b.get_latest_block().hash == node_a.get_latest_block().hash
+    assert _balances(node_b, addresses) == _balances(node_a, addresses)
+    # 被替换的分叉区块带来的余额变动已撤销
+    assert node_b.get_balance(miner_b) == 0.0
+    assert node_b.storage_manager.get_balance(miner_b) == 0.0
+
+
+class LegacyBlock(Block):
+    """手续费记账之前的区块：没有miner_address"""
+
+    def __init__(self, *args, miner_address: str = "", **kwargs):
+        super().__init__(*args, **kwargs)
+
+
+def test_reorganize_past_legacy_block(nodes, monkeypatch):
+    sender, node_a, node_b = nodes
+    receiver, miner_a, miner_b = Wallet().address, Wallet().address, Wallet().address
+
+    # 节点B上的区块按旧的记账方式挖出：只扣除金额，手续费不扣也不归矿工
+    monkeypatch.setattr(blockchain_module, 'Block', LegacyBlock)
+    _mine_transfer(node_b, sender, receiver, 5.0, miner_b)
+    monkeypatch.undo()
+    assert not node_b.get_latest_block().charges_fees
+    assert node_b.get_balance(sender.address) == 95.0
+
+    for _ in range(3):
+        _mine_transfer(node_a, sender, receiver, 10.0, miner_a)
+    assert node_b.reorganize(node_a.chain)
+
+    # 回滚旧区块只退还金额，不会凭空退还未扣除的手续费
+    addresses = (sender.address, receiver, miner_a, miner_b)
+    assert _balances(node_b, addresses) == _balances(node_a, addresses)
+    assert node_b.get_balance(sender.address) == 100.0 - 33.0
+    assert node_b.get_balance(miner_b) == 0.0
+
+
+def test_failed_block_write_rolls_back(nodes, monkeypatch):
+    sender, node_a, node_b = nodes
+    receiver, miner = Wallet().address, Wallet().address
+    for amount in (10.0, 20.0):
+        _mine_transfer(node_a, sender, receiver, amount, miner)
+
+    addresses = (sender.address, receiver, miner)
+    before = _balances(node_b, addresses)
+
+    # 第二个区块写入失败
+    store_block = node_b.storage_manager.store_block
+    calls = []
+
+    def flaky_store_block(block):
+        calls.append(block.index)
+        return len(calls) < 2 and store_block(block)
+
+    monkeypatch.setattr(node_b.storage_manager, 'store_block', flaky_store_block)
+    assert not node_b.append_blocks(node_a.chain[1:])
+
+    # 第一个区块也没有落盘，余额不变
+    assert node_b.storage_manager.get_latest_block_height() == 0
+    assert node_b.storage_manager.get_block_by_hash(node_a.chain[1].hash) is None
+    assert _balances(node_b, addresses) == before
+
+    monkeypatch.undo()
+    assert node_b.append_blocks(node_a.chain[1:])
+    assert _balances(node_b, addresses) == _balances(node_a, addresses)
+
+
+def test_missing_height_is_retried(nodes, monkeypatch):
+    sender, node_a, node_b = nodes
+    receiver, miner = Wallet().address, Wallet().address
+    for amount in (10.0, 20.0):
+        _mine_transfer(node_a, sender, receiver, amount, miner)
+
+    # 某个高度一次读取失败时缓存停在该高度之前，不跳过
+    get_block_by_height = node_a.storage_manager.get_block_by_height
+    node_a._invalidate_chain_cache()
+    monkeypatch.setattr(node_a.storage_manager, 'get_block_by_height',
+                        lambda height: None if height == 1 else get_block_by_height(height))
+    assert [block.index for block in node_a.chain] == [0]
+
+    monkeypatch.undo()
+    assert [block.index for block in node_a.chain] == [0, 1, 2]
+    assert node_a.is_chain_valid()
+
+
+def test_failed_state_save_restores_balances(nodes, monkeypatch):
+    sender, node_a, node_b = nodes
+    receiver, miner = Wallet().address, Wallet().address
+    _mine_transfer(node_a, sender, receiver, 10.0, miner)
+
+    addresses = (sender.address, receiver, miner)
+    before = _balances(node_b, addresses)
+    in_memory = dict(node_b.balances)
+
+    # 余额已应用到内存后保存状态时抛出异常
+    def broken_save():
+        raise RuntimeError("磁盘已满")
+
+    monkeypatch.setattr(node_b, '_save_to_storage', broken_save)
+    assert not node_b.append_blocks(node_a.chain[1:])
+
+    assert dict(node_b.balances) == in_memory
+    assert node_b.storage_manager.get_latest_block_height() == 0
+    assert _balances(node_b, addresses) == before
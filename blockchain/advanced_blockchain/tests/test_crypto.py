@@ -0,0 +1,140 @@
+"""
+签名验证测试
+
+libsecp256k1（coincurve）和ecdsa两种验证后端结果一致，low-S规范化、验证结果缓存和并行批量验证。
+"""
+import os
+
+import pytest
+
+from src.utils import crypto
+from src.utils.crypto import CryptoUtils, Wallet, SECP256K1_ORDER, PARALLEL_VERIFY_MIN
+
+DATA = "sender->receiver:10.0"
+
+
+@pytest.fixture(autouse=True)
+def clear_verify_cache():
+    crypto._verify_signature_cached.cache_clear()
+    yield
+    crypto._verify_signature_cached.cache_clear()
+
+
+@pytest.fixture(params=['coincurve', 'ecdsa'])
+def backend(request, monkeypatch):
+    """切换签名验证后端"""
+    if request.param == 'coincurve':
+        pytest.importorskip('coincurve')
+    else:
+        monkeypatch.setattr(crypto, 'COINCURVE_AVAILABLE', False)
+    return request.param
+
+
+@pytest.fixture(scope='module')
+def wallet():
+    return Wallet()
+
+
+def _flip_byte(signature_hex: str, position: int) -> str:
+    signature = bytearray.fromhex(signature_hex)
+    signature[position] ^= 0x01
+    return signature.hex()
+
+
+def _high_s(signature_hex: str) -> str:
+    """返回等价的另一种签名(r, n-s)中s较大的那个"""
+    signature = bytes.fromhex(signature_hex)
+    r = signature[:32]
+    s = int.from_bytes(signature[32:], 'big')
+    s = max(s, SECP256K1_ORDER - s)
+    return (r + s.to_bytes(32, 'big')).hex()
+
+
+def test_valid_signature(backend, wallet):
+    signature = CryptoUtils.sign_data(DATA, wallet.private_key)
+    assert CryptoUtils.verify_signature(DATA, signature, wallet.public_key)
+    assert CryptoUtils.verify_signature(DATA.encode('utf-8'), signature, wallet.public_key)
+
+
+def test_tampered_signature(backend, wallet):
+    signature = CryptoUtils.sign_data(DATA, wallet.private_key)
+    assert not CryptoUtils.verify_signature(DATA, _flip_byte(signature, 40), wallet.public_key)
+    assert not CryptoUtils.verify_signature(DATA, signature[:-2], wallet.public_key)
+
+
+def test_tampered_data(backend, wallet):
+    signature = CryptoUtils.sign_data(DATA, wallet.private_key)
+    assert not CryptoUtils.verify_signature(DATA + "0", signature, wallet.public_key)
+
+
+def test_wrong_public_key(backend, wallet):
+    signature = CryptoUtils.sign_data(DATA, wallet.private_key)
+    assert not CryptoUtils.verify_signature(DATA, signature, Wallet().public_key)
+
+
+def test_high_s_signature(backend, wallet):
+    # ecdsa生成的签名不保证low-S，两种形式都应通过验证
+    signature = CryptoUtils.sign_data(DATA, wallet.private_key)
+    assert CryptoUtils.verify_signature(DATA, _high_s(signature), wallet.public_key)
+
+
+def test_backends_agree(wallet, monkeypatch):
+    pytest.importorskip('coincurve')
+    signature = CryptoUtils.sign_data(DATA, wallet.private_key)
+    cases = [
+        (DATA, signature),
+        (DATA, _high_s(signature)),
+        (DATA, _flip_byte(signature, 0)),
+        (DATA + "0", signature),
+    ]
+    with_secp256k1 = [CryptoUtils._verify_signature_uncached(data.encode('utf-8'), sig, wallet.public_key)
+                      for data, sig in cases]
+    monkeypatch.setattr(crypto, 'COINCURVE_AVAILABLE', False)
+    with_ecdsa = [CryptoUtils._verify_signature_uncached(data.encode('utf-8'), sig, wallet.public_key)
+                  for data, sig in cases]
+    assert with_secp256k1 == with_ecdsa == [True, True, False, False]
+
+
+def test_repeated_verification_hits_cache(backend, wallet, monkeypatch):
+    signature = CryptoUtils.sign_data(DATA, wallet.private_key)
+    calls = []
+    uncached = CryptoUtils._verify_signature_uncached
+
+    def counting(*args):
+        calls.append(args)
+        return uncached(*args)
+
+    monkeypatch.setattr(CryptoUtils, '_verify_signature_uncached', staticmethod(counting))
+    assert CryptoUtils.verify_signature(DATA, signature, wallet.public_key)
+    assert CryptoUtils.verify_signature(DATA, signature, wallet.public_key)
+    assert len(calls) == 1
+    assert crypto._verify_signature_cached.cache_info().hits == 1
+
+    # 数据不同时不命中缓存
+    assert not CryptoUtils.verify_signature(DATA + "0", signature, wallet.public_key)
+    assert len(calls) == 2
+
+
+def test_parallel_batch_verification(wallet, monkeypatch):
+    pytest.importorskip('coincurve')
+    # 按多核计算线程数，单核机器上也走并行分块路径
+    monkeypatch.setattr(os, 'cpu_count', lambda: 4)
+    count = PARALLEL_VERIFY_MIN + 44
+    assert crypto._parallel_workers(count) > 1
+
+    items = []
+    for i in range(count):
+        data = f"{DATA}:{i}"
+        items.append((data, CryptoUtils.sign_data(data, wallet.private_key), wallet.public_key))
+    assert CryptoUtils.verify_signatures_batch(items) == [True] * count
+    assert CryptoUtils.verify_batch(items)
+
+    # 中间一条签名被篡改：只有该条失败，结果顺序与输入一致
+    crypto._verify_signature_cached.cache_clear()
+    tampered = list(items)
+    data, signature, public_key = tampered[150]
+    tampered[150] = (data, _flip_byte(signature, 40), public_key)
+    results = CryptoUtils.verify_signatures_batch(tampered)
+    assert results[150] is False
+    assert results.count(False) == 1
+    assert not CryptoUtils.verify_batch(tampered)
@@ -0,0 +1,218 @@
+"""
+LevelDB存储测试
+
+区块哈希、交易位置和余额记录的定长二进制编码，以及对旧的十六进制文本、映射和十进制字符串记录的兼容；二进制帧备份的分批恢复和截断、损坏的备份文件。
+"""
+import struct
+
+import pytest
+
+pytest.importorskip('plyvel')
+
+from src.storage import leveldb_storage
+from src.storage.leveldb_storage import (
+    LevelDBStorage, BALANCE_SIZE, TX_LOCATION_FORMAT, TX_LOCATION_SIZE,
+    encode_hash, decode_hash, encode_balance, decode_balance,
+)
+from src.utils.serialization import FRAME_HEADER, json_dumps, pack
+
+BLOCK_HASH = '00ab' + 'cd' * 30
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = LevelDBStorage(str(tmp_path / 'db'))
+    yield storage
+    storage.close()
+
+
+@pytest.fixture
+def restored(tmp_path):
+    storage = LevelDBStorage(str(tmp_path / 'restored'))
+    yield storage
+    storage.close()
+
+
+def test_hash_round_trip(storage):
+    encoded = encode_hash(BLOCK_HASH)
+    assert encoded == bytes.fromhex(BLOCK_HASH) and len(encoded) == 32
+    assert decode_hash(encoded) == BLOCK_HASH
+
+    assert storage.store_block_index(7, BLOCK_HASH)
+    assert storage._get_b(b'height:0000000007') == encoded
+    assert storage.get_block_hash_by_height(7) == BLOCK_HASH
+    assert storage.get_latest_block_index() == (7, BLOCK_HASH)
+
+
+@pytest.mark.parametrize('block_hash', ['genesis', 'g' * 64])
+def test_non_hex_hash(storage, block_hash):
+    # 不是64位十六进制的哈希按UTF-8原样保存
+    assert encode_hash(block_hash) == block_hash.encode('utf-8')
+    assert decode_hash(encode_hash(block_hash)) == block_hash
+
+    storage.store_block_index(1, block_hash)
+    assert storage.get_block_hash_by_height(1) == block_hash
+
+
+def test_legacy_hex_hash(storage):
+    # 旧版本把哈希写为64位十六进制文本
+    storage._put_b(b'height:0000000003', BLOCK_HASH.encode('utf-8'))
+    assert storage.get_block_hash_by_height(3) == BLOCK_HASH
+    assert storage.get_latest_block_index() == (3, BLOCK_HASH)
+
+
+@pytest.mark.parametrize('tx_index', [0, 5, 2 ** 32 - 1])
+def test_tx_location_round_trip(storage, tx_index):
+    assert storage.store_transaction_index('tx1', BLOCK_HASH, tx_index)
+    raw = storage._get_b(b'tx:tx1')
+    assert len(raw) == TX_LOCATION_SIZE
+    assert raw == struct.pack(TX_LOCATION_FORMAT, bytes.fromhex(BLOCK_HASH), tx_index)
+    assert storage.get_transaction_location('tx1') == (BLOCK_HASH, tx_index)
+
+
+@pytest.mark.parametrize('block_hash', ['genesis', 'x' * 13])
+def test_tx_location_non_hex_hash(storage, block_hash):
+    # 13字符哈希的映射记录恰为36字节，按映射前缀而不是长度区分
+    assert storage.store_transaction_index('tx1', block_hash, 2)
+    assert storage.get_transaction_location('tx1') == (block_hash, 2)
+
+
+@pytest.mark.parametrize('encode', [pack, json_dumps], ids=['msgpack', 'json'])
+def test_legacy_tx_location(storage, encode):
+    # 旧版本把交易位置写为带64位十六进制哈希的映射
+    storage._put_b(b'tx:tx1', encode({'block_hash': BLOCK_HASH, 'tx_index': 4}))
+    assert storage.get_transaction_location('tx1') == (BLOCK_HASH, 4)
+
+
+def test_missing_locations(storage):
+    assert storage.get_block_hash_by_height(99) is None
+    assert storage.get_transaction_location('nope') is None
+
+
+@pytest.mark.parametrize('balance', [0.0, 100.0, 0.1 + 0.2, -3.5, 1e-9, 123456789.123456789])
+def test_balance_round_trip(storage, balance):
+    encoded = encode_balance(balance)
+    assert len(encoded) == BALANCE_SIZE and encoded[0] == 0
+    assert decode_balance(encoded) == balance
+
+    assert storage.store_account_balance('alice', balance)
+    assert storage.get_account_balance('alice') == balance
+    assert dict(storage.iter_account_balances()) == {'alice': balance}
+
+
+@pytest.mark.parametrize('raw, balance', [
+    (b'100.0', 100.0),
+    (b'0.30000000000000004', 0.1 + 0.2),
+    (b'-3.5', -3.5),
+    (b'123456789', 123456789.0),  # 长度恰为9字节时也不会误判为二进制记录
+    (b'1e-09', 1e-9),
+])
+def test_legacy_balance_string(storage, raw, balance):
+    assert decode_balance(raw) == balance
+
+    # 旧版本写入的十进制字符串记录
+    storage._put_b(b'balance:alice', raw)
+    assert storage.get_account_balance('alice') == balance
+    assert dict(storage.iter_account_balances()) == {'alice': balance}
+
+    # 重新写入后为二进制记录
+    storage.store_account_balance('alice', balance)
+    assert storage._get_b(b'balance:alice') == encode_balance(balance)
+    assert storage.get_account_balance('alice') == balance
+
+
+def test_missing_balance(storage):
+    assert storage.get_account_balance('nobody') is None
+
+
+def _fill(storage, count):
+    for i in range(count):
+        storage.store_block_index(i, '%064x' % i)
+        storage.store_account_balance('addr%d' % i, i + 0.5)
+        storage.put('data:%d' % i, bytes([i % 256]) * (i % 7))
+
+
+def _contents(storage):
+    return list(storage.db.iterator())
+
+
+@pytest.mark.parametrize('suffix', ['', '.gz'])
+def test_backup_restore_round_trip(storage, restored, tmp_path, suffix):
+    _fill(storage, 20)
+    path = str(tmp_path / ('backup.bin' + suffix))
+    assert storage.backup_to_file(path)
+    assert restored.restore_from_file(path)
+    assert _contents(restored) == _contents(storage)
+    assert restored.get_block_hash_by_height(19) == '%064x' % 19
+    assert restored.get_account_balance('addr3') == 3.5
+
+
+def test_restore_spans_several_batches(storage, restored, tmp_path, monkeypatch):
+    # 记录数不是批大小的整数倍：两个整批加最后一个不满的批
+    monkeypatch.setattr(leveldb_storage, 'RESTORE_BATCH_SIZE', 7)
+    _fill(storage, 6)
+    assert len(_contents(storage)) == 18
+
+    batches = []
+    write_batch = restored.db.write_batch
+
+    class CountingDB:
+        def write_batch(self, **kwargs):
+            batches.append(kwargs)
+            return write_batch(**kwargs)
+
+    path = str(tmp_path / 'backup.bin')
+    assert storage.backup_to_file(path)
+    monkeypatch.setattr(restored, 'db', CountingDB())
+    assert restored.restore_from_file(path)
+    monkeypatch.undo()
+
+    # 3个数据批次，最后一个sync批次负责落盘
+    assert batches == [{}, {}, {}, {'sync': True}]
+    assert _contents(restored) == _contents(storage)
+
+
+def test_restore_legacy_json_backup(restored, tmp_path):
+    path = tmp_path / 'backup.json'
+    path.write_bytes(json_dumps({
+        'height:0000000000': BLOCK_HASH,
+        'balance:alice': '12.5',
+        'block:' + BLOCK_HASH: 'AAEC',
+    }))
+    assert restored.restore_from_file(str(path))
+    assert restored.get_block_hash_by_height(0) == BLOCK_HASH
+    assert restored.get_account_balance('alice') == 12.5
+    assert restored.get_block(BLOCK_HASH) == bytes([0, 1, 2])
+
+
+def _damaged_backups(data):
+    """返回(名称, 内容)：最后一帧分别在帧头、键、值中间截断，以及帧头长度字段损坏"""
+    last_frame = data.rindex(FRAME_HEADER.pack(len(b'height:0000000002'), 32) + b'height:0000000002')
+    yield 'header', data[:last_frame + 3]
+    yield 'key', data[:last_frame + FRAME_HEADER.size + 5]
+    yield 'value', data[:-1]
+    corrupt = bytearray(data)
+    corrupt[last_frame:last_frame + FRAME_HEADER.size] = FRAME_HEADER.pack(0xFFFF, 0xFFFFFF)
+    yield 'length', bytes(corrupt)
+
+
+def test_restore_damaged_backup(storage, tmp_path):
+    storage.store_block_index(0, BLOCK_HASH)
+    storage.store_block_index(1, BLOCK_HASH)
+    storage.store_block_index(2, BLOCK_HASH)
+    path = tmp_path / 'backup.bin'
+    assert storage.backup_to_file(str(path))
+    data = path.read_bytes()
+
+    for name, damaged in _damaged_backups(data):
+        target = LevelDBStorage(str(tmp_path / ('restored-' + name)))
+        try:
+            path.write_bytes(damaged)
+            assert not target.restore_from_file(str(path)), name
+            # 损坏帧之前的记录未超过一个批次，不会写入
+            assert _contents(target) == [], name
+            # 恢复失败后数据库仍可用
+            assert target.store_block_index(5, BLOCK_HASH)
+            assert target.get_block_hash_by_height(5) == BLOCK_HASH
+        finally:
+            target.close()